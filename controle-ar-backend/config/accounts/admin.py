@@ -2,4 +2,9 @@ from django.contrib import admin
 from .models import User
 # Register your models here.
 
-admin.site.register(User)
\ No newline at end of file
+
+@admin.register(User)
+class UserAdmin(admin.ModelAdmin):
+    # Usado pelo autocomplete do dono no admin de dispositivos
+    search_fields = ('email', 'full_name')
+    ordering = ('email',)
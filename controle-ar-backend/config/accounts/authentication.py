@@ -0,0 +1,97 @@
+"""
+Autenticação JWT com cache do usuário.
+
+O JWTAuthentication padrão faz um SELECT em User a cada requisição. Aqui
+guardamos um retrato mínimo do usuário (id, is_active, is_verified) no
+cache compartilhado (Redis, AUTH_USER_CACHE_SHARED). O usuário devolvido
+tem os demais campos adiados: só vão ao banco se alguma view realmente
+usá-los.
+
+As entradas caem quando o usuário é salvo ou apagado (accounts/signals.py).
+Não há camada local por processo: desativar o usuário ou trocar a senha
+vale já na próxima requisição, em qualquer worker. Sem cache compartilhado
+o retrato não é guardado e cada requisição consulta o banco. Alterações
+feitas com queryset.update() não disparam sinais; nesse caso o TTL limita
+por quanto tempo o retrato antigo continua valendo.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+SNAPSHOT_FIELDS = ('id', 'is_active', 'is_verified')
+
+USER_CACHE_TTL = getattr(settings, 'AUTH_USER_CACHE_TTL', 30)
+USER_CACHE_SHARED = getattr(settings, 'AUTH_USER_CACHE_SHARED', False)
+
+
+def shared_key(user_id):
+    return f"auth_user:{user_id}"
+
+
+class UserCache:
+    """
+    Retratos no cache compartilhado, com TTL. Guarda tuplas, não instâncias.
+    As chaves são sempre str: o claim do token traz o id como texto.
+    """
+
+    def __init__(self, ttl=USER_CACHE_TTL, shared=USER_CACHE_SHARED):
+        self.ttl = ttl
+        self.shared = shared
+
+    def get(self, user_id):
+        if not self.shared:
+            return None
+        values = cache.get(shared_key(str(user_id)))
+        return tuple(values) if values is not None else None
+
+    def set(self, user_id, values):
+        if self.shared:
+            cache.set(shared_key(str(user_id)), values, self.ttl)
+
+    def invalidate(self, user_id):
+        if self.shared:
+            cache.delete(shared_key(str(user_id)))
+
+
+user_cache = UserCache()
+
+
+def _snapshot(user):
+    return tuple(getattr(user, field) for field in SNAPSHOT_FIELDS)
+
+
+def _from_snapshot(values):
+    # from_db espera os valores na ordem dos campos do modelo e marca os
+    # ausentes como adiados (carregados sob demanda)
+    model = get_user_model()
+    by_name = dict(zip(SNAPSHOT_FIELDS, values))
+    names = [f.attname for f in model._meta.concrete_fields if f.attname in by_name]
+    return model.from_db(DEFAULT_DB_ALIAS, names, [by_name[name] for name in names])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        values = user_cache.get(user_id)
+        if values is None:
+            # Caminho normal: busca no banco e valida (inativo, revogado etc.)
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, _snapshot(user))
+            return user
+
+        user = _from_snapshot(values)
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # O hash da senha não está no retrato; deixa o caminho padrão validar
+            return super().get_user(validated_token)
+        return user
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from accounts.tokens import prune_expired, PRUNE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove em lotes os tokens JWT vencidos (OutstandingToken e BlacklistedToken). "
+        "Pode rodar com frequência pelo cron: cada lote é uma transação curta."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PRUNE_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0.0, help="Pausa (s) entre os lotes")
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Limite de lotes por execução (o restante fica para a próxima)")
+
+    def handle(self, *args, **options):
+        outstanding, blacklisted = prune_expired(
+            batch_size=options['batch_size'], pause=options['pause'], max_batches=options['max_batches']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"🧹 {outstanding} tokens vencidos removidos ({blacklisted} da blacklist)"
+        ))
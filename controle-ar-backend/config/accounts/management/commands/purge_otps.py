@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from accounts.utils import purge_expired_otps, OTP_PURGE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Remove em lotes os códigos de verificação (OTP) expirados."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OTP_PURGE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        removed = purge_expired_otps(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"🧹 {removed} códigos de verificação expirados removidos"))
@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from accounts.outbox import flush, pending_count
+
+
+class Command(BaseCommand):
+    help = "Envia os e-mails da fila de saída (processo contínuo, ou uma vez com --once)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Esvazia a fila uma vez e sai")
+        parser.add_argument('--interval', type=float, default=getattr(settings, 'EMAIL_OUTBOX_INTERVAL', 5))
+
+    def handle(self, *args, **options):
+        if options['once']:
+            total = 0
+            while True:
+                sent = flush()
+                total += sent
+                if not sent:
+                    break
+            self.stdout.write(self.style.SUCCESS(f"📧 {total} e-mails enviados, {pending_count()} pendentes"))
+            return
+
+        self.stdout.write(f"📧 Fila de e-mails iniciada ({pending_count()} pendentes)")
+        try:
+            while True:
+                close_old_connections()
+                # Lote cheio: provavelmente há mais na fila, não espera
+                if flush() < getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50):
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("\nDesligando a fila de e-mails...")
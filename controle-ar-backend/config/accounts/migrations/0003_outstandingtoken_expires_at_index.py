@@ -0,0 +1,28 @@
+from django.db import migrations
+
+INDEX_NAME = 'accounts_outstandingtoken_expires_idx'
+TABLE = 'token_blacklist_outstandingtoken'
+
+
+def create_index(apps, schema_editor):
+    # A tabela é do simplejwt; o índice em expires_at atende à limpeza em lotes.
+    # No Postgres é criado CONCURRENTLY para não travar os /refresh/ em produção.
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(f'CREATE INDEX {concurrently}IF NOT EXISTS {INDEX_NAME} ON {TABLE} (expires_at)')
+
+
+def drop_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0002_onetimepassord'),
+        ('token_blacklist', '0013_alter_blacklistedtoken_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
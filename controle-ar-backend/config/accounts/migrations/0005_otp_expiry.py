@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:08
+
+import accounts.models
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='onetimepassord',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='onetimepassord',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True, default=accounts.models.default_otp_expiry),
+        ),
+        migrations.AlterField(
+            model_name='onetimepassord',
+            name='code',
+            field=models.CharField(max_length=6),
+        ),
+        migrations.AlterField(
+            model_name='onetimepassord',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='otps', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='onetimepassord',
+            index=models.Index(fields=['user', 'expires_at'], name='accounts_otp_user_exp_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_otp_expiry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='onetimepassord',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
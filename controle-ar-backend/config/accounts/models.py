@@ -1,7 +1,10 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from rest_framework_simplejwt.tokens import RefreshToken
 
 # 👇 Importa o gerenciador que você criou no outro arquivo
 from .managers import UserManager 
@@ -31,15 +34,66 @@ class User(AbstractBaseUser, PermissionsMixin):
         return f"{self.full_name}"
 
     def tokens(self):
+        # Import tardio: simplejwt.tokens puxa django.test (~30 ms) e o
+        # ouvinte MQTT, que também carrega este modelo, nunca emite tokens
+        from rest_framework_simplejwt.tokens import RefreshToken
         refresh = RefreshToken.for_user(self)
         return {
             'refresh': str(refresh),
             'access': str(refresh.access_token)
         }
     
+def default_otp_expiry():
+    return timezone.now() + timedelta(seconds=getattr(settings, 'OTP_TTL', 15 * 60))
+
+
 class OneTimePassord(models.Model):
-    user=models.OneToOneField(User, on_delete=models.CASCADE)
-    code=models.CharField(max_length=6, unique=True)
+    # Códigos valem por usuário (não são únicos na tabela) e expiram; a busca
+    # é sempre por (user, expires_at), então não depende do tamanho da tabela
+    user=models.ForeignKey(User, on_delete=models.CASCADE, related_name='otps')
+    code=models.CharField(max_length=6)
+    created_at=models.DateTimeField(default=timezone.now)
+    expires_at=models.DateTimeField(default=default_otp_expiry, db_index=True)
+    # Tentativas erradas: ao chegar em OTP_MAX_ATTEMPTS o código é apagado
+    attempts=models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'expires_at'], name='accounts_otp_user_exp_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.full_name}-passcode"
\ No newline at end of file
+        return f"{self.user.full_name}-passcode"
+
+
+class OutboundEmail(models.Model):
+    """E-mail na fila de saída, enviado em lotes pelo manage.py send_emails."""
+    STATUS_CHOICES = [
+        ('pending', 'Pendente'),
+        ('sent', 'Enviado'),
+        ('failed', 'Falhou'),
+    ]
+
+    to_email = models.EmailField(max_length=255)
+    from_email = models.CharField(max_length=255, blank=True, default='')
+    subject = models.CharField(max_length=255)
+    # Leva OTP/link de redefinição: é apagado depois do envio
+    body = models.TextField(blank=True, default='')
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.to_email}: {self.subject} ({self.status})"
+
+    class Meta:
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='accounts_email_due_idx'),
+        ]
+        verbose_name = "E-mail na fila"
+        verbose_name_plural = "E-mails na fila"
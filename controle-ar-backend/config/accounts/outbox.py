@@ -0,0 +1,140 @@
+"""
+Fila de saída (outbox) de e-mails.
+
+Cadastro e redefinição de senha só enfileiram a mensagem e respondem na hora;
+o ouvinte MQTT líder (core/listener.py, separado ou embutido) envia em lotes
+numa única conexão SMTP reaproveitada, com backoff exponencial quando o
+servidor falha. O manage.py send_emails faz o mesmo como processo à parte. Assim a latência da API não
+depende do SMTP e uma instabilidade dele não vira erro 500.
+Cada lote é reservado (claim) antes de abrir a conexão SMTP, então workers
+simultâneos não enviam o mesmo código duas vezes.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from core import metrics
+
+from .models import OutboundEmail
+
+MAX_ATTEMPTS = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 8)
+FLUSH_BATCH_SIZE = getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50)
+# Tempo que um lote fica reservado para o worker que o pegou; se ele morrer
+# no meio do envio, os e-mails voltam para a fila depois disso
+CLAIM_SECONDS = getattr(settings, 'EMAIL_OUTBOX_CLAIM_SECONDS', 300)
+
+email_outbox_depth = metrics.gauge('email_outbox_pending', 'E-mails pendentes na fila de saída')
+email_sent_total = metrics.counter('email_outbox_sent_total', 'E-mails da fila enviados', ('result',))
+
+
+@metrics.collector
+def _collect_depth():
+    email_outbox_depth.set(pending_count())
+
+
+def pending_count():
+    return OutboundEmail.objects.filter(status='pending').count()
+
+
+def _backoff(attempts):
+    return timedelta(seconds=min(30 * 2 ** (attempts - 1), 3600))
+
+
+def queue_email(subject, body, to_email, from_email=None):
+    return OutboundEmail.objects.create(
+        to_email=to_email,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        subject=subject,
+        body=body,
+    )
+
+
+def _mark_failed(email, now, error):
+    email.attempts += 1
+    email.next_attempt_at = now + _backoff(email.attempts)
+    email.last_error = str(error)[:255]
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = 'failed'
+    email_sent_total.inc(result='error')
+
+
+def claim(limit, now):
+    """
+    Reserva até `limit` e-mails vencidos para este worker, empurrando o
+    next_attempt_at para o fim da reserva. O UPDATE só pega linhas ainda
+    vencidas, então dois workers (ou um flush sobreposto) nunca recebem o
+    mesmo e-mail; no PostgreSQL o skip_locked ainda os faz pegar lotes diferentes.
+    """
+    # Valor único por chamada: identifica as linhas reservadas por esta chamada
+    until = now + timedelta(seconds=CLAIM_SECONDS, microseconds=random.randrange(1_000_000))
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('pk', flat=True)[:limit]
+        )
+        OutboundEmail.objects.filter(
+            pk__in=ids, status='pending', next_attempt_at__lte=now
+        ).update(next_attempt_at=until)
+    return list(OutboundEmail.objects.filter(pk__in=ids, next_attempt_at=until).order_by('pk'))
+
+
+def flush(limit=FLUSH_BATCH_SIZE, connection=None):
+    """Envia os e-mails vencidos da fila numa só conexão. Retorna quantos foram enviados."""
+    now = timezone.now()
+    batch = claim(limit, now)
+    if not batch:
+        return 0
+
+    fields = ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at', 'body']
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        print(f"❌ Servidor SMTP indisponível: {e}")
+        for email in batch:
+            _mark_failed(email, now, e)
+        OutboundEmail.objects.bulk_update(batch, fields)
+        return 0
+
+    sent = 0
+    try:
+        for index, email in enumerate(batch):
+            message = EmailMessage(
+                subject=email.subject, body=email.body,
+                from_email=email.from_email or None, to=[email.to_email],
+                connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as e:
+                print(f"❌ Erro ao enviar e-mail para {email.to_email}: {e}")
+                _mark_failed(email, now, e)
+                # A conexão pode ter caído no meio do lote: reabre para as próximas
+                connection.close()
+                try:
+                    connection.open()
+                except Exception as reopen_error:
+                    for remaining in batch[index + 1:]:
+                        _mark_failed(remaining, now, reopen_error)
+                    break
+                continue
+            email.status = 'sent'
+            email.sent_at = timezone.now()
+            email.attempts += 1
+            email.body = ''
+            email_sent_total.inc(result='ok')
+            sent += 1
+    finally:
+        connection.close()
+        OutboundEmail.objects.bulk_update(batch, fields)
+
+    if sent:
+        print(f"📧 {sent} e-mails da fila enviados")
+    return sent
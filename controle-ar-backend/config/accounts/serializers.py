@@ -1,3 +1,4 @@
+import time
 from rest_framework import serializers
 from .models import User
 from django.contrib.auth import authenticate
@@ -10,6 +11,10 @@ from django.urls import reverse
 from .utils import send_normal_email
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken, Token
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .tokens import RotatingRefreshToken, rotate
+from .throttling import password_hash_seconds
 
 class UserRegisterSerializer(serializers.ModelSerializer):
     password=serializers.CharField(max_length=68, min_length=6, write_only=True)
@@ -49,7 +54,9 @@ class LoginSerializer(serializers.ModelSerializer):
         email=attrs.get('email')
         password=attrs.get('password')
         request=self.context.get('request')
+        start=time.monotonic()
         user=authenticate(request, email=email, password=password)
+        password_hash_seconds.observe(time.monotonic() - start)
         if not user:
             raise AuthenticationFailed("Credenciais Inválidas, tente novamente!")
         if not user.is_verified:
@@ -139,4 +146,26 @@ class LogoutUserSerializer(serializers.Serializer):
             token=RefreshToken(self.token)
             token.blacklist()
         except TokenError:
-            return self.fail('bad_token')
\ No newline at end of file
+            return self.fail('bad_token')
+
+
+class RotatingTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    /refresh/ com rotação em poucas consultas por índice (ver accounts/tokens.py).
+    Sem rotação + blacklist ativas, usa o comportamento padrão do simplejwt.
+    """
+
+    def validate(self, attrs):
+        if not (jwt_settings.ROTATE_REFRESH_TOKENS and jwt_settings.BLACKLIST_AFTER_ROTATION):
+            return super().validate(attrs)
+
+        refresh = RotatingRefreshToken(attrs['refresh'])
+        user_id = refresh.payload.get(jwt_settings.USER_ID_CLAIM)
+        if user_id:
+            user = User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}).first()
+            if user is None or not jwt_settings.USER_AUTHENTICATION_RULE(user):
+                raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        data = {'access': str(refresh.access_token)}
+        data['refresh'] = str(rotate(refresh, user_id))
+        return data
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Salvar (inclusive desativar) ou apagar o usuário derruba o retrato do cache de autenticação."""
+    # Import tardio, como em User.tokens(): accounts.authentication puxa o
+    # simplejwt, e o ouvinte/agendador carregam este app sem emitir tokens
+    from .authentication import user_cache
+    user_cache.invalidate(instance.pk)
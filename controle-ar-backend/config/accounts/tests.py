@@ -1,3 +1,293 @@
-from django.test import TestCase
+import contextlib
+import io
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from core.listener import Listener
+
+from .authentication import shared_key, user_cache
+from .models import OneTimePassord, OutboundEmail, User
+from . import outbox
+from .throttling import LoginEmailThrottle, LoginIPThrottle, TokenBucket
+from .tokens import prune_expired
+
+
+class TokenRotationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='dono@example.com', full_name='Dono', password='senha-123')
+
+    def test_rotated_refresh_token_is_blacklisted(self):
+        refresh = RefreshToken.for_user(self.user)
+        response = self.client.post('/api/auth/refresh/', {'refresh': str(refresh)}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['refresh'], str(refresh))
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=refresh['jti']).exists())
+        # O novo refresh já fica registrado para a próxima rotação
+        new_jti = RefreshToken(response.data['refresh'])['jti']
+        self.assertTrue(OutstandingToken.objects.filter(jti=new_jti).exists())
+
+        reused = self.client.post('/api/auth/refresh/', {'refresh': str(refresh)}, format='json')
+        self.assertEqual(reused.status_code, 401)
+
+
+class TokenPruneTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='dono@example.com', full_name='Dono', password='senha-123')
+
+    def outstanding(self, jti, expires_in):
+        now = timezone.now()
+        return OutstandingToken.objects.create(
+            user=self.user, jti=jti, token=jti, created_at=now, expires_at=now + expires_in
+        )
+
+    def test_prune_removes_only_expired_rows(self):
+        expired = [self.outstanding(f'vencido-{i}', timedelta(days=-1)) for i in range(3)]
+        valid = [self.outstanding(f'valido-{i}', timedelta(days=1)) for i in range(2)]
+        BlacklistedToken.objects.create(token=expired[0])
+        BlacklistedToken.objects.create(token=valid[0])
+
+        # Lotes de 2: o terceiro vencido sai no segundo lote
+        self.assertEqual(prune_expired(batch_size=2), (3, 1))
+
+        self.assertEqual(
+            set(OutstandingToken.objects.values_list('jti', flat=True)), {'valido-0', 'valido-1'}
+        )
+        self.assertEqual(list(BlacklistedToken.objects.values_list('token_id', flat=True)), [valid[0].pk])
+
+    def test_prune_respects_max_batches(self):
+        for i in range(3):
+            self.outstanding(f'vencido-{i}', timedelta(days=-1))
+
+        self.assertEqual(prune_expired(batch_size=2, max_batches=1), (2, 0))
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+
+
+class EmailOutboxTests(APITestCase):
+    def test_claimed_emails_are_not_sent_twice(self):
+        for i in range(3):
+            outbox.queue_email("Código", f"OTP {i}", f"user{i}@example.com")
+        now = timezone.now()
+
+        first = outbox.claim(limit=2, now=now)
+        # Um segundo worker (ou flush sobreposto) no mesmo instante só vê o que sobrou
+        second = outbox.claim(limit=10, now=now)
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual([email.to_email for email in second], ['user2@example.com'])
+        self.assertEqual(outbox.claim(limit=10, now=now), [])
+
+    def test_flush_sends_each_email_once(self):
+        outbox.queue_email("Código", "OTP 1", "user@example.com")
+
+        self.assertEqual(outbox.flush(), 1)
+        self.assertEqual(outbox.flush(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(OutboundEmail.objects.get().status, 'sent')
+
+    def test_send_emails_command_delivers_queue(self):
+        for i in range(3):
+            outbox.queue_email("Código de verificação", f"OTP {i}", f"user{i}@example.com")
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('send_emails', '--once', stdout=output)
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f"user{i}@example.com" for i in range(3)])
+        self.assertEqual(set(OutboundEmail.objects.values_list('status', flat=True)), {'sent'})
+        self.assertIn("3 e-mails enviados, 0 pendentes", output.getvalue())
+
+    def test_listener_leader_sends_queue(self):
+        outbox.queue_email("Redefinição de senha", "Link", "user@example.com")
+        stop = mock.Mock()
+        stop.wait.side_effect = [False, True]  # um ciclo e para
+
+        with mock.patch('core.listener.connections.close_all'), contextlib.redirect_stdout(io.StringIO()):
+            Listener(lock=mock.Mock())._email_loop(stop)
+
+        self.assertEqual([message.to for message in mail.outbox], [["user@example.com"]])
+
+    def test_claim_expires_after_worker_dies(self):
+        outbox.queue_email("Código", "OTP 1", "user@example.com")
+        now = timezone.now()
+        outbox.claim(limit=10, now=now)
+
+        later = now + timedelta(seconds=outbox.CLAIM_SECONDS + 1)
+        self.assertEqual(len(outbox.claim(limit=10, now=later)), 1)
+
+
+class VerifyEmailTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='dono@example.com', full_name='Dono', password='senha-123')
+        self.other = User.objects.create_user(email='outro@example.com', full_name='Outro', password='senha-123')
+        OneTimePassord.objects.create(user=self.user, code='123456')
+        OneTimePassord.objects.create(user=self.other, code='654321')
+
+    def verify(self, otp, email='dono@example.com'):
+        return self.client.post('/api/auth/verify-email/', {'email': email, 'otp': otp}, format='json')
+
+    def test_correct_code_verifies_and_is_consumed(self):
+        self.assertEqual(self.verify('123456').status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_verified)
+        self.assertFalse(OneTimePassord.objects.filter(user=self.user).exists())
+        self.assertEqual(self.verify('123456').status_code, 404)
+
+    def test_wrong_code_counts_an_attempt(self):
+        self.assertEqual(self.verify('000000').status_code, 404)
+        self.assertEqual(OneTimePassord.objects.get(user=self.user).attempts, 1)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_verified)
+
+    def test_code_only_valid_for_its_user(self):
+        # O código de outro usuário não serve, e o erro não gasta tentativas dele
+        self.assertEqual(self.verify('654321').status_code, 404)
+        self.assertEqual(OneTimePassord.objects.get(user=self.other).attempts, 0)
+        self.assertEqual(self.verify('654321', email='outro@example.com').status_code, 200)
+
+    def test_expired_code_is_rejected(self):
+        OneTimePassord.objects.filter(user=self.user).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.verify('123456').status_code, 404)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_verified)
+
+    @override_settings(OTP_MAX_ATTEMPTS=3)
+    def test_code_is_invalidated_after_max_attempts(self):
+        for _ in range(3):
+            self.assertEqual(self.verify('000000').status_code, 404)
+        self.assertFalse(OneTimePassord.objects.filter(user=self.user).exists())
+        # Nem o código certo vale mais: é preciso pedir outro
+        self.assertEqual(self.verify('123456').status_code, 404)
+
+
+class TokenBucketTests(APITestCase):
+    def test_refills_over_time(self):
+        bucket = TokenBucket(capacity=2, refill_per_second=0.5)
+
+        self.assertTrue(bucket.consume('chave', now=0)[0])
+        self.assertTrue(bucket.consume('chave', now=0)[0])
+        allowed, wait = bucket.consume('chave', now=0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 2)
+
+        self.assertFalse(bucket.consume('chave', now=1)[0])
+        self.assertTrue(bucket.consume('chave', now=3)[0])
+        # Nunca acumula mais que a capacidade
+        self.assertTrue(bucket.consume('outra', now=100)[0])
+        self.assertTrue(bucket.consume('outra', now=100)[0])
+        self.assertFalse(bucket.consume('outra', now=100)[0])
+
+    def test_evicts_least_recently_used_keys(self):
+        bucket = TokenBucket(capacity=1, refill_per_second=0.01, max_keys=2)
+        bucket.consume('a', now=0)
+        bucket.consume('b', now=0)
+        bucket.consume('c', now=0)
+
+        # 'a' saiu da memória e volta com o bucket cheio
+        self.assertTrue(bucket.consume('a', now=0)[0])
+        self.assertFalse(bucket.consume('c', now=0)[0])
+
+
+class LoginThrottleTests(APITestCase):
+    URL = '/api/auth/login/'
+
+    def setUp(self):
+        LoginIPThrottle.bucket.clear()
+        LoginEmailThrottle.bucket.clear()
+        self.addCleanup(LoginIPThrottle.bucket.clear)
+        self.addCleanup(LoginEmailThrottle.bucket.clear)
+        patcher = mock.patch('accounts.serializers.authenticate', return_value=None)
+        self.authenticate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self, email, ip, **headers):
+        return self.client.post(
+            self.URL, {'email': email, 'password': 'errada'}, format='json', REMOTE_ADDR=ip, **headers
+        )
+
+    def test_locks_out_ip_before_hashing(self):
+        burst = LoginIPThrottle.bucket.capacity
+        for i in range(burst):
+            self.assertNotEqual(self.login(f'user{i}@example.com', '10.0.0.1').status_code, 429)
+
+        response = self.login('outro@example.com', '10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.authenticate.call_count, burst)
+        # Outro IP continua liberado
+        self.assertNotEqual(self.login('outro@example.com', '10.0.0.2').status_code, 429)
+
+    def test_locks_out_email_across_ips(self):
+        burst = LoginEmailThrottle.bucket.capacity
+        for i in range(burst):
+            self.login('Alvo@Example.com', f'10.0.1.{i}')
+
+        self.assertEqual(self.login('alvo@example.com', '10.0.2.1').status_code, 429)
+        self.assertEqual(self.authenticate.call_count, burst)
+
+    def test_forwarded_for_header_does_not_pick_the_bucket(self):
+        burst = LoginIPThrottle.bucket.capacity
+        for i in range(burst):
+            self.login(f'user{i}@example.com', '10.0.0.1', HTTP_X_FORWARDED_FOR=f'198.51.100.{i}')
+
+        response = self.login('outro@example.com', '10.0.0.1', HTTP_X_FORWARDED_FOR='198.51.100.250')
+        self.assertEqual(response.status_code, 429)
+
+    def test_behind_proxy_clients_get_their_own_bucket(self):
+        # Atrás de um proxy o REMOTE_ADDR é sempre o dele: com NUM_PROXIES=1 o IP vem do X-Forwarded-For
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            burst = LoginIPThrottle.bucket.capacity
+            for i in range(burst):
+                self.login(f'user{i}@example.com', '10.0.0.1', HTTP_X_FORWARDED_FOR='198.51.100.1')
+
+            blocked = self.login('outro@example.com', '10.0.0.1', HTTP_X_FORWARDED_FOR='198.51.100.1')
+            self.assertEqual(blocked.status_code, 429)
+            other = self.login('outro@example.com', '10.0.0.1', HTTP_X_FORWARDED_FOR='198.51.100.2')
+            self.assertNotEqual(other.status_code, 429)
+
+
+class CachedAuthenticationTests(APITestCase):
+    URL = '/api/devices/'
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = mock.patch.object(user_cache, 'shared', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(email='dono@example.com', full_name='Dono', password='senha-123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_cached_user_skips_the_query(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 200)
+        self.assertIsNotNone(cache.get(shared_key(self.user.pk)))
+
+        with self.assertNumQueries(1):  # só a listagem dos aparelhos
+            self.assertEqual(self.client.get(self.URL).status_code, 200)
+
+    def test_deactivated_user_is_rejected_on_next_request(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 200)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get(self.URL).status_code, 401)
+
+    def test_deactivation_in_another_worker_is_seen(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 200)
+
+        # Outro processo desativa o usuário: a única coisa compartilhada é o banco e o cache
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        cache.delete(shared_key(self.user.pk))
+
+        self.assertEqual(self.client.get(self.URL).status_code, 401)
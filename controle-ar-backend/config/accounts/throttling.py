@@ -0,0 +1,148 @@
+"""
+Limite de tentativas de login (por IP e por e-mail) com token bucket.
+
+O authenticate() roda o PBKDF2 inteiro a cada tentativa; de propósito, isso
+custa CPU. Uma rajada de credential stuffing no /login/ ocuparia todos os
+workers. As classes abaixo são throttles do DRF, então rodam no initial()
+da view, antes do serializer, e a requisição acima do limite é recusada
+(429 com Retry-After) sem calcular nenhum hash.
+
+Por padrão o bucket fica na memória do processo (rápido, sem rede). Com
+LOGIN_THROTTLE_SHARED (ligado junto com REDIS_URL) o limite passa a valer
+para todos os workers, usando o cache compartilhado.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+from core import metrics
+
+MAX_TRACKED_KEYS = 50000
+
+throttled_total = metrics.counter(
+    'login_throttled_total', "Tentativas de login recusadas pelo limite", ('scope',)
+)
+password_hash_seconds = metrics.histogram(
+    'login_password_hash_seconds', "Tempo do authenticate() (hash da senha) no login"
+)
+
+
+class TokenBucket:
+    """
+    Bucket por chave: até `capacity` tentativas seguidas, repostas a
+    `refill_per_second`. Guarda no máximo `max_keys` chaves (LRU).
+    """
+
+    def __init__(self, capacity, refill_per_second, max_keys=MAX_TRACKED_KEYS):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, now=None):
+        """Gasta uma ficha. Retorna (permitido, segundos até a próxima ficha)."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        wait = 0 if allowed else (1 - tokens) / self.refill_per_second
+        return allowed, wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SharedBucket:
+    """
+    Versão no cache compartilhado: janela fixa de capacity/refill segundos
+    com contador atômico (incr). Aproxima o token bucket sem precisar de lock.
+    """
+
+    def __init__(self, capacity, refill_per_second, prefix):
+        self.capacity = capacity
+        self.window = max(int(capacity / refill_per_second), 1)
+        self.prefix = prefix
+
+    def consume(self, key, now=None):
+        now = time.time() if now is None else now
+        window_start = int(now // self.window) * self.window
+        cache_key = f"{self.prefix}:{key}:{window_start}"
+        if cache.add(cache_key, 1, self.window):
+            count = 1
+        else:
+            try:
+                count = cache.incr(cache_key)
+            except ValueError:
+                # A chave expirou entre o add e o incr
+                cache.add(cache_key, 1, self.window)
+                count = 1
+        wait = window_start + self.window - now
+        return count <= self.capacity, wait
+
+
+def _bucket(scope, capacity, per_minute):
+    refill = per_minute / 60
+    if getattr(settings, 'LOGIN_THROTTLE_SHARED', False):
+        return SharedBucket(capacity, refill, prefix=f"login_throttle:{scope}")
+    return TokenBucket(capacity, refill)
+
+
+class LoginThrottle(BaseThrottle):
+    scope = None
+    bucket = None
+
+    def get_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        key = self.get_key(request)
+        if not key:
+            return True
+        allowed, self._wait = self.bucket.consume(key)
+        if not allowed:
+            throttled_total.inc(scope=self.scope)
+            print(f"🚫 Login bloqueado pelo limite ({self.scope}): {key}")
+        return allowed
+
+    def wait(self):
+        return getattr(self, '_wait', None)
+
+
+class LoginIPThrottle(LoginThrottle):
+    scope = 'ip'
+    bucket = _bucket(
+        'ip',
+        getattr(settings, 'LOGIN_THROTTLE_IP_BURST', 10),
+        getattr(settings, 'LOGIN_THROTTLE_IP_PER_MINUTE', 10),
+    )
+
+    def get_key(self, request):
+        return self.get_ident(request)
+
+
+class LoginEmailThrottle(LoginThrottle):
+    scope = 'email'
+    bucket = _bucket(
+        'email',
+        getattr(settings, 'LOGIN_THROTTLE_EMAIL_BURST', 5),
+        getattr(settings, 'LOGIN_THROTTLE_EMAIL_PER_MINUTE', 5),
+    )
+
+    def get_key(self, request):
+        try:
+            email = request.data.get('email')
+        except Exception:
+            return None
+        return str(email).strip().lower() if email else None
@@ -0,0 +1,147 @@
+"""
+Manutenção das tabelas de tokens do simplejwt (OutstandingToken/BlacklistedToken).
+
+Com ROTATE_REFRESH_TOKENS + BLACKLIST_AFTER_ROTATION, cada /refresh/ insere
+uma linha em cada tabela e nada as remove. Aqui ficam:
+
+- rotate(): a rotação do refresh com poucas consultas, todas por índice
+  (jti único e token_id único). A inserção em BlacklistedToken é o próprio
+  teste: se falhar pela unicidade, o token já tinha sido usado.
+- prune_expired(): remoção incremental dos tokens vencidos, em lotes
+  pequenos e transações curtas (sem travar as tabelas por muito tempo).
+- a métrica jwt_token_table_rows com o tamanho das tabelas.
+"""
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from core import metrics
+
+PRUNE_BATCH_SIZE = getattr(settings, 'JWT_PRUNE_BATCH_SIZE', 1000)
+
+table_rows = metrics.gauge(
+    'jwt_token_table_rows', "Linhas nas tabelas de tokens do simplejwt", ('table',)
+)
+pruned_total = metrics.counter('jwt_tokens_pruned_total', "Tokens vencidos removidos")
+
+
+# ============================================================
+#  ROTAÇÃO
+# ============================================================
+class RotatingRefreshToken(RefreshToken):
+    """RefreshToken cuja checagem de blacklist acontece em rotate()."""
+
+    def check_blacklist(self):
+        pass
+
+
+def _outstanding_id(token, user_id):
+    jti = token[api_settings.JTI_CLAIM]
+    pk = OutstandingToken.objects.filter(jti=jti).values_list('pk', flat=True).first()
+    if pk is not None:
+        return pk
+    # Token emitido antes do app de blacklist estar ativo
+    outstanding, _created = OutstandingToken.objects.get_or_create(
+        jti=jti,
+        defaults={
+            "user_id": user_id,
+            "created_at": timezone.now(),
+            "token": str(token),
+            "expires_at": datetime_from_epoch(token["exp"]),
+        },
+    )
+    return outstanding.pk
+
+
+def rotate(token, user_id):
+    """
+    Coloca `token` na blacklist e o transforma num refresh novo (já registrado).
+    Levanta TokenError se o token já tiver sido usado/revogado.
+    """
+    outstanding_id = _outstanding_id(token, user_id)
+    try:
+        with transaction.atomic():
+            BlacklistedToken.objects.create(token_id=outstanding_id)
+    except IntegrityError:
+        raise TokenError(_("Token is blacklisted"))
+
+    token.set_jti()
+    token.set_exp()
+    token.set_iat()
+    OutstandingToken.objects.create(
+        user_id=user_id,
+        jti=token[api_settings.JTI_CLAIM],
+        token=str(token),
+        created_at=timezone.now(),
+        expires_at=datetime_from_epoch(token["exp"]),
+    )
+    return token
+
+
+# ============================================================
+#  LIMPEZA
+# ============================================================
+def prune_expired(batch_size=PRUNE_BATCH_SIZE, pause=0.0, max_batches=None, now=None):
+    """
+    Remove os tokens vencidos em lotes (cada lote na sua transação).
+    `pause` dá fôlego ao banco entre os lotes; `max_batches` limita o
+    trabalho de uma execução (o restante fica para a próxima).
+    Retorna (outstanding, blacklisted) removidos.
+    """
+    now = now or timezone.now()
+    removed_outstanding = removed_blacklisted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = list(
+            OutstandingToken.objects
+            .filter(expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            removed_blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+            removed_outstanding += OutstandingToken.objects.filter(pk__in=ids).delete()[0]
+        pruned_total.inc(len(ids))
+        batches += 1
+        if pause:
+            time.sleep(pause)
+    return removed_outstanding, removed_blacklisted
+
+
+# ============================================================
+#  MÉTRICAS
+# ============================================================
+def table_sizes():
+    tables = {
+        'outstanding': OutstandingToken._meta.db_table,
+        'blacklisted': BlacklistedToken._meta.db_table,
+    }
+    if connection.vendor == 'postgresql':
+        # Estimativa do planner: não varre a tabela como um COUNT(*)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relname, reltuples::bigint FROM pg_class WHERE relname IN %s",
+                [tuple(tables.values())],
+            )
+            estimates = dict(cursor.fetchall())
+        return {name: max(estimates.get(table, 0), 0) for name, table in tables.items()}
+    return {
+        'outstanding': OutstandingToken.objects.count(),
+        'blacklisted': BlacklistedToken.objects.count(),
+    }
+
+
+@metrics.collector
+def _collect_table_sizes():
+    for name, rows in table_sizes().items():
+        table_rows.set(rows, table=name)
@@ -1,13 +1,55 @@
-import random
-from django.core.mail import EmailMessage
+import hmac
+import secrets
+from django.db.models import F
+from django.utils import timezone
 from .models import User, OneTimePassord
+from .outbox import queue_email
 from django.conf import settings
 
+OTP_PURGE_BATCH_SIZE = 1000
+
 def generateOtp():
-    otp=""
-    for i in range(6):
-        otp += str(random.randint(1,9))
-    return otp
+    # 6 dígitos (000000-999999) de uma fonte criptográfica; não precisa ser
+    # único na tabela porque o código vale só para o próprio usuário
+    return f"{secrets.randbelow(10 ** 6):06d}"
+
+def verify_otp(user, code):
+    """
+    Confere o código do usuário em tempo constante; apaga os códigos dele se bater.
+
+    Cada erro conta uma tentativa no código ativo; ao chegar em OTP_MAX_ATTEMPTS
+    ele é apagado e o usuário precisa pedir outro (sem isso, 10^6 combinações
+    caberiam nos 15 minutos de validade).
+    """
+    code = str(code or "")
+    max_attempts = getattr(settings, 'OTP_MAX_ATTEMPTS', 5)
+    active = OneTimePassord.objects.filter(
+        user=user, expires_at__gt=timezone.now(), attempts__lt=max_attempts
+    )
+    valid_codes = active.values_list('code', flat=True)
+    matched = False
+    for candidate in valid_codes:
+        # Compara todos (sem parar no primeiro) para não vazar tempo
+        matched |= hmac.compare_digest(candidate.encode(), code.encode())
+    if matched:
+        OneTimePassord.objects.filter(user=user).delete()
+    else:
+        # Incremento no banco (F) para não perder tentativas em requisições paralelas
+        active.update(attempts=F('attempts') + 1)
+        OneTimePassord.objects.filter(user=user, attempts__gte=max_attempts).delete()
+    return matched
+
+def purge_expired_otps(batch_size=OTP_PURGE_BATCH_SIZE):
+    """Remove os códigos vencidos em lotes. Retorna o total removido."""
+    now = timezone.now()
+    removed = 0
+    while True:
+        ids = list(
+            OneTimePassord.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return removed
+        removed += OneTimePassord.objects.filter(pk__in=ids).delete()[0]
 
 def send_code_to_email_user(email):
     Subject="One time passcode for Email verification"
@@ -23,16 +65,17 @@ def send_code_to_email_user(email):
     
     from_email=settings.DEFAULT_FROM_EMAIL
     
+    # Um código ativo por usuário: um novo envio invalida o anterior
+    OneTimePassord.objects.filter(user=user).delete()
     OneTimePassord.objects.create(user=user, code=otp_code)
 
-    d_email=EmailMessage(subject=Subject, body=email_body, from_email=from_email, to=[email])
-    d_email.send(fail_silently=True)
+    # Só enfileira: o envio é feito pelo manage.py send_emails (accounts/outbox.py)
+    queue_email(Subject, email_body, email, from_email=from_email)
 
 def send_normal_email(data):
-    email=EmailMessage(
-        subject=data['email_subject'], 
-        body=data['email_body'],
-        from_email=settings.EMAIL_HOST_USER,
-        to=[data['to_email']]
-    )
-    email.send()
\ No newline at end of file
+    queue_email(
+        data['email_subject'],
+        data['email_body'],
+        data['to_email'],
+        from_email=settings.EMAIL_HOST_USER
+    )
\ No newline at end of file
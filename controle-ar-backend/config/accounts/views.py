@@ -4,8 +4,9 @@ from .serializers import UserRegisterSerializer, LoginSerializer, PasswordResetR
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from .utils import send_code_to_email_user
-from .models import OneTimePassord, User  # <-- CORREÇÃO 3: Importado o User
+from .utils import send_code_to_email_user, verify_otp
+from .throttling import LoginIPThrottle, LoginEmailThrottle
+from .models import User  # <-- CORREÇÃO 3: Importado o User
 from django.utils.http import urlsafe_base64_decode
 from django.utils.encoding import smart_str, DjangoUnicodeDecodeError
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
@@ -32,28 +33,32 @@ class RegisterUserView(GenericAPIView):
     
 class VerifyUserEmail(GenericAPIView):
     def post(self, request):
-        # Atenção: No Postman, você deverá enviar o JSON com a chave "otp"
-        otpcode = request.data.get('otp') 
-        try:
-            user_code_obj = OneTimePassord.objects.get(code=otpcode)
-            user = user_code_obj.user
-            if not user.is_verified:
-                user.is_verified = True
-                user.save()
-                return Response({
-                    'message': 'Endereço de email verificado com sucesso!' # (Corrigi 'messagem' para 'message')
-                }, status=status.HTTP_200_OK)
-                
-            # <-- CORREÇÃO 4: Retornar 400 em vez de 204
-            return Response({
-                'message': 'Usuário já se encontra verificado!'
-            }, status=status.HTTP_400_BAD_REQUEST)
-            
-        except OneTimePassord.DoesNotExist:
+        # Atenção: No Postman, envie o JSON com as chaves "email" e "otp"
+        email = request.data.get('email')
+        otpcode = request.data.get('otp')
+        if not email or not otpcode:
+            return Response({'message': 'Informe o email e o código de verificação'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = User.objects.filter(email=email).first()
+        if user is None or not verify_otp(user, otpcode):
             return Response({'message':'Código de verificação inválido ou expirado'}, status=status.HTTP_404_NOT_FOUND)
 
+        if not user.is_verified:
+            user.is_verified = True
+            user.save()
+            return Response({
+                'message': 'Endereço de email verificado com sucesso!' # (Corrigi 'messagem' para 'message')
+            }, status=status.HTTP_200_OK)
+
+        # <-- CORREÇÃO 4: Retornar 400 em vez de 204
+        return Response({
+            'message': 'Usuário já se encontra verificado!'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
 class LoginUserView(GenericAPIView):
     serializer_class = LoginSerializer
+    # Recusa rajadas antes do hash da senha (ver accounts/throttling.py)
+    throttle_classes = [LoginIPThrottle, LoginEmailThrottle]
     def post(self, request):
         serializer = self.serializer_class(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
@@ -3,21 +3,31 @@ Django settings for config project.
 
 Generated by 'django-admin startproject' using Django 5.2.8.
 """
+import json
 import os
 import dj_database_url
 from pathlib import Path
-import environ
-from pathlib import Path
+from corsheaders.defaults import default_headers
+from django.core.exceptions import ImproperlyConfigured
 from datetime import timedelta # <-- IMPORTANTE: Adicionado para configurar o tempo do Token
 
-env = environ.Env(
-    DEBUG=(bool, False)
-)
-
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-environ.Env.read_env(BASE_DIR / '.env')
+# O .env só existe em desenvolvimento; na PaaS as variáveis já vêm do ambiente
+# e o django-environ nem chega a ser importado (menos tempo de cold start)
+if (BASE_DIR / '.env').exists():
+    import environ
+    environ.Env.read_env(BASE_DIR / '.env')
+
+
+def env(name):
+    """Variável obrigatória (mesmo erro do django-environ quando falta)."""
+    try:
+        return os.environ[name]
+    except KeyError:
+        raise ImproperlyConfigured(f"Set the {name} environment variable")
+
 
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = env('SECRET_KEY')
@@ -46,17 +56,37 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.db_router.StickyPrimaryMiddleware',
+    'core.profiling.ProfilingMiddleware',
 ]
+
+# Compressão das respostas (core/compression.py): brotli (se o pacote estiver
+# instalado) ou gzip, só a partir deste tamanho
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))
+
+# Perfil de SQL/latência por requisição (core/profiling.py). Em DEBUG vai nos
+# cabeçalhos; em produção (PROFILING_ENABLED=True), amostrado, vai para /api/metrics/
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', str(DEBUG)) == 'True'
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 1.0 if DEBUG else 0.05))
+PROFILING_SLOW_QUERY_MS = int(os.environ.get('PROFILING_SLOW_QUERY_MS', 100))
+PROFILING_QUERY_BUDGETS = {
+    'device-list': 4,
+    'device-detail': 6,
+    'device-control': 10,
+}
 CORS_ALLOWED_ORIGINS = [
     "https://ar-condicionado-afeto-site.vercel.app",
     "http://localhost:5173",
 ]
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -81,18 +111,130 @@ DATABASES = {
     'default': dj_database_url.config(
         # Fallback para o SQLite local se não houver link do Render
         default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
-        conn_max_age=600
+        conn_max_age=600,
+        # Testa a conexão persistente antes de reutilizá-la (o servidor pode tê-la derrubado)
+        conn_health_checks=True
     )
 }
 
+# SQLite (desenvolvimento): transações pegam o lock de escrita logo no início e
+# esperam em vez de falhar com "database is locked" quando API e listener escrevem juntos
+# Réplica de leitura (core/db_router.py): leituras pesadas do DeviceViewSet vão
+# para ela; escritas e leituras logo após a escrita do usuário, para o primário
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(DATABASE_REPLICA_URL, conn_max_age=600, conn_health_checks=True)
+    # Nos testes a réplica é o próprio banco de teste do primário
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+for _database in DATABASES.values():
+    if _database['ENGINE'].endswith('sqlite3'):
+        _database.setdefault('OPTIONS', {}).update({'transaction_mode': 'IMMEDIATE', 'timeout': 20})
+
 AUTH_USER_MODEL="accounts.User"
 
+# Cache: local por processo; defina REDIS_URL para compartilhar entre os workers e o listener
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# --- MQTT: circuit breaker e fila de saída ---
+MQTT_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('MQTT_BREAKER_FAILURE_THRESHOLD', 3))
+MQTT_BREAKER_COOLDOWN = int(os.environ.get('MQTT_BREAKER_COOLDOWN', 30))
+MQTT_BREAKER_SLOW_CALL = float(os.environ.get('MQTT_BREAKER_SLOW_CALL', 3.0))
+# Com o broker fora, enfileira o comando (202) em vez de responder 503
+MQTT_QUEUE_WHEN_UNAVAILABLE = os.environ.get('MQTT_QUEUE_WHEN_UNAVAILABLE', 'False') == 'True'
+MQTT_OUTBOX_COMMAND_TTL = int(os.environ.get('MQTT_OUTBOX_COMMAND_TTL', 10 * 60))
+
+# Cadastro em lote (core/provisioning.py): linhas por envio e configurações
+# Wi-Fi publicadas por segundo (cada uma são duas mensagens: envio + reenvio)
+DEVICE_PROVISION_MAX_ROWS = int(os.environ.get('DEVICE_PROVISION_MAX_ROWS', 1000))
+DEVICE_PROVISION_CONFIG_RATE = float(os.environ.get('DEVICE_PROVISION_CONFIG_RATE', 5))
+
+# Ouvinte MQTT dentro do processo web (core/listener.py), iniciado pelo
+# config/wsgi.py e config/asgi.py, com eleição de líder: só um worker consome
+# o broker. LISTENER_LEADER_LOCK: auto | postgres | file
+MQTT_LISTENER_EMBEDDED = os.environ.get('MQTT_LISTENER_EMBEDDED', 'False') == 'True'
+LISTENER_LEADER_LOCK = os.environ.get('LISTENER_LEADER_LOCK', 'auto')
+LISTENER_LEADER_RETRY = float(os.environ.get('LISTENER_LEADER_RETRY', 2))
+LISTENER_LOCK_FILE = os.environ.get('LISTENER_LOCK_FILE') or None
+
+# Modo tempestade do ouvinte (core/ingest.py): entra acima de ENTER_RATE msg/s e
+# sai após EXIT_AFTER s abaixo de EXIT_RATE; a fila represada sai com jitter
+LISTENER_STORM_ENTER_RATE = float(os.environ.get('LISTENER_STORM_ENTER_RATE', 50))
+LISTENER_STORM_EXIT_RATE = float(os.environ.get('LISTENER_STORM_EXIT_RATE', 10))
+LISTENER_STORM_EXIT_AFTER = float(os.environ.get('LISTENER_STORM_EXIT_AFTER', 15))
+LISTENER_STORM_RELEASE_JITTER = float(os.environ.get('LISTENER_STORM_RELEASE_JITTER', 60))
+
+# Reconciliação a cada conexão (core/ingest.py): junta o estado retido por até
+# WINDOW s (ou até QUIET s sem retidas) e grava tudo num lote só
+LISTENER_RECONCILE_WINDOW = float(os.environ.get('LISTENER_RECONCILE_WINDOW', 5))
+LISTENER_RECONCILE_QUIET = float(os.environ.get('LISTENER_RECONCILE_QUIET', 1))
+
+# Oscilação de presença (core/presence.py): ENTER transições online/offline em
+# WINDOW segundos deixam a placa "instável"; o episódio acaba com até EXIT
+DEVICE_FLAP_WINDOW = int(os.environ.get('DEVICE_FLAP_WINDOW', 600))
+DEVICE_FLAP_ENTER = int(os.environ.get('DEVICE_FLAP_ENTER', 6))
+DEVICE_FLAP_EXIT = int(os.environ.get('DEVICE_FLAP_EXIT', 2))
+
+# Se definido, /api/metrics/ exige o cabeçalho X-Metrics-Token
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Tempo (s) que uma resposta guardada por Idempotency-Key é reaproveitada
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+# Tempo (s) que o resumo da frota (/api/devices/summary/) fica em cache
+FLEET_SUMMARY_TTL = int(os.environ.get('FLEET_SUMMARY_TTL', 15))
+# Só com REDIS_URL: o listener invalida o resumo no cache, e num cache local
+# por processo os outros workers serviriam contagens velhas até o TTL
+FLEET_SUMMARY_CACHED = bool(os.environ.get('REDIS_URL'))
+
+# Análises da frota (core/analytics.py): linhas do histórico por lote em
+# memória, cache do relatório (s) e potência nominal por marca, em kW
+# (JSON, ex.: {"LG": 1.2, "Samsung": 1.1}; marcas ausentes valem 1 kW)
+ANALYTICS_CHUNK_ROWS = int(os.environ.get('ANALYTICS_CHUNK_ROWS', 200_000))
+ANALYTICS_CACHE_TTL = int(os.environ.get('ANALYTICS_CACHE_TTL', 15 * 60))
+ANALYTICS_BRAND_KW = json.loads(os.environ.get('ANALYTICS_BRAND_KW') or '{}')
+# Relatórios por usuário no endpoint /devices/analytics/ (formato do DRF: N/min, N/hour)
+ANALYTICS_THROTTLE_RATE = os.environ.get('ANALYTICS_THROTTLE_RATE', '10/min')
+
 # --- CONFIGURAÇÕES DO REST FRAMEWORK E JWT ---
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
+    ),
+    # JSON com orjson (core/renderers.py, core/parsers.py); sem o pacote, volta ao json da stdlib
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    # Proxies confiáveis na frente da API. Com 0 o IP dos throttles é o
+    # REMOTE_ADDR; o X-Forwarded-For vem do cliente e não pode escolher o bucket.
+    # Em produção atrás de PaaS/balanceador, defina NUM_PROXIES=1 (ver README):
+    # senão todos os clientes dividem o limite do IP do proxy
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+    # Limites por escopo dos throttles do DRF (scope da classe)
+    'DEFAULT_THROTTLE_RATES': {
+        'analytics': ANALYTICS_THROTTLE_RATE,
+    },
     # Descomente as linhas abaixo se quiser forçar que TODAS as rotas da API exijam login:
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated',
@@ -105,8 +247,17 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',), # O Frontend enviará 'Bearer <token>'
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.RotatingTokenRefreshSerializer',
 }
 
+# Limpeza das tabelas de tokens (manage.py prune_tokens)
+JWT_PRUNE_BATCH_SIZE = int(os.environ.get('JWT_PRUNE_BATCH_SIZE', 1000))
+
+# Cache do usuário autenticado (accounts/authentication.py)
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 30))
+# Só com REDIS_URL: num cache por processo, desativar o usuário não chegaria aos outros workers
+AUTH_USER_CACHE_SHARED = bool(os.environ.get('REDIS_URL'))
+
 # ----------------------------------------------
 
 # Password validation
@@ -140,9 +291,31 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Looking to send emails in production? Check out our Email API/SMTP product!
-EMAIL_HOST = 'sandbox.smtp.mailtrap.io'
+# Para testes locais: EMAIL_HOST=localhost EMAIL_PORT=1025 EMAIL_USE_TLS=False EMAIL_HOST_USER= EMAIL_HOST_PASSWORD=
+# com um SMTP de mentira (ex.: python -m aiosmtpd -n -l localhost:1025)
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'sandbox.smtp.mailtrap.io')
 EMAIL_HOST_USER = env('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL='caflo.2024114tads0005@aluno.ifpi.edu.br'
-EMAIL_PORT = '2525'
-EMAIL_USE_TLS=True
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 2525))
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'True') == 'True'
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', 10))
+
+# Limite de tentativas de login (accounts/throttling.py): rajada + fichas por minuto
+LOGIN_THROTTLE_IP_BURST = int(os.environ.get('LOGIN_THROTTLE_IP_BURST', 10))
+LOGIN_THROTTLE_IP_PER_MINUTE = int(os.environ.get('LOGIN_THROTTLE_IP_PER_MINUTE', 10))
+LOGIN_THROTTLE_EMAIL_BURST = int(os.environ.get('LOGIN_THROTTLE_EMAIL_BURST', 5))
+LOGIN_THROTTLE_EMAIL_PER_MINUTE = int(os.environ.get('LOGIN_THROTTLE_EMAIL_PER_MINUTE', 5))
+# Com REDIS_URL, o limite vale para todos os workers
+LOGIN_THROTTLE_SHARED = bool(os.environ.get('REDIS_URL'))
+
+# Validade (s) do código de verificação enviado no cadastro
+OTP_TTL = int(os.environ.get('OTP_TTL', 15 * 60))
+# Tentativas erradas permitidas antes de o código ser invalidado
+OTP_MAX_ATTEMPTS = int(os.environ.get('OTP_MAX_ATTEMPTS', 5))
+
+# Fila de e-mails (accounts/outbox.py): enviada pelo ouvinte MQTT líder ou pelo manage.py send_emails
+EMAIL_OUTBOX_INTERVAL = int(os.environ.get('EMAIL_OUTBOX_INTERVAL', 5))
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', 50))
+# Reserva (s) de um lote para o worker que o pegou (evita envio em dobro)
+EMAIL_OUTBOX_CLAIM_SECONDS = int(os.environ.get('EMAIL_OUTBOX_CLAIM_SECONDS', 300))
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Ouvinte MQTT embutido (core/listener.py): só o servidor web o sobe
+from django.conf import settings  # noqa: E402
+
+if settings.MQTT_LISTENER_EMBEDDED:
+    from core.listener import start_embedded
+
+    start_embedded()
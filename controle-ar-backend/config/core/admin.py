@@ -1,5 +1,146 @@
-from django.contrib import admin
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import cached_property
+
 from .models import Device
+from .outbox import queue_commands, queue_wifi_configs
+from .provisioning import wifi_setup_payload
+from . import provisioning, shadow, summary, usage
+
+# Abaixo disso o COUNT(*) é barato e exato; acima, a estimativa do planner basta
+ESTIMATED_COUNT_THRESHOLD = getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000)
+ROOM_FILTER_TTL = getattr(settings, 'ADMIN_ROOM_FILTER_TTL', 10 * 60)
+ROOM_FILTER_LIMIT = 200
+ACTION_BATCH_SIZE = 500
+ROOM_FILTER_CACHE_KEY = 'admin_device_rooms'
+
+
+# ============================================================
+#  CONTAGEM ESTIMADA
+# ============================================================
+class EstimatedCountPaginator(Paginator):
+    """
+    Sem filtro nem busca, usa o reltuples do Postgres (estatística do planner,
+    atualizada pelo autovacuum) em vez de um COUNT(*) na tabela inteira. Com
+    filtro, ou em tabelas pequenas, conta de verdade.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = self._estimate(queryset)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+    @staticmethod
+    def _estimate(queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        # -1: tabela ainda não analisada
+        return row[0] if row and row[0] >= 0 else None
+
+
+# ============================================================
+#  FILTRO DE CÔMODO (em cache)
+# ============================================================
+class RoomListFilter(admin.SimpleListFilter):
+    """
+    `room` é texto livre: o list_filter padrão faz um DISTINCT na tabela a cada
+    carregamento da página. Aqui a lista fica em cache por ROOM_FILTER_TTL e o
+    DISTINCT usa o índice core_device_room_idx.
+    """
+    title = 'cômodo'
+    parameter_name = 'room'
+
+    def lookups(self, request, model_admin):
+        rooms = cache.get(ROOM_FILTER_CACHE_KEY)
+        if rooms is None:
+            rooms = list(
+                Device.objects.order_by('room').values_list('room', flat=True).distinct()[:ROOM_FILTER_LIMIT]
+            )
+            cache.set(ROOM_FILTER_CACHE_KEY, rooms, ROOM_FILTER_TTL)
+        return [(room, room) for room in rooms]
+
+    def queryset(self, request, queryset):
+        if self.value() is not None:
+            return queryset.filter(room=self.value())
+        return queryset
+
+
+# ============================================================
+#  AÇÕES EM MASSA
+# ============================================================
+def _in_batches(queryset):
+    """Percorre a seleção em lotes (pk crescente), sem carregar tudo na memória."""
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:ACTION_BATCH_SIZE])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
+
+
+@admin.action(description="Desligar os dispositivos selecionados")
+def power_off(modeladmin, request, queryset):
+    """
+    Como o control da API, mas em lote: um bulk_update, os eventos de uso em
+    record_transitions e os comandos na fila de saída, que o agendador publica
+    em lotes numa única conexão com o broker.
+    """
+    now = timezone.now()
+    total = 0
+    for batch in _in_batches(queryset):
+        changes = []
+        for device in batch:
+            changes.append((device, usage.snapshot(device)))
+            device.power = False
+            device.last_command = now
+            device.updated_at = now
+            shadow.set_desired(device, now)
+        Device.objects.bulk_update(
+            batch, ['power', 'last_command', 'updated_at', *shadow.DESIRED_UPDATE_FIELDS]
+        )
+        usage.record_transitions(changes, source='command', at=now)
+        queue_commands([
+            (device, {"power": False, "temp": device.temperature, "mode": device.mode, "brand": device.brand})
+            for device in batch
+        ])
+        for user_id in {device.user_id for device in batch}:
+            summary.invalidate(user_id)
+        total += len(batch)
+    modeladmin.message_user(request, f"{total} comandos de desligar enfileirados.", messages.SUCCESS)
+
+
+@admin.action(description="Reenviar a configuração Wi-Fi")
+def resend_wifi_config(modeladmin, request, queryset):
+    """Enfileira a configuração Wi-Fi (envio + reenvio) dos selecionados, no ritmo do cadastro em lote."""
+    queued = skipped = 0
+    start = timezone.now()
+    for batch in _in_batches(queryset):
+        scheduled = queue_wifi_configs(
+            [(device, wifi_setup_payload(device)) for device in batch], provisioning.CONFIG_RATE, start
+        )
+        queued += len(scheduled)
+        skipped += len(batch) - len(scheduled)
+        if scheduled:
+            start = max(scheduled.values()) + timedelta(seconds=1 / provisioning.CONFIG_RATE)
+    modeladmin.message_user(request, f"Configuração Wi-Fi enfileirada para {queued} dispositivos.", messages.SUCCESS)
+    if skipped:
+        modeladmin.message_user(request, f"{skipped} dispositivos sem SSID ignorados.", messages.WARNING)
+
 
 @admin.register(Device)
 class DeviceAdmin(admin.ModelAdmin):
@@ -17,7 +158,8 @@ class DeviceAdmin(admin.ModelAdmin):
     )
     
     # Filtros laterais para facilitar a busca
-    list_filter = ('brand', 'is_online', 'power', 'mode', 'room')
+    # brand/mode/booleanos vêm das choices (sem consulta); cômodo vem do cache
+    list_filter = ('brand', 'is_online', 'power', 'mode', RoomListFilter)
     
     # Campos onde a barra de busca vai procurar
     search_fields = ('name', 'device_id', 'wifi_ssid')
@@ -28,7 +170,7 @@ class DeviceAdmin(admin.ModelAdmin):
     # Organização dos campos no formulário de edição
     fieldsets = (
         ('Identificação', {
-            'fields': ('name', 'device_id', 'room', 'brand', 'model')
+            'fields': ('name', 'device_id', 'user', 'room', 'brand')
         }),
         ('Conexão', {
             'fields': ('wifi_ssid', 'is_online')
@@ -42,5 +184,14 @@ class DeviceAdmin(admin.ModelAdmin):
         }),
     )
 
-    # Ordenação padrão (mais recentes primeiro)
-    ordering = ('-updated_at',)
\ No newline at end of file
+    # Ordenação padrão (mais recentes primeiro), coberta pelo core_device_updated_idx
+    ordering = ('-updated_at', '-id')
+
+    # Dono: busca por e-mail/nome em vez de um <select> com todos os usuários
+    autocomplete_fields = ('user',)
+
+    # Frota grande: contagem estimada e sem o segundo COUNT(*) ("de N no total")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    actions = (power_off, resend_wifi_config)
@@ -0,0 +1,326 @@
+"""
+Análises da frota sobre o histórico de estados (DeviceStateEvent), com NumPy.
+
+Perguntas como "kWh estimado por cômodo no último mês" ou "quais aparelhos
+ficam em 16 °C mais de 8 h por dia" olham milhões de amostras. Em vez de um
+laço Python por amostra:
+- o histórico é lido ordenado por (aparelho, horário) em lotes de cerca de
+  no máximo ANALYTICS_CHUNK_ROWS linhas, convertidos em colunas NumPy;
+  um aparelho com histórico maior que o lote é dividido entre lotes, então a
+  memória fica limitada ao lote;
+- intervalos ligados, energia e horas por dia saem de operações vetorizadas
+  (deslocamento das colunas, np.bincount) sobre o lote inteiro;
+- outliers: pontuação robusta (mediana/MAD) do kWh por dia entre os aparelhos.
+
+A energia é uma estimativa: potência nominal da marca (ANALYTICS_BRAND_KW,
+em kW) x fator do modo x fator do setpoint (no frio, cada grau abaixo de
+SETPOINT_REFERENCE aumenta o consumo em SETPOINT_STEP; no quente, cada grau
+acima de HEAT_REFERENCE).
+
+O NumPy é dependência opcional: sem ele, available() é False e o endpoint e
+o comando avisam em vez de calcular.
+"""
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import Device, DeviceStateEvent
+
+try:
+    import numpy as np
+except ImportError:  # dependência opcional
+    np = None
+
+CHUNK_ROWS = getattr(settings, 'ANALYTICS_CHUNK_ROWS', 200_000)
+CACHE_TTL = getattr(settings, 'ANALYTICS_CACHE_TTL', 15 * 60)
+# Janelas aceitas pelo endpoint: cada combinação de parâmetros é uma chave de cache
+WINDOW_DAYS = (1, 7, 30, 90, 365)
+BRAND_KW = getattr(settings, 'ANALYTICS_BRAND_KW', {})
+DEFAULT_KW = 1.0
+DB_CHUNK_SIZE = 5000
+DAY = 86400
+
+MODES = [code for code, _label in Device.MODE_CHOICES]
+MODE_INDEX = {mode: i for i, mode in enumerate(MODES)}
+MODE_FACTORS = {'cool': 1.0, 'heat': 1.0, 'fan': 0.1, 'dry': 0.6, 'auto': 0.8}
+SETPOINT_REFERENCE = 24
+HEAT_REFERENCE = 20
+SETPOINT_STEP = 0.06
+MIN_SETPOINT_FACTOR = 0.2
+# Pontuação robusta (0,6745 · desvio / MAD) acima disso é outlier (Iglewicz & Hoaglin)
+OUTLIER_SCORE = 3.5
+
+
+def available():
+    return np is not None
+
+
+# ============================================================
+#  LEITURA EM COLUNAS
+# ============================================================
+def _columns(rows, index, rooms, continued=False):
+    """
+    Lote de linhas (device_id, recorded_at, is_online, power, temperature, mode, room) em colunas.
+    `continued` indica que o último aparelho do lote segue no próximo.
+    """
+    device_ids, times, online, power, temperatures, modes, room_names = zip(*rows)
+    size = len(rows)
+    return {
+        'device': np.fromiter((index[pk] for pk in device_ids), np.int32, size),
+        'ts': np.fromiter((moment.timestamp() for moment in times), np.float64, size),
+        'on': np.array(online, dtype=bool) & np.array(power, dtype=bool),
+        'temperature': np.array(temperatures, dtype=np.int16),
+        'mode': np.fromiter((MODE_INDEX.get(mode, 0) for mode in modes), np.int8, size),
+        'room': np.fromiter((rooms.setdefault(room, len(rooms)) for room in room_names), np.int32, size),
+        'continued': continued,
+    }
+
+
+def iter_chunks(devices, index, rooms, start, end, chunk_rows=CHUNK_ROWS):
+    """
+    Lotes colunares do histórico de `devices` (queryset) na janela [start, end),
+    incluindo o último evento antes de start (o estado no início da janela).
+    `index` mapeia pk → posição; `rooms` (nome → posição) é preenchido aqui.
+    Cada lote tem no máximo chunk_rows + 1 linhas, mesmo com um único aparelho.
+    """
+    latest_before = (
+        DeviceStateEvent.objects.filter(device=OuterRef('pk'), recorded_at__lt=start)
+        .order_by('-recorded_at').values('pk')[:1]
+    )
+    initial = devices.annotate(initial=Subquery(latest_before)).exclude(initial__isnull=True).values('initial')
+    events = (
+        DeviceStateEvent.objects
+        .filter(device__in=devices.values('pk'), recorded_at__lt=end)
+        .filter(Q(recorded_at__gte=start) | Q(pk__in=initial))
+        .order_by('device_id', 'recorded_at')
+        .values_list('device_id', 'recorded_at', 'is_online', 'power', 'temperature', 'mode', 'room')
+    )
+    rows = []
+    for row in events.iterator(chunk_size=DB_CHUNK_SIZE):
+        if len(rows) >= chunk_rows:
+            # O intervalo da última linha termina no evento seguinte: se o aparelho
+            # continua, ela é repetida no início do próximo lote, que o conhece
+            continued = row[0] == rows[-1][0]
+            yield _columns(rows, index, rooms, continued)
+            rows = rows[-1:] if continued else []
+        rows.append(row)
+    if rows:
+        yield _columns(rows, index, rooms)
+
+
+# ============================================================
+#  CÁLCULO VETORIZADO
+# ============================================================
+class FleetAnalytics:
+    """
+    Acumula os lotes (add) e monta o relatório (result). `devices` é a lista
+    de dicts (pk, device_id, name, room, brand) na mesma ordem do índice
+    usado nos lotes, ordenados por (aparelho, horário). Um lote com
+    'continued' termina com uma linha repetida no início do seguinte.
+    """
+
+    def __init__(self, devices, start, end, low_setpoint=16, low_hours=8):
+        self.devices = devices
+        self.window = (start, end)
+        self.start, self.end = start.timestamp(), end.timestamp()
+        self.low_setpoint = low_setpoint
+        self.low_seconds = low_hours * 3600
+        # Dias no fuso local (deslocamento do início da janela)
+        self.offset = timezone.localtime(start).utcoffset().total_seconds()
+        self.first_day = math.floor((self.start + self.offset) / DAY)
+        self.days = math.floor((self.end - 1e-6 + self.offset) / DAY) - self.first_day + 1
+
+        size = len(devices)
+        self.samples = 0
+        self.on_seconds = np.zeros(size)
+        self.kwh = np.zeros(size)
+        self.low_days = np.zeros(size, dtype=np.int32)
+        # Segundos por (aparelho, dia) do aparelho que continua no próximo lote
+        self._open_low = None
+        self.rooms = {}
+        self.room_on_seconds = np.zeros(0)
+        self.room_kwh = np.zeros(0)
+        self.kw = np.array([BRAND_KW.get(device['brand'], DEFAULT_KW) for device in devices], dtype=np.float64)
+        self.mode_factor = np.array([MODE_FACTORS.get(mode, 1.0) for mode in MODES])
+
+    def add(self, chunk):
+        device, ts, temperature, mode = chunk['device'], chunk['ts'], chunk['temperature'], chunk['mode']
+        size = len(ts)
+        if not size:
+            return
+        continued = chunk.get('continued', False)
+        # A linha repetida no próximo lote é contada lá
+        self.samples += size - 1 if continued else size
+
+        # Cada estado vale até o próximo evento do mesmo aparelho (o último, até o fim da janela)
+        following = np.empty_like(ts)
+        following[:-1] = ts[1:]
+        last = np.ones(size, dtype=bool)
+        last[:-1] = device[1:] != device[:-1]
+        following[last] = self.end
+        if continued:
+            following[-1] = ts[-1]
+        begin = np.clip(ts, self.start, self.end)
+        finish = np.clip(following, self.start, self.end)
+        seconds = np.where(chunk['on'], np.maximum(finish - begin, 0.0), 0.0)
+
+        cool, heat = mode == MODE_INDEX['cool'], mode == MODE_INDEX['heat']
+        setpoint = np.where(cool, 1 + SETPOINT_STEP * (SETPOINT_REFERENCE - temperature), 1.0)
+        setpoint = np.where(heat, 1 + SETPOINT_STEP * (temperature - HEAT_REFERENCE), setpoint)
+        kwh = seconds / 3600 * self.kw[device] * self.mode_factor[mode] * np.maximum(setpoint, MIN_SETPOINT_FACTOR)
+
+        self.on_seconds += np.bincount(device, weights=seconds, minlength=len(self.devices))
+        self.kwh += np.bincount(device, weights=kwh, minlength=len(self.devices))
+        self._add_rooms(chunk['room'], seconds, kwh)
+
+        low = (seconds > 0) & (temperature <= self.low_setpoint)
+        self._add_low_days(device[low], begin[low], finish[low], device[-1] if continued else None)
+
+    def _add_rooms(self, room, seconds, kwh):
+        size = len(self.rooms)
+        if len(self.room_kwh) < size:
+            self.room_on_seconds = np.pad(self.room_on_seconds, (0, size - len(self.room_on_seconds)))
+            self.room_kwh = np.pad(self.room_kwh, (0, size - len(self.room_kwh)))
+        self.room_on_seconds += np.bincount(room, weights=seconds, minlength=size)
+        self.room_kwh += np.bincount(room, weights=kwh, minlength=size)
+
+    def _add_low_days(self, device, begin, finish, open_device=None):
+        """
+        Dias em que o aparelho ficou ligado no setpoint baixo por mais de
+        low_hours. Os dias de `open_device` (que segue no próximo lote) só
+        são contados quando ele termina.
+        """
+        keys, seconds = self._low_seconds_by_day(device, begin, finish)
+        if self._open_low is not None:
+            keys = np.concatenate([self._open_low[0], keys])
+            seconds = np.concatenate([self._open_low[1], seconds])
+            self._open_low = None
+        if not len(keys):
+            return
+        keys, inverse = np.unique(keys, return_inverse=True)
+        seconds = np.bincount(inverse, weights=seconds)
+        if open_device is not None:
+            still_open = keys // self.days == open_device
+            self._open_low = (keys[still_open], seconds[still_open])
+            keys, seconds = keys[~still_open], seconds[~still_open]
+        self.low_days += np.bincount(keys[seconds >= self.low_seconds] // self.days, minlength=len(self.devices))
+
+    def _low_seconds_by_day(self, device, begin, finish):
+        """Intervalos quebrados por dia local: (aparelho · days + dia, segundos)."""
+        if not len(device):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        first_day = np.floor((begin + self.offset) / DAY).astype(np.int64)
+        last_day = np.floor((finish - 1e-6 + self.offset) / DAY).astype(np.int64)
+        day_start = lambda day: day * DAY - self.offset  # noqa: E731
+
+        # Pedaço no primeiro dia, no último dia e dias inteiros no meio
+        parts_device = [device, device[last_day > first_day]]
+        parts_day = [first_day, last_day[last_day > first_day]]
+        parts_seconds = [
+            np.minimum(finish, day_start(first_day + 1)) - begin,
+            (finish - day_start(last_day))[last_day > first_day],
+        ]
+        gaps = last_day - first_day - 1
+        if (gaps > 0).any():
+            repeats = gaps[gaps > 0]
+            within = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+            parts_device.append(np.repeat(device[gaps > 0], repeats))
+            parts_day.append(np.repeat(first_day[gaps > 0] + 1, repeats) + within)
+            parts_seconds.append(np.full(len(within), float(DAY)))
+
+        device = np.concatenate(parts_device).astype(np.int64)
+        day = np.concatenate(parts_day) - self.first_day
+        return device * self.days + day, np.concatenate(parts_seconds)
+
+    def outliers(self):
+        """Aparelhos com kWh/dia muito acima da frota (mediana/MAD dos que ligaram)."""
+        used = self.on_seconds > 0
+        if used.sum() < 3:
+            return np.zeros(len(self.devices), dtype=bool), np.zeros(len(self.devices))
+        values = self.kwh[used]
+        median = np.median(values)
+        mad = np.median(np.abs(values - median))
+        scores = np.zeros(len(self.devices))
+        if mad > 0:
+            scores[used] = 0.6745 * (values - median) / mad
+        return scores > OUTLIER_SCORE, scores
+
+    def result(self):
+        window_days = (self.end - self.start) / DAY
+        is_outlier, scores = self.outliers()
+        devices = [
+            {
+                'device_id': device['device_id'],
+                'name': device['name'],
+                'room': device['room'],
+                'brand': device['brand'],
+                'on_hours': round(float(self.on_seconds[i]) / 3600, 2),
+                'kwh': round(float(self.kwh[i]), 3),
+                'kwh_per_day': round(float(self.kwh[i]) / window_days, 3),
+                'low_setpoint_days': int(self.low_days[i]),
+                'outlier_score': round(float(scores[i]), 2),
+            }
+            for i, device in enumerate(self.devices)
+        ]
+        devices.sort(key=lambda row: -row['kwh'])
+        rooms = [
+            {
+                'room': name,
+                'on_hours': round(float(self.room_on_seconds[i]) / 3600, 2),
+                'kwh': round(float(self.room_kwh[i]), 3),
+            }
+            for name, i in self.rooms.items()
+        ]
+        rooms.sort(key=lambda row: -row['kwh'])
+        return {
+            'start': self.window[0],
+            'end': self.window[1],
+            'samples': self.samples,
+            'total_kwh': round(float(self.kwh.sum()), 3),
+            'rooms': rooms,
+            'devices': devices,
+            'low_setpoint': {
+                'setpoint': self.low_setpoint,
+                'hours_per_day': self.low_seconds / 3600,
+                'devices': [row['device_id'] for row in devices if row['low_setpoint_days']],
+            },
+            'outliers': [self.devices[i]['device_id'] for i in np.flatnonzero(is_outlier)],
+        }
+
+
+# ============================================================
+#  RELATÓRIO
+# ============================================================
+def fleet_report(devices, start, end, low_setpoint=16, low_hours=8, chunk_rows=CHUNK_ROWS):
+    """Relatório dos aparelhos de `devices` (queryset) na janela [start, end)."""
+    rows = list(devices.order_by('pk').values('pk', 'device_id', 'name', 'room', 'brand'))
+    index = {row['pk']: i for i, row in enumerate(rows)}
+    analytics = FleetAnalytics(rows, start, end, low_setpoint, low_hours)
+    for chunk in iter_chunks(devices, index, analytics.rooms, start, end, chunk_rows):
+        analytics.add(chunk)
+    return analytics.result()
+
+
+def user_report(user_id, days=30, low_setpoint=16, low_hours=8):
+    """
+    fleet_report dos aparelhos do usuário nos últimos `days` dias, em cache
+    por CACHE_TTL. low_hours vai em meias horas (8, 8.5...); outro valor é
+    recusado em vez de arredondado, para o relatório não responder por um
+    limite diferente do pedido.
+    """
+    days, low_setpoint, low_hours = int(days), int(low_setpoint), float(low_hours)
+    if low_hours * 2 != int(low_hours * 2):
+        raise ValueError("low_hours deve ser múltiplo de 0.5")
+    key = f"fleet_analytics:{user_id}:{days}:{low_setpoint}:{low_hours:g}"
+    report = cache.get(key)
+    if report is None:
+        end = timezone.now()
+        report = fleet_report(
+            Device.objects.filter(user_id=user_id), end - timedelta(days=days), end, low_setpoint, low_hours
+        )
+        cache.set(key, report, CACHE_TTL)
+    return report
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        # O ouvinte embutido não sobe aqui (o ready() roda em todo comando do
+        # manage.py): quem o inicia são os pontos de entrada config/wsgi.py e asgi.py
@@ -0,0 +1,232 @@
+"""
+Versões assíncronas (ASGI) das ações de escrita do DeviceViewSet.
+
+Rodando sob config/asgi.py (uvicorn/daphne), a espera pelo broker não
+ocupa uma thread do worker: o ORM usa a API assíncrona e a publicação MQTT
+usa o cliente persistente de core.mqtt_async. Assim poucos processos
+atendem milhares de comandos simultâneos.
+
+Rotas (mesmo contrato das versões síncronas):
+    POST  /api/async/devices/                 -> create
+    PATCH /api/async/devices/{id}/            -> partial_update
+    POST  /api/async/devices/{id}/control/    -> control
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+
+from .models import Device
+from .serializers import DeviceSerializer, DeviceCreateSerializer, CommandSerializer
+from .mqtt_helper import broker_available, broker_breaker
+from .outbox import queue_command
+from .provisioning import wifi_setup_payload
+from . import idempotency, mqtt_async, shadow, usage
+
+
+# ============================================================
+#  AUXILIARES
+# ============================================================
+def _error(message, status_code, headers=None):
+    response = JsonResponse({"error": message} if isinstance(message, str) else message, status=status_code)
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+def _authenticate_sync(request):
+    for auth_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = auth_class().authenticate(request)
+        if result:
+            return result[0]
+    return None
+
+
+async def _authenticate(request):
+    try:
+        user = await sync_to_async(_authenticate_sync)(request)
+    except APIException as e:
+        return None, _error(str(e.detail), e.status_code)
+    if user is None or not user.is_active:
+        return None, _error("As credenciais de autenticação não foram fornecidas.", 401)
+    # Como o DRF faz: o StickyPrimaryMiddleware usa o usuário depois da escrita
+    request.user = user
+    return user, None
+
+
+def _parse_body(request):
+    try:
+        return json.loads(request.body or b"{}"), None
+    except ValueError:
+        return None, _error("JSON inválido", 400)
+
+
+def _broker_unavailable():
+    retry_after = broker_breaker.retry_after()
+    return _error("Erro no Broker MQTT", 503, {"Retry-After": str(retry_after)} if retry_after else None)
+
+
+async def _get_device(user, pk):
+    """Mesmo escopo do DeviceViewSet.get_queryset: do usuário ou sem dono."""
+    return await Device.objects.filter(Q(user=user) | Q(user__isnull=True), pk=pk).afirst()
+
+
+async def _send_wifi_setup(device):
+    if device.wifi_ssid and device.wifi_password:
+        device.is_configured = await mqtt_async.send_wifi_config(device.device_id, wifi_setup_payload(device))
+        await device.asave(update_fields=['is_configured', 'updated_at'])
+
+
+async def _idempotent(request, user, data, handler):
+    """Aplica o cabeçalho Idempotency-Key (mesma regra do decorator síncrono)."""
+    key = request.headers.get(idempotency.HEADER)
+    if not key:
+        return await handler()
+    error = idempotency.validate_key(key)
+    if error:
+        return _error(error, 400)
+
+    record, stored = await sync_to_async(idempotency.reserve)(user, key, request.method, request.path, data)
+    if stored is not None:
+        body, status_code, replayed = stored
+        response = JsonResponse(body, status=status_code, safe=False)
+        if replayed:
+            response['Idempotent-Replayed'] = 'true'
+        return response
+
+    try:
+        response = await handler()
+    except Exception:
+        await record.adelete()
+        raise
+    await sync_to_async(idempotency.complete)(record, response.status_code, json.loads(response.content))
+    return response
+
+
+# ============================================================
+#  VIEWS
+# ============================================================
+@csrf_exempt
+async def device_control(request, pk):
+    if request.method != 'POST':
+        return _error("Método não permitido", 405)
+    user, error = await _authenticate(request)
+    if error:
+        return error
+    data, error = _parse_body(request)
+    if error:
+        return error
+
+    async def handler():
+        device = await _get_device(user, pk)
+        if device is None:
+            return _error("Não encontrado.", 404)
+        if device.user_id != user.id:
+            return _error("Não autorizado", 403)
+
+        command = dict(data)
+        if 'temp' in command and 'temperature' not in command:
+            command['temperature'] = command['temp']
+        serializer = CommandSerializer(data=command)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+
+        queue_when_unavailable = getattr(settings, 'MQTT_QUEUE_WHEN_UNAVAILABLE', False)
+        if not broker_available() and not queue_when_unavailable:
+            return _broker_unavailable()
+
+        validated = serializer.validated_data
+        payload = {
+            "power": validated.get('power', device.power),
+            "temp": validated.get('temperature', device.temperature),
+            "mode": validated.get('mode', device.mode),
+            "brand": device.brand
+        }
+        # Publica antes de gravar: comando recusado pelo broker não altera o aparelho
+        success = await mqtt_async.send_command_to_esp32(device.device_id, payload)
+        if not success and not queue_when_unavailable:
+            return _broker_unavailable()
+
+        previous_state = usage.snapshot(device)
+        device.power, device.temperature, device.mode = payload['power'], payload['temp'], payload['mode']
+        device.last_command = timezone.now()
+        shadow.set_desired(device, device.last_command)
+        await device.asave(update_fields=[
+            'power', 'temperature', 'mode', 'last_command', 'updated_at', *shadow.DESIRED_UPDATE_FIELDS
+        ])
+        await sync_to_async(usage.record_transition)(device, previous_state, source='command')
+
+        if success:
+            return JsonResponse({"status": "Comando enviado", "current_state": payload}, status=200)
+        await sync_to_async(queue_command)(device, payload)
+        return JsonResponse({"status": "Comando enfileirado", "current_state": payload}, status=202)
+
+    return await _idempotent(request, user, data, handler)
+
+
+@csrf_exempt
+async def device_create(request):
+    if request.method != 'POST':
+        return _error("Método não permitido", 405)
+    user, error = await _authenticate(request)
+    if error:
+        return error
+    data, error = _parse_body(request)
+    if error:
+        return error
+
+    def validate_and_save():
+        serializer = DeviceCreateSerializer(data=data)
+        if not serializer.is_valid():
+            return None, serializer.errors
+        try:
+            with transaction.atomic():
+                return serializer.save(user=user, is_registered=True), None
+        except IntegrityError:
+            return None, {"device_id": ["Já existe um dispositivo com este ID"]}
+
+    async def handler():
+        device, errors = await sync_to_async(validate_and_save)()
+        if device is None:
+            return JsonResponse(errors, status=400)
+        await _send_wifi_setup(device)
+        return JsonResponse(DeviceCreateSerializer(device).data, status=201)
+
+    return await _idempotent(request, user, data, handler)
+
+
+@csrf_exempt
+async def device_update(request, pk):
+    if request.method not in ('PATCH', 'PUT'):
+        return _error("Método não permitido", 405)
+    user, error = await _authenticate(request)
+    if error:
+        return error
+    data, error = _parse_body(request)
+    if error:
+        return error
+
+    device = await _get_device(user, pk)
+    if device is None:
+        return _error("Não encontrado.", 404)
+
+    def validate_and_save():
+        serializer = DeviceSerializer(device, data=data, partial=request.method == 'PATCH')
+        if not serializer.is_valid():
+            return None, serializer.errors
+        # Como no perform_update: quem registra a placa vira o dono
+        return serializer.save(user=user, is_registered=True), None
+
+    updated, errors = await sync_to_async(validate_and_save)()
+    if updated is None:
+        return JsonResponse(errors, status=400)
+    await _send_wifi_setup(updated)
+    data = await sync_to_async(lambda: DeviceSerializer(updated).data)()
+    return JsonResponse(data, status=200)
@@ -0,0 +1,137 @@
+"""
+Circuit breaker simples (fechado -> aberto -> meio-aberto).
+
+- Fechado: chamadas passam; falhas (e chamadas lentas) recentes são contadas.
+- Aberto: após `failure_threshold` falhas dentro de `window` segundos, as
+  chamadas são recusadas na hora durante `cooldown` segundos.
+- Meio-aberto: passado o cooldown, algumas chamadas de teste são liberadas;
+  sucesso fecha o circuito, falha reabre.
+"""
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, window=60, cooldown=30,
+                 slow_call_seconds=3.0, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.slow_call_seconds = slow_call_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._failures = deque()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.last_error = None
+        self.last_latency = None
+
+    # ============================================================
+    #  ESTADO
+    # ============================================================
+    def _refresh(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.cooldown:
+            self._state = HALF_OPEN
+            self._probes = 0
+
+    def _open(self, now):
+        self._state = OPEN
+        self._opened_at = now
+        self._failures.clear()
+        print(f"🔌 Circuito '{self.name}' ABERTO por {self.cooldown}s ({self.last_error})")
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def retry_after(self):
+        """Segundos até o circuito aceitar nova tentativa (0 se não estiver aberto)."""
+        with self._lock:
+            if self._state != OPEN:
+                return 0
+            return max(int(self.cooldown - (time.monotonic() - self._opened_at)) + 1, 1)
+
+    def snapshot(self):
+        state = self.state
+        retry_after = self.retry_after()
+        with self._lock:
+            return {
+                "state": state,
+                "recent_failures": len(self._failures),
+                "retry_after": retry_after,
+                "last_error": self.last_error,
+                "last_latency": self.last_latency,
+            }
+
+    # ============================================================
+    #  CHAMADAS
+    # ============================================================
+    def allow_request(self):
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+            return False
+
+    def would_allow(self):
+        """Como allow_request, sem ocupar a vaga de teste do meio-aberto."""
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state == CLOSED or (self._state == HALF_OPEN and self._probes < self.half_open_max_calls)
+
+    def record_success(self, elapsed):
+        if elapsed >= self.slow_call_seconds:
+            self.record_failure(f"chamada lenta ({elapsed:.1f}s)", elapsed)
+            return
+        with self._lock:
+            self.last_latency = elapsed
+            if self._state == HALF_OPEN:
+                print(f"🔌 Circuito '{self.name}' FECHADO novamente")
+            self._state = CLOSED
+            self._failures.clear()
+
+    def record_failure(self, error, elapsed=None):
+        now = time.monotonic()
+        with self._lock:
+            self.last_error = str(error)
+            self.last_latency = elapsed
+            if self._state == HALF_OPEN:
+                self._open(now)
+                return
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window:
+                self._failures.popleft()
+            if self._state == CLOSED and len(self._failures) >= self.failure_threshold:
+                self._open(now)
+
+    def call(self, func, *args, **kwargs):
+        """Executa `func` protegida pelo circuito; levanta CircuitOpenError se aberto."""
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuito '{self.name}' aberto")
+        start = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e, time.monotonic() - start)
+            raise
+        self.record_success(time.monotonic() - start)
+        return result
@@ -0,0 +1,87 @@
+"""
+Compressão negociada das respostas (brotli ou gzip).
+
+Estende o GZipMiddleware do Django:
+- respeita os pesos do Accept-Encoding ("br;q=0" recusa o brotli) e prefere
+  brotli quando o cliente aceita e o pacote `brotli` está instalado;
+- só comprime respostas a partir de COMPRESSION_MIN_SIZE bytes (abaixo
+  disso os cabeçalhos e a CPU custam mais do que o ganho);
+- respostas em streaming (exportações CSV) seguem em gzip, pedaço a pedaço,
+  como no GZipMiddleware.
+
+Fica abaixo do WhiteNoise na lista, então os estáticos (que o WhiteNoise já
+serve pré-comprimidos) não passam por aqui.
+"""
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # dependência opcional
+    brotli = None
+
+MIN_SIZE = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+BROTLI_QUALITY = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+
+compressed_bytes_total = metrics.counter(
+    'http_compressed_bytes_total', "Bytes das respostas antes/depois da compressão", ('encoding', 'stage')
+)
+
+
+def accepted_encodings(header):
+    """Codificações aceitas (q > 0) num Accept-Encoding."""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < MIN_SIZE:
+            return response
+        if response.has_header("Content-Encoding"):
+            return response
+
+        accepted = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if brotli is not None and not response.streaming and 'br' in accepted:
+            return self._brotli(response)
+        if 'gzip' not in accepted:
+            patch_vary_headers(response, ("Accept-Encoding",))
+            return response
+
+        original = None if response.streaming else len(response.content)
+        response = super().process_response(request, response)
+        if original is not None and response.get("Content-Encoding") == "gzip":
+            compressed_bytes_total.inc(original, encoding='gzip', stage='in')
+            compressed_bytes_total.inc(len(response.content), encoding='gzip', stage='out')
+        return response
+
+    def _brotli(self, response):
+        patch_vary_headers(response, ("Accept-Encoding",))
+        content = response.content
+        compressed = brotli.compress(content, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(content):
+            return response
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        compressed_bytes_total.inc(len(content), encoding='br', stage='in')
+        compressed_bytes_total.inc(len(compressed), encoding='br', stage='out')
+        return response
@@ -0,0 +1,101 @@
+"""
+Interpretador mínimo de expressões cron ("minuto hora dia mês dia-da-semana").
+
+Suporta '*', listas (1,15), intervalos (1-5) e passos (*/10, 8-18/2).
+Dia da semana: 0 ou 7 = domingo. Como no cron, quando dia do mês e dia da
+semana são restritos ao mesmo tempo basta um dos dois coincidir.
+"""
+from datetime import datetime, time as dt_time, timedelta
+
+from django.utils import timezone
+
+FIELD_RANGES = (
+    ('minuto', 0, 59),
+    ('hora', 0, 23),
+    ('dia', 1, 31),
+    ('mês', 1, 12),
+    ('dia da semana', 0, 7),
+)
+
+# Limite de busca: 4 anos cobrem qualquer combinação válida (ex.: 29/02)
+MAX_SEARCH_DAYS = 366 * 4
+
+
+class CronError(ValueError):
+    pass
+
+
+def _parse_field(text, name, low, high):
+    values = set()
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            if not step_text.isdigit() or int(step_text) == 0:
+                raise CronError(f"Passo inválido no campo {name}: '{step_text}'")
+            step = int(step_text)
+
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            if not (start_text.isdigit() and end_text.isdigit()):
+                raise CronError(f"Intervalo inválido no campo {name}: '{part}'")
+            start, end = int(start_text), int(end_text)
+        elif part.isdigit():
+            start = int(part)
+            end = high if step > 1 else start
+        else:
+            raise CronError(f"Valor inválido no campo {name}: '{part}'")
+
+        if start < low or end > high or start > end:
+            raise CronError(f"Campo {name} fora do intervalo {low}-{high}: '{part}'")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise CronError("A expressão cron deve ter 5 campos: minuto hora dia mês dia-da-semana")
+
+        fields = [_parse_field(part, *spec) for part, spec in zip(parts, FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        # cron usa 0 = domingo; datetime.weekday() usa 0 = segunda
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self.day_restricted = parts[2] != '*'
+        self.weekday_restricted = parts[4] != '*'
+        self.expression = expression
+
+    def __str__(self):
+        return self.expression
+
+    def _matches_day(self, day):
+        if day.month not in self.months:
+            return False
+        by_day = day.day in self.days
+        by_weekday = day.weekday() in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return by_day or by_weekday
+        return by_day and by_weekday
+
+    def next_after(self, moment):
+        """Próximo disparo estritamente depois de `moment` (no fuso local)."""
+        local = timezone.localtime(moment).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        tz = local.tzinfo
+        day = local.date()
+
+        for offset in range(MAX_SEARCH_DAYS):
+            current = day + timedelta(days=offset)
+            if not self._matches_day(current):
+                continue
+            earliest = (local.hour, local.minute) if offset == 0 else (0, 0)
+            for hour in sorted(self.hours):
+                if hour < earliest[0]:
+                    continue
+                for minute in sorted(self.minutes):
+                    if (hour, minute) < earliest:
+                        continue
+                    return timezone.make_aware(datetime.combine(current, dt_time(hour, minute)), tz)
+        return None
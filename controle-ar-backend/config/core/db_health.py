@@ -0,0 +1,73 @@
+"""
+Ciclo de vida das conexões com o banco fora do ciclo de requisição.
+
+O ouvinte MQTT roda para sempre em threads próprias (callback do paho e
+loop do líder). Nelas o Django nunca dispara request_started/finished, então:
+
+- close_old_connections() nunca roda: com conn_max_age=600 a conexão fica
+  aberta mesmo depois que o servidor a derrubou (reinício do Postgres,
+  failover, idle timeout do pooler) e a primeira escrita depois de um
+  período parado falha;
+- com DEBUG=True cada consulta vai para connection.queries (até 9000 por
+  conexão, com o SQL formatado) e é medida pelo cursor de debug.
+
+run() trata cada unidade de trabalho (uma mensagem, um lote da tempestade,
+um ciclo do loop) como uma requisição: antes e depois chama
+close_old_connections() (com CONN_HEALTH_CHECKS o Django testa a conexão
+antes de reutilizá-la) e reset_queries(), como o request_started faz. Com
+DEBUG=True as consultas da unidade continuam indo para connection.queries;
+o log só não cresce entre unidades, porque é esvaziado no fim de cada uma
+(mesmo quando ela falha). Se a unidade falhar com erro de banco e a conexão
+não responder a um SELECT 1, ela é fechada e a unidade roda de novo uma vez
+numa conexão nova.
+"""
+from django.db import DatabaseError, connections, reset_queries, close_old_connections
+
+from . import metrics
+
+reconnects_total = metrics.counter(
+    'listener_db_reconnects_total', "Conexões com o banco refeitas pelo ouvinte depois de caírem"
+)
+
+
+def _boundary():
+    # Início/fim de uma unidade, como request_started/finished; só mexe nas
+    # conexões desta thread (as das requisições não mudam)
+    reset_queries()
+    close_old_connections()
+
+
+def _broken(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        return False
+    except Exception:
+        return True
+
+
+def _reconnect_if_broken():
+    """Fecha as conexões que não respondem; retorna True se alguma foi fechada."""
+    closed = False
+    for connection in connections.all(initialized_only=True):
+        if connection.in_atomic_block or not _broken(connection):
+            continue
+        print(f"🔌 Conexão '{connection.alias}' com o banco caiu; reconectando")
+        connection.close()
+        reconnects_total.inc()
+        closed = True
+    return closed
+
+
+def run(func, *args, **kwargs):
+    """Executa func como uma unidade de trabalho fora de requisição (ver o topo)."""
+    _boundary()
+    try:
+        try:
+            return func(*args, **kwargs)
+        except DatabaseError:
+            if not _reconnect_if_broken():
+                raise
+            return func(*args, **kwargs)
+    finally:
+        _boundary()
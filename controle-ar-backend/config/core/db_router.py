@@ -0,0 +1,110 @@
+"""
+Roteamento de leituras para a réplica (DATABASE_REPLICA_URL).
+
+- Escritas sempre no primário ("default"); o ouvinte MQTT, o agendador e os
+  comandos de gerenciamento também leem do primário.
+- As ações somente leitura do DeviceViewSet (lista, detalhe, unregistered,
+  offline, agregados de uso, resumo e exportações) leem da réplica, via
+  ReplicaReadMixin. A escolha vale só enquanto a view roda: o alias é
+  desfeito no finalize_response, antes de uma StreamingHttpResponse ser
+  consumida, então quem itera depois (core/exports.py) fixa o banco com
+  .using() dentro da view.
+- Leitura logo depois da própria escrita: StickyPrimaryMiddleware marca o
+  usuário no cache por REPLICA_STICKY_SECONDS após qualquer POST/PUT/PATCH/
+  DELETE bem-sucedido; nesse intervalo as leituras dele voltam ao primário,
+  então a réplica atrasada não "desfaz" o que ele acabou de salvar. Com
+  vários workers o cache precisa ser compartilhado (REDIS_URL).
+- Dentro de transaction.atomic() as leituras ficam no primário.
+
+Sem réplica configurada nada muda: o alias de leitura é o próprio "default".
+Para testar localmente com dois SQLite, veja `manage.py sync_replica`.
+"""
+import contextvars
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.permissions import SAFE_METHODS
+
+from . import metrics
+
+REPLICA_ALIAS = 'replica'
+STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+reads_total = metrics.counter('db_routed_reads_total', "Requisições de leitura por banco", ('database',))
+
+_read_alias = contextvars.ContextVar('db_read_alias', default=None)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, REPLICA_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def _sticky_key(user_id):
+    return f"db_sticky_primary:{user_id}"
+
+
+def mark_sticky(user_id):
+    cache.set(_sticky_key(user_id), 1, STICKY_SECONDS)
+
+
+def is_sticky(user_id):
+    return cache.get(_sticky_key(user_id)) is not None
+
+
+class ReplicaReadMixin:
+    """
+    Para ViewSets: as ações em `replica_actions` leem da réplica nos métodos
+    seguros, do initial() ao finalize_response(). Querysets avaliados depois
+    disso (streaming) precisam de .using(queryset.db) ainda na view.
+    """
+    replica_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not replica_configured() or request.method not in SAFE_METHODS or self.action not in self.replica_actions:
+            return
+        user_id = getattr(request.user, 'pk', None)
+        if user_id is not None and is_sticky(user_id):
+            reads_total.inc(database=DEFAULT_DB_ALIAS)
+            return
+        self._replica_token = _read_alias.set(REPLICA_ALIAS)
+        reads_total.inc(database=REPLICA_ALIAS)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _read_alias.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class StickyPrimaryMiddleware(MiddlewareMixin):
+    """Depois de uma escrita do usuário, as leituras dele ficam no primário por um tempo."""
+
+    def process_response(self, request, response):
+        if not replica_configured() or request.method in SAFE_METHODS or response.status_code >= 400:
+            return response
+        # O DRF autentica na view (JWT) e repassa o usuário para o request do Django
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            mark_sticky(user.pk)
+        return response
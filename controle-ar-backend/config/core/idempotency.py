@@ -0,0 +1,148 @@
+"""
+Suporte ao cabeçalho Idempotency-Key nas ações que escrevem no banco e
+publicam no broker (criação de aparelho e `control`).
+
+A primeira requisição com uma chave reserva a linha e guarda a resposta;
+repetições com a mesma chave devolvem a resposta guardada sem executar a
+view de novo (nem escrita no Device, nem publicação MQTT).
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+KEY_TTL = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+PURGE_BATCH_SIZE = 5000
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _encode(value):
+    """Valores fora do JSON: arquivos enviados entram pelo conteúdo, não só pelo nome."""
+    if isinstance(value, UploadedFile):
+        digest = hashlib.sha256()
+        for chunk in value.chunks():
+            digest.update(chunk)
+        # A view lê o arquivo depois: volta ao início
+        value.seek(0)
+        return {"name": value.name, "size": value.size, "sha256": digest.hexdigest()}
+    return str(value)
+
+
+def _fingerprint(method, path, data):
+    body = json.dumps(data, sort_keys=True, default=_encode)
+    return _sha256(f"{method}:{path}:{body}")
+
+
+def validate_key(key):
+    """Mensagem de erro se a chave for inválida, senão None."""
+    if len(key) > MAX_KEY_LENGTH:
+        return f"Idempotency-Key deve ter no máximo {MAX_KEY_LENGTH} caracteres."
+    return None
+
+
+def reserve(user, key, method, path, data):
+    """
+    Tenta reservar a chave. Retorna (registro, None) quando a view deve rodar
+    ou (None, (corpo, status, replay)) quando a requisição já foi (ou está
+    sendo) tratada.
+    """
+    key_hash = _sha256(key)
+    fingerprint = _fingerprint(method, path, data)
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=KEY_TTL)
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user, key_hash=key_hash, fingerprint=fingerprint, expires_at=expires_at
+            )
+        return record, None
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(user=user, key_hash=key_hash).first()
+    if record is None or record.expires_at <= now:
+        # Expirada (ou apagada pela limpeza): remove a linha vencida e reserva de novo
+        IdempotencyKey.objects.filter(user=user, key_hash=key_hash, expires_at__lte=now).delete()
+        return reserve(user, key, method, path, data)
+
+    if record.fingerprint != fingerprint:
+        return None, (
+            {"error": "Idempotency-Key já utilizada com outra requisição."},
+            status.HTTP_422_UNPROCESSABLE_ENTITY, False
+        )
+    if record.status_code is None:
+        return None, (
+            {"error": "Requisição com esta Idempotency-Key ainda em processamento."},
+            status.HTTP_409_CONFLICT, False
+        )
+    return None, (record.response_body, record.status_code, True)
+
+
+def complete(record, status_code, body):
+    """Guarda a resposta; respostas de erro (4xx/5xx) liberam a chave para nova tentativa."""
+    if status_code >= 400:
+        # Nada foi feito (dados inválidos, broker fora): a mesma chave pode
+        # ser usada de novo, inclusive com o corpo corrigido
+        record.delete()
+        return
+    record.status_code = status_code
+    record.response_body = body
+    record.save(update_fields=['status_code', 'response_body'])
+
+
+def idempotent(view_method):
+    """Decorator para métodos de ViewSet que aceitam o cabeçalho Idempotency-Key."""
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        error = validate_key(key)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        record, stored = reserve(request.user, key, request.method, request.path, request.data)
+        if stored is not None:
+            body, status_code, replayed = stored
+            response = Response(body, status=status_code)
+            if replayed:
+                response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        complete(record, response.status_code, response.data)
+        return response
+
+    return wrapper
+
+
+def purge_expired(batch_size=PURGE_BATCH_SIZE):
+    """Remove as chaves expiradas em lotes. Retorna o total removido."""
+    now = timezone.now()
+    removed = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return removed
+        removed += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
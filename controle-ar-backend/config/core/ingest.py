@@ -0,0 +1,343 @@
+"""
+Modo tempestade do ouvinte MQTT (reconexão em massa).
+
+Depois de uma queda de energia todas as placas religam juntas: cada uma
+manda discovery + state (enviarTesteInicial) e, ao reassinar
+smart_ac/+/state, o broker entrega de uma vez todos os estados retidos.
+
+- StormDetector mede a taxa de mensagens numa janela curta (anel de
+  contadores por segundo) e entra em modo tempestade acima de
+  LISTENER_STORM_ENTER_RATE msg/s; sai só depois de LISTENER_STORM_EXIT_AFTER
+  segundos abaixo de LISTENER_STORM_EXIT_RATE (histerese, sem oscilar).
+- Em tempestade, o on_message só guarda a mensagem no IngestBuffer (a
+  última por device_id, com o discovery mesclado) e o loop do ouvinte grava
+  em lote com apply_batch(): uma consulta para carregar os aparelhos,
+  bulk_update/bulk_create e os eventos de uso em lote.
+- Trabalho não essencial (fila de saída: comandos offline e configuração
+  Wi-Fi) fica parado durante a tempestade e é solto com jitter ao final.
+
+Reconciliação (Reconciler): a cada conexão, o broker reentrega o estado
+retido de todas as placas. Em vez de uma consulta + save por placa, o
+ouvinte junta essas mensagens por LISTENER_RECONCILE_WINDOW segundos (ou até
+LISTENER_RECONCILE_QUIET segundos sem retidas) e aplica tudo num único
+apply_batch, contando quantas placas divergiam do banco.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Device
+from . import metrics, presence, shadow, summary, usage
+
+STORM_ENTER_RATE = getattr(settings, 'LISTENER_STORM_ENTER_RATE', 50)
+STORM_EXIT_RATE = getattr(settings, 'LISTENER_STORM_EXIT_RATE', 10)
+STORM_EXIT_AFTER = getattr(settings, 'LISTENER_STORM_EXIT_AFTER', 15)
+STORM_FLUSH_INTERVAL = getattr(settings, 'LISTENER_STORM_FLUSH_INTERVAL', 1.0)
+STORM_RELEASE_JITTER = getattr(settings, 'LISTENER_STORM_RELEASE_JITTER', 60)
+RECONCILE_WINDOW = getattr(settings, 'LISTENER_RECONCILE_WINDOW', 5.0)
+RECONCILE_QUIET = getattr(settings, 'LISTENER_RECONCILE_QUIET', 1.0)
+RATE_WINDOW = 5
+BATCH_SIZE = 500
+# Com o banco fora, o buffer não cresce sem limite: placas além disso são descartadas
+MAX_BUFFERED_DEVICES = 50000
+
+DEVICE_UPDATE_FIELDS = [
+    'is_online', 'last_seen', 'temperature', 'power', 'mode', 'name', 'brand',
+    'reported', 'reported_version', 'reported_at', 'updated_at', *presence.UNSTABLE_FIELDS,
+]
+
+storm_active = metrics.gauge('mqtt_ingest_storm', "1 enquanto o ouvinte está em modo tempestade")
+ingest_total = metrics.counter('mqtt_ingest_messages_total', "Mensagens de estado/discovery recebidas", ('path',))
+reconcile_total = metrics.counter(
+    'listener_reconcile_devices_total', "Placas vistas na reconciliação do estado retido", ('result',)
+)
+
+
+class RateMeter:
+    """Taxa (msg/s) dos últimos `window` segundos, num anel de contadores por segundo."""
+
+    def __init__(self, window=RATE_WINDOW):
+        self.window = window
+        self._counts = [0] * window
+        self._seconds = [0] * window
+        self._lock = threading.Lock()
+
+    def add(self, now=None, amount=1):
+        second = int(time.monotonic() if now is None else now)
+        slot = second % self.window
+        with self._lock:
+            if self._seconds[slot] != second:
+                self._seconds[slot] = second
+                self._counts[slot] = 0
+            self._counts[slot] += amount
+
+    def rate(self, now=None):
+        second = int(time.monotonic() if now is None else now)
+        with self._lock:
+            total = sum(
+                count for count, slot_second in zip(self._counts, self._seconds)
+                if second - slot_second < self.window
+            )
+        return total / self.window
+
+
+class StormDetector:
+    def __init__(self, enter_rate=STORM_ENTER_RATE, exit_rate=STORM_EXIT_RATE, exit_after=STORM_EXIT_AFTER):
+        self.enter_rate = enter_rate
+        self.exit_rate = exit_rate
+        self.exit_after = exit_after
+        self.meter = RateMeter()
+        self.active = False
+        self._calm_since = None
+
+    def record(self, now=None):
+        self.meter.add(now)
+
+    def update(self, now=None):
+        """Reavalia o modo. Retorna 'enter', 'exit' ou None."""
+        now = time.monotonic() if now is None else now
+        rate = self.meter.rate(now)
+        if not self.active:
+            if rate >= self.enter_rate:
+                self.active = True
+                self._calm_since = None
+                storm_active.set(1)
+                print(f"🌪️ Tempestade de reconexão detectada ({rate:.0f} msg/s): gravando em lote")
+                return 'enter'
+            return None
+
+        if rate >= self.exit_rate:
+            self._calm_since = None
+            return None
+        if self._calm_since is None:
+            self._calm_since = now
+        if now - self._calm_since >= self.exit_after:
+            self.active = False
+            storm_active.set(0)
+            print(f"🌤️ Fim da tempestade ({rate:.1f} msg/s)")
+            return 'exit'
+        return None
+
+
+class IngestBuffer:
+    """Última mensagem por device_id (o discovery é mesclado, não perdido)."""
+
+    def __init__(self, max_devices=MAX_BUFFERED_DEVICES):
+        self.max_devices = max_devices
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, data):
+        device_id = data["device_id"]
+        with self._lock:
+            merged = self._pending.get(device_id)
+            if merged is None:
+                if len(self._pending) >= self.max_devices:
+                    # A placa manda heartbeat a cada 15 s; o próximo entra no lote seguinte
+                    ingest_total.inc(path='dropped')
+                    return
+                merged = self._pending[device_id] = {"discovery": False}
+            if data.get("type") == "discovery":
+                merged["discovery"] = True
+                for field in ("name", "brand"):
+                    if field in data:
+                        merged[field] = data[field]
+            else:
+                # Estado retido reentregue depois de um mais novo não sobrescreve o buffer
+                incoming, buffered = shadow.report_time(data), shadow.report_time(merged)
+                if incoming is not None and buffered is not None and incoming < buffered:
+                    return
+                merged.update({key: value for key, value in data.items() if key not in ("name", "brand", "type")})
+                # nome/marca do state só valem se não houver discovery
+                for field in ("name", "brand"):
+                    if field in data and not merged["discovery"]:
+                        merged.setdefault(field, data[field])
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, messages):
+        """Devolve um lote que não pôde ser gravado; o que chegou depois tem prioridade."""
+        with self._lock:
+            for device_id, merged in messages.items():
+                self._pending.setdefault(device_id, merged)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+
+def apply_batch(messages):
+    """
+    Grava um lote {device_id: mensagem mesclada}. Mesmas regras de
+    handle_discovery/handle_status_update, mas com poucas consultas.
+    Retorna (atualizados, criados, divergentes); divergentes são as placas
+    cujo estado reportado diferia do banco.
+    """
+    if not messages:
+        return 0, 0, 0
+    now = timezone.now()
+    updated, previous_states, new_devices = [], [], []
+    drifted = 0
+
+    with transaction.atomic():
+        existing = Device.objects.in_bulk(list(messages), field_name='device_id')
+        for device_id, data in messages.items():
+            device = existing.get(device_id)
+            if device is None:
+                # Como no handle_discovery: cria aguardando o usuário completar
+                new_devices.append(Device(
+                    device_id=device_id,
+                    name=data.get("name", f"ESP32-{device_id[-6:]}"),
+                    brand=data.get("brand", "Carrier"),
+                    room="Não cadastrado",
+                    is_online=True,
+                    power=False,
+                    temperature=24,
+                    mode="cool",
+                    wifi_ssid="",
+                    wifi_password="",
+                    is_registered=False,
+                    is_configured=False,
+                    last_seen=now
+                ))
+                continue
+
+            previous = usage.snapshot(device)
+            result = shadow.apply_report(device, data, now)
+            if result == 'stale' and not data["discovery"]:
+                # Estado retido mais antigo que o gravado: não prova que a placa está viva
+                continue
+            presence.record(device, online=True, now=now)
+            if result == 'changed':
+                drifted += 1
+            filled = False
+            if not device.name and data.get("name"):
+                device.name = data["name"]
+                filled = True
+            if not device.brand and data.get("brand"):
+                device.brand = data["brand"]
+                filled = True
+            if result != 'changed' and not filled and device.is_online and device.last_seen \
+                    and now - device.last_seen < shadow.LAST_SEEN_RESOLUTION:
+                # Nada mudou e o last_seen é recente: nenhuma escrita
+                continue
+
+            device.is_online = True
+            device.last_seen = now
+            device.updated_at = now  # bulk_update não aplica auto_now
+            updated.append(device)
+            previous_states.append(previous)
+
+        Device.objects.bulk_update(updated, DEVICE_UPDATE_FIELDS, batch_size=BATCH_SIZE)
+        if new_devices:
+            Device.objects.bulk_create(new_devices, batch_size=BATCH_SIZE, ignore_conflicts=True)
+            # ignore_conflicts não devolve os ids: busca os criados para o histórico
+            created = list(Device.objects.filter(
+                device_id__in=[device.device_id for device in new_devices], state_events__isnull=True
+            ))
+        else:
+            created = []
+
+        usage.record_transitions(
+            list(zip(updated, previous_states)) + [(device, None) for device in created], at=now
+        )
+
+    # bulk_update não dispara post_save: invalida os resumos aqui
+    for user_id in {device.user_id for device in updated if device.user_id}:
+        summary.invalidate(user_id)
+
+    ingest_total.inc(len(messages), path='batch')
+    print(f"📦 Lote gravado: {len(updated)} atualizados, {len(created)} novos")
+    return len(updated), len(created), drifted
+
+
+class Reconciler:
+    """
+    Fase de reconciliação após cada conexão: enquanto ativa, o on_message só
+    guarda as mensagens (retidas ou não; o buffer fica com a mais nova de
+    cada placa) e o loop do ouvinte chama finish() quando a janela fecha.
+    """
+
+    def __init__(self, window=RECONCILE_WINDOW, quiet=RECONCILE_QUIET):
+        self.window = window
+        self.quiet = quiet
+        self.buffer = IngestBuffer()
+        self.active = False
+        self._started = self._last_retained = None
+        self._retained = 0
+        # add() e o fim da fase (drain + active=False) não podem se intercalar
+        self._lock = threading.Lock()
+
+    def start(self, now=None):
+        """Chamado no on_connect (também nas reconexões: a janela recomeça)."""
+        with self._lock:
+            self._started = time.monotonic() if now is None else now
+            self._last_retained = None
+            self._retained = 0
+            self.active = True
+
+    def add(self, data, retained, now=None):
+        """
+        Guarda a mensagem se a fase ainda estiver ativa. Retorna False se
+        finish() já a encerrou: a mensagem segue pelo caminho normal.
+        """
+        with self._lock:
+            if not self.active:
+                return False
+            self.buffer.add(data)
+            if retained:
+                self._retained += 1
+                self._last_retained = time.monotonic() if now is None else now
+        return True
+
+    def ready(self, now=None):
+        """Janela esgotada, ou o broker já parou de reentregar retidas."""
+        now = time.monotonic() if now is None else now
+        if now - self._started >= self.window:
+            return True
+        return self._last_retained is not None and now - self._last_retained >= self.quiet
+
+    def finish(self):
+        """
+        Aplica o retrato num único lote e volta ao modo normal. Retorna (divergentes, novos).
+
+        A fase só acaba depois de o retrato estar gravado: enquanto o lote
+        grava, o que chega continua no buffer, e não no caminho normal (que
+        gravaria um estado mais novo e depois seria sobrescrito pelo retrato
+        antigo). O que chegou nesse meio-tempo é aplicado já com a trava, e só
+        então o on_message volta a gravar direto.
+        """
+        with self._lock:
+            messages = self.buffer.drain()
+        try:
+            _, created, drifted = apply_batch(messages)
+        except Exception:
+            # Banco fora: o retrato volta para a próxima tentativa do loop
+            self.buffer.restore(messages)
+            raise
+        with self._lock:
+            late = self.buffer.drain()
+            try:
+                # Lote curto: o on_message espera por ele em vez de gravar em paralelo
+                _, late_created, late_drifted = apply_batch(late)
+            except Exception:
+                self.buffer.restore(late)
+                raise
+            self.active = False
+        created += late_created
+        drifted += late_drifted
+        devices = len(messages.keys() | late.keys())
+        reconcile_total.inc(drifted, result='drifted')
+        reconcile_total.inc(created, result='created')
+        reconcile_total.inc(devices - drifted - created, result='in_sync')
+        print(
+            f"🔁 Reconciliação: {devices} placas ({self._retained} estados retidos), "
+            f"{drifted} divergiam do banco, {created} novas"
+        )
+        return drifted, created
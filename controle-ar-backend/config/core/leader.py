@@ -0,0 +1,123 @@
+"""
+Eleição de líder entre processos: só quem segura a trava consome o MQTT.
+
+- Postgres: advisory lock de sessão (pg_try_advisory_lock) numa conexão
+  própria, fora do pool do Django. Se o processo morrer, a sessão cai e o
+  Postgres libera a trava na hora.
+- Arquivo: flock exclusivo num arquivo local (mesma máquina, ex. SQLite em
+  desenvolvimento). O sistema operacional libera quando o processo morre.
+
+Os candidatos tentam de novo a cada LISTENER_LEADER_RETRY segundos, então o
+failover leva no máximo esse intervalo depois que o líder cai.
+"""
+import os
+import tempfile
+import zlib
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LOCK_NAME = 'controle-ar:mqtt-listener'
+
+
+class PostgresAdvisoryLock:
+    def __init__(self, name=LOCK_NAME, using=DEFAULT_DB_ALIAS):
+        # advisory locks usam uma chave bigint; crc32 do nome é estável entre processos
+        self.key = zlib.crc32(name.encode())
+        self.using = using
+        self._connection = None
+
+    def acquire(self):
+        try:
+            if self._connection is None:
+                self._connection = connections.create_connection(self.using)
+            with self._connection.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", [self.key])
+                acquired = cursor.fetchone()[0]
+        except Exception as e:
+            print(f"❌ Erro ao disputar a liderança no Postgres: {e}")
+            self._discard()
+            return False
+        if not acquired:
+            self._discard()
+        return acquired
+
+    def is_held(self):
+        """Confere se a sessão (e com ela a trava) continua viva."""
+        if self._connection is None:
+            return False
+        try:
+            with self._connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except Exception as e:
+            print(f"❌ Conexão da trava de liderança perdida: {e}")
+            self._discard()
+            return False
+
+    def release(self):
+        if self._connection is None:
+            return
+        try:
+            with self._connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [self.key])
+        except Exception:
+            pass
+        self._discard()
+
+    def _discard(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+
+class FileLock:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'controle-ar-mqtt-listener.lock')
+        self._file = None
+
+    def acquire(self):
+        if fcntl is None:
+            raise RuntimeError("Trava por arquivo exige fcntl (Linux/macOS)")
+        handle = open(self.path, 'a+')
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        handle.seek(0)
+        handle.truncate()
+        handle.write(str(os.getpid()))
+        handle.flush()
+        self._file = handle
+        return True
+
+    def is_held(self):
+        return self._file is not None
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def get_lock(backend=None):
+    """LISTENER_LEADER_LOCK: 'postgres', 'file' ou 'auto' (Postgres se o banco for Postgres)."""
+    backend = backend or getattr(settings, 'LISTENER_LEADER_LOCK', 'auto')
+    if backend == 'auto':
+        backend = 'postgres' if connections[DEFAULT_DB_ALIAS].vendor == 'postgresql' else 'file'
+    if backend == 'postgres':
+        return PostgresAdvisoryLock()
+    return FileLock(getattr(settings, 'LISTENER_LOCK_FILE', None))
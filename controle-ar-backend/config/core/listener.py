@@ -0,0 +1,390 @@
+"""
+Ouvinte MQTT (estado e discovery das placas) + watchdog + filas de saída
+(comandos MQTT e e-mails de cadastro/redefinição de senha).
+
+Pode rodar de dois jeitos, sempre com eleição de líder (core/leader.py),
+então nunca há duas cópias gravando o mesmo estado:
+
+- Separado: `python mqtt_listener.py` (como antes).
+- Embutido no processo web: com MQTT_LISTENER_EMBEDDED=True, o
+  config/wsgi.py (ou asgi.py) chama start_embedded(), que sobe uma thread em
+  cada worker do gunicorn/uvicorn (e no runserver). Só o worker que pegar a trava conecta no
+  broker; os outros ficam de reserva e assumem se ele morrer.
+  Não use com `gunicorn --preload` (a thread e a conexão da trava não
+  sobrevivem ao fork).
+"""
+import json
+import os
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from .models import Device
+from .mqtt_helper import MQTT_BROKER, MQTT_PORT
+from .leader import get_lock
+from .ingest import (
+    StormDetector, IngestBuffer, Reconciler, apply_batch, ingest_total, STORM_FLUSH_INTERVAL, STORM_RELEASE_JITTER
+)
+from .presence import OFFLINE_AFTER
+from accounts import outbox as email_outbox
+
+from . import db_health, metrics, usage, outbox, presence, shadow
+
+# Tópicos
+TOPIC_STATE = "smart_ac/+/state"
+TOPIC_DISCOVERY = "smart_ac/discovery"
+
+# A cada ciclo curto esvazia a fila de saída; o watchdog roda a cada 30 segundos
+OUTBOX_INTERVAL = 5
+WATCHDOG_INTERVAL = 30
+EMAIL_INTERVAL = getattr(settings, 'EMAIL_OUTBOX_INTERVAL', 5)
+LEADER_RETRY = getattr(settings, 'LISTENER_LEADER_RETRY', 2)
+
+# Modo tempestade (core/ingest.py): em rajadas, as mensagens são gravadas em lote
+storm = StormDetector()
+ingest_buffer = IngestBuffer()
+# Reconciliação do estado retido a cada conexão (core/ingest.py)
+reconciler = Reconciler()
+
+failed_total = metrics.counter('listener_failed_messages_total', "Mensagens MQTT que não puderam ser gravadas")
+batch_failures_total = metrics.counter(
+    'listener_batch_failures_total', "Lotes da tempestade que falharam ao gravar (devolvidos ao buffer)"
+)
+
+
+# ============================================================
+#  ON CONNECT
+# ============================================================
+def on_connect(client, userdata, flags, rc):
+    print(f"✅ Ouvinte MQTT conectado!")
+    # Antes de assinar: o estado retido que o broker vai reentregar cai na reconciliação
+    reconciler.start()
+    client.subscribe(TOPIC_STATE)
+    client.subscribe(TOPIC_DISCOVERY)
+    print(f"📡 Monitorando status: {TOPIC_STATE}")
+    print(f"🔍 Monitorando discovery: {TOPIC_DISCOVERY}")
+
+
+# ============================================================
+#  ON MESSAGE
+# ============================================================
+def on_message(client, userdata, msg):
+    try:
+        payload = msg.payload.decode()
+        data = json.loads(payload)
+        device_id = data.get("device_id")
+
+        if not device_id:
+            print("⚠️ Payload sem device_id ignorado")
+            return
+
+        # Retrato inicial: gravado de uma vez pelo loop do ouvinte. Se a fase
+        # acabou entre o teste e o add(), a mensagem segue pelo caminho normal
+        if reconciler.active and reconciler.add(data, retained=bool(getattr(msg, 'retain', False))):
+            return
+
+        storm.record()
+        if storm.active:
+            # Só guarda; o loop do ouvinte grava o lote (uma linha por device_id)
+            ingest_buffer.add(data)
+            return
+
+        print(f"\n📩 Mensagem recebida de {device_id}")
+        ingest_total.inc(path='direct')
+
+        # Cada mensagem é uma "requisição": conexão verificada e log de consultas limpo
+        db_health.run(dispatch, data)
+
+    except Exception as e:
+        failed_total.inc()
+        print(f"❌ Erro ao processar mensagem: {e}")
+
+
+def dispatch(data):
+    msg_type = data.get("type")
+
+    if msg_type == "discovery":
+        handle_discovery(data)
+    else:
+        handle_status_update(data)
+
+
+# ============================================================
+#  DISCOVERY — quando a placa liga pela primeira vez
+# ============================================================
+def handle_discovery(data):
+    """Registra ou atualiza dispositivos novos detectados via MQTT."""
+    device_id = data["device_id"]
+    device_name = data.get("name", f"ESP32-{device_id[-6:]}")
+    brand = data.get("brand", "Carrier")
+
+    try:
+        device = Device.objects.filter(device_id=device_id).first()
+
+        if device:
+            previous_state = usage.snapshot(device)
+
+            # Atualiza status básico
+            presence.record(device, online=True)
+            device.is_online = True
+            device.last_seen = timezone.now()
+
+            # ⚠️ NÃO alterar dados definidos pelo usuário (room, wifi, etc)
+            # Atualizações seguras:
+            if not device.name:
+                device.name = device_name
+
+            if not device.brand:
+                device.brand = brand
+
+            # update_fields: não sobrescreve o desired gravado pelo control em paralelo
+            device.save(update_fields=['is_online', 'last_seen', 'name', 'brand', 'updated_at', *presence.UNSTABLE_FIELDS])
+            usage.record_transition(device, previous_state)
+            print(f"🔄 Dispositivo atualizado (discovery): {device_name} ({device_id})")
+
+        else:
+            # Criar dispositivo não cadastrado, aguardando usuário completar
+            device = Device.objects.create(
+                device_id=device_id,
+                name=device_name,
+                brand=brand,
+                room="Não cadastrado",
+                is_online=True,
+                power=False,
+                temperature=24,
+                mode="cool",
+                wifi_ssid="",
+                wifi_password="",
+                is_registered=False,      # só vira True quando o usuário completa o cadastro via API
+                is_configured=False,
+                last_seen=timezone.now()
+            )
+            usage.record_transition(device)
+            print(f"🆕 Novo dispositivo descoberto: {device_name} ({device_id})")
+
+    except DatabaseError:
+        # Sobe para o db_health.run(), que reconecta e tenta de novo
+        raise
+    except Exception as e:
+        print(f"❌ Erro ao processar discovery: {e}")
+
+
+# ============================================================
+#  STATUS UPDATE — atualizações normais do ESP32
+# ============================================================
+def handle_status_update(data):
+    """Atualizações periódicas de status enviadas pela placa."""
+    device_id = data["device_id"]
+
+    try:
+        device = Device.objects.filter(device_id=device_id).first()
+
+        if not device:
+            print(f"⚠️ Status recebido para device desconhecido → tratando como discovery")
+            handle_discovery(data)
+            return
+
+        previous_state = usage.snapshot(device)
+
+        # Recebe sempre "temp" do ESP32; o shadow compara com o último estado reportado
+        result = shadow.apply_report(device, data)
+        if result == 'stale':
+            print(f"⏪ Estado antigo de {device.device_id} descartado (timestamp {data.get('timestamp')})")
+            return
+        presence.record(device, online=True)
+        if result == 'unchanged':
+            # Heartbeat igual ao estado gravado: só renova o last_seen
+            shadow.touch(device)
+            return
+
+        device.is_online = True
+        device.last_seen = timezone.now()
+        device.save(update_fields=[*shadow.REPORT_UPDATE_FIELDS, *presence.UNSTABLE_FIELDS])
+        usage.record_transition(device, previous_state)
+
+        print(f"📊 Status atualizado: {device.name} — Temp: {device.temperature}°C  Power: {device.power}")
+
+    except DatabaseError:
+        # Sobe para o db_health.run(), que reconecta e tenta de novo
+        raise
+    except Exception as e:
+        print(f"❌ Erro ao atualizar status: {e}")
+
+
+# ============================================================
+#  CÃO DE GUARDA (WATCHDOG)
+# ============================================================
+def watchdog():
+    """Marca como offline as placas que não mandam sinal há mais de 60 segundos."""
+    now = timezone.now()
+    limite_tempo = now - OFFLINE_AFTER
+
+    # Placas instáveis ficam com o presence.settle(), sem uma escrita por queda
+    placas_fantasmas = Device.objects.filter(
+        is_online=True,
+        is_unstable=False,
+        last_seen__lt=limite_tempo
+    )
+
+    for placa in placas_fantasmas:
+        if presence.record(placa, online=False, now=now):
+            placa.save(update_fields=presence.UNSTABLE_FIELDS)
+            continue
+        previous_state = usage.snapshot(placa)
+        placa.is_online = False
+        placa.save(update_fields=['is_online', 'updated_at'])
+        usage.record_transition(placa, previous_state, source='watchdog')
+        print(f"⚠️ ALERTA: Placa {placa.name} ({placa.device_id}) caiu! Marcada como OFFLINE.")
+
+    presence.settle(now)
+
+
+# ============================================================
+#  LOOP COM ELEIÇÃO DE LÍDER
+# ============================================================
+class Listener:
+    def __init__(self, lock=None, hostname=MQTT_BROKER, port=MQTT_PORT):
+        self.lock = lock or get_lock()
+        self.hostname = hostname
+        self.port = port
+        self.client = None
+        self._stop = threading.Event()
+        self._last_outbox = self._last_watchdog = time.monotonic()
+
+    def _connect(self):
+        self.client = mqtt.Client()
+        self.client.on_connect = on_connect
+        self.client.on_message = on_message
+        # connect_async: se o broker estiver fora, o loop do paho fica tentando
+        self.client.connect_async(self.hostname, self.port, 60)
+        self.client.loop_start()
+
+    def _disconnect(self):
+        if self.client is None:
+            return
+        self.client.loop_stop()
+        self.client.disconnect()
+        self.client = None
+
+    def _flush_ingest(self):
+        messages = ingest_buffer.drain()
+        if not messages:
+            return
+        try:
+            db_health.run(apply_batch, messages)
+        except Exception as e:
+            # Banco fora em plena tempestade: o lote volta ao buffer para o próximo ciclo
+            ingest_buffer.restore(messages)
+            batch_failures_total.inc()
+            print(f"❌ Erro ao gravar o lote de {len(messages)} mensagens (devolvido ao buffer): {e}")
+
+    def _run_step(self, label, func, *args):
+        try:
+            return db_health.run(func, *args)
+        except Exception as e:
+            print(f"❌ Erro {label}: {e}")
+
+    def tick(self, now=None):
+        """Um ciclo do líder: reconciliação, lote da tempestade, fila de saída e watchdog."""
+        now = time.monotonic() if now is None else now
+        if reconciler.active:
+            if not reconciler.ready(now):
+                # O watchdog não pode marcar offline quem está no retrato ainda não gravado
+                return
+            self._run_step("na reconciliação do estado retido", reconciler.finish)
+        transition = storm.update()
+        if storm.active or transition == 'exit':
+            self._flush_ingest()
+        if transition == 'exit':
+            # Solta comandos e configurações Wi-Fi represados aos poucos
+            spread = self._run_step("ao liberar a fila de saída", outbox.spread_pending, STORM_RELEASE_JITTER)
+            print(f"📤 {spread or 0} mensagens da fila liberadas ao longo de {STORM_RELEASE_JITTER}s")
+        if storm.active:
+            # Fila de saída e watchdog esperam a tempestade passar
+            return
+
+        if now - self._last_outbox >= OUTBOX_INTERVAL:
+            self._last_outbox = now
+            self._run_step("ao esvaziar a fila de saída", outbox.flush)
+
+        if now - self._last_watchdog >= WATCHDOG_INTERVAL:
+            self._last_watchdog = now
+            self._run_step("no watchdog", watchdog)
+
+    def _email_loop(self, stop):
+        """
+        Esvazia a fila de e-mails (OTP, redefinição de senha) enquanto for líder.
+        Roda numa thread própria: o SMTP pode levar segundos e não pode atrasar
+        o ciclo do MQTT. O manage.py send_emails faz o mesmo como processo à parte.
+        """
+        try:
+            while not stop.wait(EMAIL_INTERVAL):
+                self._run_step("ao enviar a fila de e-mails", email_outbox.flush)
+        finally:
+            connections.close_all()
+
+    def _lead(self):
+        print("\n--- INICIANDO SISTEMA DE ESCUTA MQTT ---\n")
+        self._connect()
+        print("⏱️ Iniciando o Cão de Guarda (Watchdog) de conexões...")
+        emails_stop = threading.Event()
+        emails = threading.Thread(target=self._email_loop, args=(emails_stop,), name='email-outbox', daemon=True)
+        emails.start()
+        try:
+            self._last_outbox = self._last_watchdog = time.monotonic()
+            while not self._stop.wait(STORM_FLUSH_INTERVAL):
+                if not self.lock.is_held():
+                    print("⚠️ Liderança perdida; parando o ouvinte MQTT")
+                    return
+                self.tick()
+        finally:
+            emails_stop.set()
+            self._disconnect()
+            if reconciler.active:
+                self._run_step("na reconciliação do estado retido", reconciler.finish)
+            self._flush_ingest()
+
+    def run(self):
+        """Disputa a liderança até stop(); enquanto líder, consome o MQTT."""
+        announced = False
+        while not self._stop.is_set():
+            if self.lock.acquire():
+                print(f"👑 Processo {os.getpid()} é o líder do ouvinte MQTT")
+                announced = False
+                try:
+                    self._lead()
+                finally:
+                    self.lock.release()
+            elif not announced:
+                print(f"⏳ Processo {os.getpid()} aguardando a liderança do ouvinte MQTT")
+                announced = True
+            self._stop.wait(LEADER_RETRY)
+
+    def stop(self):
+        self._stop.set()
+
+    def start_in_background(self):
+        thread = threading.Thread(target=self.run, name='mqtt-listener', daemon=True)
+        thread.start()
+        return thread
+
+
+_embedded = None
+
+
+def start_embedded():
+    """
+    Sobe o ouvinte numa thread do processo web. Chamado só pelos pontos de
+    entrada do servidor (config/wsgi.py e config/asgi.py), então migrate,
+    shell, test e o próprio mqtt_listener.py nunca sobem uma cópia embutida.
+    """
+    global _embedded
+    if _embedded is not None or not getattr(settings, 'MQTT_LISTENER_EMBEDDED', False):
+        return _embedded
+    _embedded = Listener()
+    _embedded.start_in_background()
+    return _embedded
@@ -0,0 +1,169 @@
+import math
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import analytics
+from core.analytics import np
+
+
+def synthetic_chunks(devices, per_device, start, end, chunk_rows, seed=42):
+    """
+    Lotes colunares sintéticos no formato de analytics.iter_chunks: cada
+    aparelho tem um setpoint preferido e uma taxa de uso; alguns gastam muito.
+    """
+    rng = np.random.default_rng(seed)
+    span = end - start
+    step = max(1, chunk_rows // per_device)
+    for first in range(0, devices, step):
+        count = min(step, devices - first)
+        duty = rng.uniform(0.2, 0.7, count)
+        duty[rng.random(count) < 0.02] = 0.98
+        preferred = rng.integers(16, 27, count)
+        ts = start + np.sort(rng.random((count, per_device)), axis=1) * span
+        yield {
+            'device': np.repeat(np.arange(first, first + count, dtype=np.int32), per_device),
+            'ts': ts.ravel(),
+            'on': (rng.random((count, per_device)) < duty[:, None]).ravel(),
+            'temperature': np.clip(preferred[:, None] + rng.integers(-1, 2, (count, per_device)), 16, 30)
+                             .astype(np.int16).ravel(),
+            'mode': rng.choice(len(analytics.MODES), (count, per_device), p=[0.7, 0.05, 0.1, 0.1, 0.05])
+                       .astype(np.int8).ravel(),
+            'room': np.repeat(np.arange(first, first + count, dtype=np.int32) % 25, per_device),
+        }
+
+
+def python_reference(fleet, chunk):
+    """Mesmo cálculo do FleetAnalytics.add, amostra por amostra (a referência lenta)."""
+    on_seconds, kwh, low = defaultdict(float), defaultdict(float), defaultdict(float)
+    rows = list(zip(*(chunk[name].tolist() for name in ('device', 'ts', 'on', 'temperature', 'mode'))))
+    factors = {i: analytics.MODE_FACTORS.get(mode, 1.0) for i, mode in enumerate(analytics.MODES)}
+    for i, (device, ts, on, temperature, mode) in enumerate(rows):
+        following = rows[i + 1][1] if i + 1 < len(rows) and rows[i + 1][0] == device else fleet.end
+        begin = min(max(ts, fleet.start), fleet.end)
+        finish = min(max(following, fleet.start), fleet.end)
+        if not on or finish <= begin:
+            continue
+        seconds = finish - begin
+        setpoint = 1.0
+        if analytics.MODES[mode] == 'cool':
+            setpoint = 1 + analytics.SETPOINT_STEP * (analytics.SETPOINT_REFERENCE - temperature)
+        elif analytics.MODES[mode] == 'heat':
+            setpoint = 1 + analytics.SETPOINT_STEP * (temperature - analytics.HEAT_REFERENCE)
+        on_seconds[device] += seconds
+        kwh[device] += seconds / 3600 * fleet.kw[device] * factors[mode] * max(setpoint, analytics.MIN_SETPOINT_FACTOR)
+        if temperature <= fleet.low_setpoint:
+            moment = begin
+            while moment < finish:
+                day = math.floor((moment + fleet.offset) / analytics.DAY)
+                boundary = (day + 1) * analytics.DAY - fleet.offset
+                low[(device, day)] += min(finish, boundary) - moment
+                moment = boundary
+    low_days = defaultdict(int)
+    for (device, _day), seconds in low.items():
+        if seconds >= fleet.low_seconds:
+            low_days[device] += 1
+    return on_seconds, kwh, low_days
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark das análises da frota (core/analytics.py): --samples amostras "
+        "sintéticas em lotes colunares pelo mesmo FleetAnalytics, com tempo e pico "
+        "de memória; compara com o cálculo amostra por amostra em Python (e confere "
+        "que os resultados batem) e mede a conversão de linhas do banco em colunas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=10_000_000)
+        parser.add_argument('--devices', type=int, default=10_000)
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--chunk-rows', type=int, default=analytics.CHUNK_ROWS)
+        parser.add_argument('--python-samples', type=int, default=200_000,
+                            help="Amostras do cálculo de referência em Python")
+        parser.add_argument('--loader-rows', type=int, default=500_000,
+                            help="Linhas convertidas em colunas na medição da leitura")
+
+    def handle(self, *args, **options):
+        if not analytics.available():
+            raise CommandError("Análises indisponíveis: instale o numpy")
+        per_device = options['samples'] // options['devices']
+        if per_device < 1:
+            raise CommandError("--samples deve ser pelo menos --devices")
+        end = timezone.now()
+        start = end - timedelta(days=options['days'])
+        devices = [
+            {'pk': i, 'device_id': f"bench-{i}", 'name': '', 'room': f"Sala {i % 25}", 'brand': ''}
+            for i in range(options['devices'])
+        ]
+
+        # Vetorizado: só o add() entra no tempo; o pico inclui o lote gerado
+        fleet = analytics.FleetAnalytics(devices, start, end)
+        fleet.rooms.update({f"Sala {i}": i for i in range(25)})
+        elapsed = 0.0
+        tracemalloc.start()
+        for chunk in synthetic_chunks(options['devices'], per_device, fleet.start, fleet.end, options['chunk_rows']):
+            began = time.perf_counter()
+            fleet.add(chunk)
+            elapsed += time.perf_counter() - began
+        began = time.perf_counter()
+        report = fleet.result()
+        elapsed += time.perf_counter() - began
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rate = fleet.samples / elapsed
+
+        self.stdout.write(
+            f"\n⚡ NumPy: {fleet.samples:,} amostras, {options['devices']:,} aparelhos, {options['days']} dias "
+            f"em {elapsed:.2f}s ({rate / 1e6:.1f} M amostras/s), pico de {peak / 2**20:.0f} MiB "
+            f"(lotes de {options['chunk_rows']:,} linhas)"
+        )
+        self.stdout.write(
+            f"   {report['total_kwh']:,.0f} kWh, {len(report['low_setpoint']['devices'])} aparelhos em 16 °C "
+            f"por 8 h/dia, {len(report['outliers'])} outliers"
+        )
+
+        # Referência em Python sobre os primeiros aparelhos, conferida contra o vetorizado
+        subset_devices = max(1, options['python_samples'] // per_device)
+        chunk = next(synthetic_chunks(subset_devices, per_device, fleet.start, fleet.end, subset_devices * per_device))
+        subset = analytics.FleetAnalytics(devices[:subset_devices], start, end)
+        subset.rooms.update({f"Sala {i}": i for i in range(25)})
+        began = time.perf_counter()
+        subset.add(chunk)
+        vector_elapsed = time.perf_counter() - began
+        began = time.perf_counter()
+        on_seconds, kwh, low_days = python_reference(subset, chunk)
+        python_elapsed = time.perf_counter() - began
+        matches = (
+            np.allclose(subset.on_seconds, [on_seconds[i] for i in range(subset_devices)])
+            and np.allclose(subset.kwh, [kwh[i] for i in range(subset_devices)])
+            and np.array_equal(subset.low_days, [low_days[i] for i in range(subset_devices)])
+        )
+        python_rate = len(chunk['ts']) / python_elapsed
+        self.stdout.write(
+            f"\n🐍 Python amostra por amostra: {len(chunk['ts']):,} amostras em {python_elapsed:.2f}s "
+            f"({python_rate / 1e6:.2f} M amostras/s; {fleet.samples / python_rate:.0f}s estimados para "
+            f"{fleet.samples:,}) vs {vector_elapsed:.3f}s no NumPy — {python_elapsed / vector_elapsed:.0f}x"
+        )
+        style = self.style.SUCCESS if matches else self.style.ERROR
+        self.stdout.write(style(f"   Resultados iguais ao vetorizado: {'sim' if matches else 'NÃO'}"))
+
+        # Leitura: converter as linhas do values_list (tuplas com datetime) em colunas
+        moment = datetime.fromtimestamp(fleet.start, dt_timezone.utc)
+        rows = [
+            (i % options['devices'], moment + timedelta(seconds=i), True, i % 2 == 0, 22, 'cool', f"Sala {i % 25}")
+            for i in range(options['loader_rows'])
+        ]
+        index = {i: i for i in range(options['devices'])}
+        began = time.perf_counter()
+        analytics._columns(rows, index, {})
+        loader_elapsed = time.perf_counter() - began
+        loader_rate = len(rows) / loader_elapsed
+        self.stdout.write(
+            f"\n📥 Linhas → colunas: {len(rows):,} em {loader_elapsed:.2f}s ({loader_rate / 1e6:.1f} M linhas/s; "
+            f"{fleet.samples / loader_rate:.0f}s para {fleet.samples:,}, fora a consulta ao banco)"
+        )
@@ -0,0 +1,85 @@
+import json
+import time
+import uuid
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from core.models import Device
+from core.renderers import ORJSONRenderer
+from core.serializers import DeviceSerializer
+from core.views import DeviceViewSet
+from core import compression
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a lista de dispositivos (GET /api/devices/) com N aparelhos: CPU do "
+        "renderer JSON (stdlib x orjson) e bytes enviados (sem compressão, gzip, brotli)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=5000)
+        parser.add_argument('--rounds', type=int, default=10)
+
+    def handle(self, *args, **options):
+        rounds = options['rounds']
+        user = User.objects.create_user(
+            email=f"bench-{uuid.uuid4().hex[:8]}@bench.local", full_name="Benchmark", password=uuid.uuid4().hex
+        )
+        Device.objects.bulk_create([
+            Device(
+                device_id=f"bench-{user.pk}-{i:05d}", name=f"Ar {i}", room=f"Cômodo {i % 25}", user=user,
+                is_registered=True, is_online=i % 3 != 0, power=i % 2 == 0, temperature=16 + i % 15,
+                reported={"power": i % 2 == 0, "temperature": 16 + i % 15, "mode": "cool"},
+            )
+            for i in range(options['devices'])
+        ], batch_size=500)
+        headers = {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+        try:
+            data = DeviceSerializer(Device.objects.filter(user=user), many=True).data
+            self.stdout.write(f"\n{len(data)} dispositivos, {rounds} rodadas\n")
+
+            stdlib = self._render_time(JSONRenderer(), data, rounds)
+            fast = self._render_time(ORJSONRenderer(), data, rounds)
+            if json.loads(stdlib[1]) != json.loads(fast[1]):
+                self.stderr.write(self.style.ERROR("⚠️ orjson e stdlib geraram JSON diferente"))
+            self.stdout.write("Renderer (só a serialização para JSON):")
+            self.stdout.write(f"  {'json (stdlib)':<24} {stdlib[0] * 1000:8.1f} ms")
+            self.stdout.write(f"  {'orjson':<24} {fast[0] * 1000:8.1f} ms  ({stdlib[0] / fast[0]:.1f}x)")
+
+            self.stdout.write("\nRequisição completa (GET /api/devices/):")
+            client = Client()
+            cases = [
+                ("antes: stdlib, sem compressão", [JSONRenderer], "identity"),
+                ("orjson, sem compressão", [ORJSONRenderer], "identity"),
+                ("orjson + gzip", [ORJSONRenderer], "gzip"),
+            ]
+            if compression.brotli is not None:
+                cases.append(("orjson + brotli", [ORJSONRenderer], "br, gzip"))
+            else:
+                self.stdout.write("  (pacote brotli não instalado: só gzip)")
+            for label, renderers, accept in cases:
+                with mock.patch.object(DeviceViewSet, 'renderer_classes', renderers):
+                    elapsed, size = self._request_time(client, headers, accept, rounds)
+                self.stdout.write(f"  {label:<32} {elapsed * 1000:8.1f} ms  {size / 1024:9.1f} KiB")
+        finally:
+            user.delete()
+
+    def _render_time(self, renderer, data, rounds):
+        start = time.process_time()
+        for _ in range(rounds):
+            body = renderer.render(data, 'application/json', {})
+        return (time.process_time() - start) / rounds, body
+
+    def _request_time(self, client, headers, accept, rounds):
+        client.get("/api/devices/", headers={**headers, "Accept-Encoding": accept})
+        start = time.process_time()
+        for _ in range(rounds):
+            response = client.get("/api/devices/", headers={**headers, "Accept-Encoding": accept})
+        return (time.process_time() - start) / rounds, len(response.content)
@@ -0,0 +1,96 @@
+import asyncio
+import contextlib
+import io
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from asgiref.sync import ThreadSensitiveContext
+from django.core.management.base import BaseCommand
+from django.test import Client, AsyncClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from core.models import Device
+from core import mqtt_async
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a vazão do `control` síncrono (WSGI, pool de threads) com a "
+        "versão assíncrona (ASGI), simulando a latência do broker. No SQLite as "
+        "escritas são serializadas; use o Postgres para números representativos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help="Total de comandos por rodada")
+        parser.add_argument('--threads', type=int, default=8, help="Threads do worker WSGI")
+        parser.add_argument('--concurrency', type=int, default=200, help="Requisições simultâneas no ASGI")
+        parser.add_argument('--broker-latency', type=float, default=0.05,
+                            help="Tempo (s) simulado de cada publicação no broker")
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        latency = options['broker_latency']
+
+        user = User.objects.create_user(
+            email=f"bench-{uuid.uuid4().hex[:8]}@bench.local", full_name="Benchmark", password=uuid.uuid4().hex
+        )
+        device = Device.objects.create(
+            device_id=f"bench-{uuid.uuid4().hex[:8]}", name="Benchmark", room="Bench", user=user, is_registered=True
+        )
+        token = str(RefreshToken.for_user(user).access_token)
+        headers = {"Authorization": f"Bearer {token}"}
+        body = {"power": True, "temp": 22, "mode": "cool"}
+
+        async def fake_async_publish(*args, **kwargs):
+            await asyncio.sleep(latency)
+
+        try:
+            with mock.patch('paho.mqtt.publish.single', side_effect=lambda *a, **k: time.sleep(latency)), \
+                 mock.patch.object(mqtt_async.publisher, 'publish', side_effect=fake_async_publish), \
+                 contextlib.redirect_stdout(io.StringIO()):
+                wsgi = self._run_wsgi(f"/api/devices/{device.pk}/control/", body, headers, total, options['threads'])
+                asgi = asyncio.run(self._run_asgi(
+                    f"/api/async/devices/{device.pk}/control/", body, headers, total, options['concurrency']
+                ))
+        finally:
+            user.delete()
+
+        self.stdout.write(f"\nLatência simulada do broker: {latency * 1000:.0f} ms, {total} comandos\n")
+        for label, (elapsed, failures) in (
+            (f"WSGI ({options['threads']} threads)", wsgi),
+            (f"ASGI (até {options['concurrency']} simultâneas)", asgi),
+        ):
+            self.stdout.write(
+                f"{label:<32} {elapsed:7.2f}s  {total / elapsed:8.1f} req/s  falhas: {failures}"
+            )
+
+    def _run_wsgi(self, url, body, headers, total, threads):
+        local = threading.local()
+
+        def one(_):
+            if not hasattr(local, 'client'):
+                local.client = Client(raise_request_exception=False)
+            return local.client.post(url, body, content_type='application/json', headers=headers).status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            statuses = list(pool.map(one, range(total)))
+        return time.perf_counter() - start, sum(1 for code in statuses if code != 200)
+
+    async def _run_asgi(self, url, body, headers, total, concurrency):
+        client = AsyncClient(raise_request_exception=False)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            # Como o ASGIHandler real: cada requisição tem seu próprio contexto de thread do ORM
+            async with semaphore, ThreadSensitiveContext():
+                response = await client.post(url, body, content_type='application/json', headers=headers)
+                return response.status_code
+
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(one() for _ in range(total)))
+        return time.perf_counter() - start, sum(1 for code in statuses if code != 200)
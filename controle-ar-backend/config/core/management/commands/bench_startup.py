@@ -0,0 +1,142 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Device
+
+BENCH_DEVICE_ID = "bench-startup"
+
+# Módulos que hoje são importados só no primeiro uso; com --eager o processo
+# filho importa tudo junto com a aplicação, como era antes
+LAZY_MODULES = ('paho.mqtt.publish', 'paho.mqtt.client', 'rest_framework_simplejwt.tokens')
+
+# Cada script roda num processo novo ({constants} vira a tupla (EAGER, DEVICE_ID))
+# e imprime na última linha
+# {"ready": s, "first": s} contados desde a primeira linha do script
+_PRELUDE = """
+import time
+_start = time.perf_counter()
+import json, os, sys
+EAGER, DEVICE_ID = {constants}
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+"""
+
+_WSGI = _PRELUDE + """
+import io
+from config.wsgi import application
+for _name in EAGER:
+    __import__(_name)
+_ready = time.perf_counter()
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': '/api/health/', 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'http',
+    'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+}
+status = []
+b''.join(application(environ, lambda s, headers, exc_info=None: status.append(s)))
+assert status[0].startswith('200'), status
+print(json.dumps({"ready": _ready - _start, "first": time.perf_counter() - _start}))
+"""
+
+_ASGI = _PRELUDE + """
+import asyncio
+from config.asgi import application
+for _name in EAGER:
+    __import__(_name)
+_ready = time.perf_counter()
+scope = {
+    'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+    'path': '/api/health/', 'raw_path': b'/api/health/', 'query_string': b'', 'root_path': '',
+    'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+}
+messages = []
+requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+async def receive():
+    if requests:
+        return requests.pop()
+    await asyncio.Event().wait()  # cliente conectado até o Django cancelar a espera
+
+async def send(message):
+    messages.append(message)
+
+asyncio.run(application(scope, receive, send))
+assert messages[0]['status'] == 200, messages[0]
+print(json.dumps({"ready": _ready - _start, "first": time.perf_counter() - _start}))
+"""
+
+# Primeira mensagem: status de uma placa já cadastrada, pelo mesmo on_message
+# que o cliente paho chama (sem broker: o tempo de conexão depende da rede)
+_LISTENER = _PRELUDE + """
+import contextlib, io
+from types import SimpleNamespace
+import django
+django.setup()
+from core import listener
+from core.models import Device
+for _name in EAGER:
+    __import__(_name)
+_ready = time.perf_counter()
+payload = json.dumps({"device_id": DEVICE_ID, "power": True, "temp": 22, "timestamp": int(time.time())})
+with contextlib.redirect_stdout(io.StringIO()):
+    listener.on_message(None, None, SimpleNamespace(topic='smart_ac/status', payload=payload.encode()))
+assert Device.objects.get(device_id=DEVICE_ID).power
+print(json.dumps({"ready": _ready - _start, "first": time.perf_counter() - _start}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Cold start: cada rodada sobe um processo Python novo e mede até o "
+        "wsgi.py/asgi.py atender a primeira requisição (GET /api/health/) e até o "
+        "ouvinte MQTT gravar a primeira mensagem. --eager importa na partida os "
+        "módulos que hoje são tardios, para comparar com o comportamento anterior."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--eager', action='store_true', help="Importa já na partida: " + ", ".join(LAZY_MODULES))
+
+    def handle(self, *args, **options):
+        eager = LAZY_MODULES if options['eager'] else ()
+        Device.objects.update_or_create(
+            device_id=BENCH_DEVICE_ID,
+            defaults={"name": "Benchmark", "room": "Benchmark", "is_registered": False, "power": False},
+        )
+        constants = repr((eager, BENCH_DEVICE_ID))
+        cases = [
+            ("wsgi.py → 1ª requisição", _WSGI.replace('{constants}', constants)),
+            ("asgi.py → 1ª requisição", _ASGI.replace('{constants}', constants)),
+            ("ouvinte → 1ª mensagem", _LISTENER.replace('{constants}', constants)),
+        ]
+        try:
+            self.stdout.write(f"\n{options['rounds']} rodadas (mediana){' — imports na partida (--eager)' if eager else ''}\n")
+            self.stdout.write(f"{'':<26} {'processo':>10} {'pronto':>10} {'1º atendimento':>15}")
+            for label, script in cases:
+                results = [self._run(script) for _ in range(options['rounds'])]
+                process, ready, first = (statistics.median(values) for values in zip(*results))
+                self.stdout.write(f"{label:<26} {process * 1000:>8.0f}ms {ready * 1000:>8.0f}ms {first * 1000:>13.0f}ms")
+            self.stdout.write(
+                "\nprocesso = do fork até o fim (inclui o interpretador); pronto = aplicação "
+                "carregada; 1º atendimento = pronto + primeira requisição/mensagem."
+            )
+        finally:
+            Device.objects.filter(device_id=BENCH_DEVICE_ID).delete()
+
+    def _run(self, script):
+        env = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1', 'MQTT_LISTENER_EMBEDDED': 'False'}
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        process = time.perf_counter() - start
+        if result.returncode != 0:
+            raise CommandError(f"Processo de teste falhou:\n{result.stderr[-2000:]}")
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        return process, timings['ready'], timings['first']
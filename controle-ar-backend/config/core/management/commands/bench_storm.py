@@ -0,0 +1,107 @@
+import contextlib
+import io
+import json
+import time
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from accounts.models import User
+from core.models import Device
+from core import listener
+from core.ingest import IngestBuffer, apply_batch, BATCH_SIZE
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Simula a reconexão em massa depois de uma queda de energia: cada placa "
+        "manda discovery + state e o broker reentrega o estado retido. Compara "
+        "o processamento mensagem a mensagem com o modo tempestade (lote)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=5000, help="Placas religando juntas")
+        parser.add_argument('--new', type=float, default=0.02, help="Fração de placas ainda não cadastradas")
+
+    def handle(self, *args, **options):
+        total = options['devices']
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(
+            email=f"bench-{tag}@bench.local", full_name="Benchmark", password=uuid.uuid4().hex
+        )
+        known = total - int(total * options['new'])
+
+        try:
+            results = {}
+            for key, label, run in (
+                ('direct', "Mensagem a mensagem", self._run_direct),
+                ('storm', "Modo tempestade (lote)", self._run_storm),
+            ):
+                prefix = f"bench-{tag}-{key}"
+                self._seed(user, prefix, known)
+                messages = self._messages(prefix, total)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results[label] = self._measure(run, messages)
+                online = Device.objects.filter(device_id__startswith=prefix, is_online=True).count()
+                results[label] += (online,)
+        finally:
+            Device.objects.filter(device_id__startswith=f"bench-{tag}").delete()
+            user.delete()
+
+        self.stdout.write(f"\n{total} placas ({total - known} novas), {total * 3} mensagens\n")
+        for label, (elapsed, queries, online) in results.items():
+            self.stdout.write(
+                f"{label:<24} {elapsed:7.2f}s  {total * 3 / elapsed:9.0f} msg/s  "
+                f"{queries:7d} consultas  online: {online}"
+            )
+
+    def _seed(self, user, prefix, count):
+        last_seen = timezone.now() - timedelta(minutes=10)
+        Device.objects.bulk_create([
+            Device(
+                device_id=f"{prefix}-{i:05d}", name=f"Bench {i}", room=f"Sala {i % 20}", user=user,
+                is_registered=True, is_configured=True, is_online=False, last_seen=last_seen
+            )
+            for i in range(count)
+        ], batch_size=BATCH_SIZE)
+
+    def _messages(self, prefix, total):
+        # Mesma ordem que o broker entrega: discovery, state inicial e o state retido repetido
+        messages = []
+        for i in range(total):
+            device_id = f"{prefix}-{i:05d}"
+            state = {"device_id": device_id, "temp": 22 + i % 5, "power": i % 3 == 0, "mode": "cool"}
+            messages.append({"device_id": device_id, "type": "discovery", "name": f"ESP32-{i}", "brand": "Carrier"})
+            messages.append(state)
+            messages.append(dict(state))
+        return [SimpleNamespace(payload=json.dumps(message).encode()) for message in messages]
+
+    def _measure(self, run, messages):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            run(messages)
+        return time.perf_counter() - start, counter.count
+
+    def _run_direct(self, messages):
+        for message in messages:
+            listener.on_message(None, None, message)
+
+    def _run_storm(self, messages):
+        buffer = IngestBuffer()
+        for message in messages:
+            buffer.add(json.loads(message.payload.decode()))
+        apply_batch(buffer.drain())
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.presence import flapping_devices, REPORT_DAYS
+
+
+class Command(BaseCommand):
+    help = "Lista as placas que oscilam entre online e offline (provável Wi-Fi fraco)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=REPORT_DAYS, help="Episódios dos últimos N dias")
+
+    def handle(self, *args, **options):
+        devices = flapping_devices(days=options['days']).select_related('user')
+        if not devices:
+            self.stdout.write(self.style.SUCCESS(f"✅ Nenhuma placa oscilou nos últimos {options['days']} dias"))
+            return
+
+        self.stdout.write(f"{'Placa':<24} {'Cômodo':<16} {'Dono':<28} {'Episódios':>9}  Situação")
+        for device in devices:
+            if device.is_unstable:
+                situation = f"🌀 instável desde {timezone.localtime(device.unstable_since):%d/%m %H:%M}"
+            else:
+                situation = f"última oscilação {timezone.localtime(device.last_unstable_at):%d/%m %H:%M}"
+            owner = device.user.email if device.user else "-"
+            self.stdout.write(
+                f"{device.device_id:<24} {device.room[:16]:<16} {owner[:28]:<28} {device.unstable_episodes:>9}  {situation}"
+            )
@@ -0,0 +1,72 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.models import User
+from core import analytics
+from core.models import Device
+
+
+class Command(BaseCommand):
+    help = (
+        "Análises do histórico de estados (core/analytics.py): horas ligado e kWh "
+        "estimado por cômodo e aparelho, aparelhos que passam de --hours h/dia em "
+        "setpoint <= --setpoint e outliers de consumo, nos últimos --days dias. "
+        "Sem --user, a frota inteira."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--user', help="E-mail do dono dos aparelhos")
+        parser.add_argument('--setpoint', type=int, default=16)
+        parser.add_argument('--hours', type=float, default=8)
+        parser.add_argument('--top', type=int, default=15, help="Quantos aparelhos listar")
+        parser.add_argument('--chunk-rows', type=int, default=analytics.CHUNK_ROWS,
+                            help="Linhas do histórico por lote em memória")
+
+    def handle(self, *args, **options):
+        if not analytics.available():
+            raise CommandError("Análises indisponíveis: instale o numpy")
+        if options['days'] < 1 or options['chunk_rows'] < 1:
+            raise CommandError("--days e --chunk-rows devem ser maiores que zero")
+
+        devices = Device.objects.all()
+        if options['user']:
+            try:
+                devices = devices.filter(user=User.objects.get(email=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f"Usuário {options['user']} não encontrado")
+
+        end = timezone.now()
+        start = time.monotonic()
+        report = analytics.fleet_report(
+            devices, end - timedelta(days=options['days']), end,
+            options['setpoint'], options['hours'], options['chunk_rows'],
+        )
+        elapsed = time.monotonic() - start
+
+        self.stdout.write(
+            f"\n📊 {len(report['devices'])} aparelhos, {report['samples']} amostras em {elapsed:.2f}s "
+            f"({timezone.localtime(report['start']):%d/%m %H:%M} → {timezone.localtime(report['end']):%d/%m %H:%M})"
+        )
+        self.stdout.write(f"⚡ Total estimado: {report['total_kwh']:.1f} kWh\n")
+
+        self.stdout.write(f"{'Cômodo':<24} {'horas':>9} {'kWh':>10}")
+        for row in report['rooms']:
+            self.stdout.write(f"{row['room'] or '-':<24} {row['on_hours']:>9.1f} {row['kwh']:>10.1f}")
+
+        self.stdout.write(f"\n{'Aparelho':<24} {'cômodo':<16} {'horas':>8} {'kWh':>9} {'kWh/dia':>8} {'dias frios':>10} {'score':>6}")
+        for row in report['devices'][:options['top']]:
+            self.stdout.write(
+                f"{row['device_id']:<24} {(row['room'] or '-')[:16]:<16} {row['on_hours']:>8.1f} {row['kwh']:>9.1f} "
+                f"{row['kwh_per_day']:>8.2f} {row['low_setpoint_days']:>10} {row['outlier_score']:>6.1f}"
+            )
+
+        low = report['low_setpoint']
+        self.stdout.write(
+            f"\n🥶 {len(low['devices'])} aparelhos com {low['hours_per_day']:g} h/dia ou mais em "
+            f"{low['setpoint']} °C ou menos: {', '.join(low['devices']) or '-'}"
+        )
+        self.stdout.write(f"🚨 Outliers de consumo: {', '.join(report['outliers']) or '-'}")
@@ -0,0 +1,55 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.models import User
+from core import provisioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Cadastra aparelhos em lote a partir de um CSV (cabeçalho: device_id,name,room,"
+        "brand,wifi_ssid,wifi_password) ou JSON, para o usuário --user. As configurações "
+        "Wi-Fi vão para a fila de saída, espaçadas em --rate por segundo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Arquivo .csv ou .json")
+        parser.add_argument('--user', required=True, help="E-mail do dono dos aparelhos")
+        parser.add_argument('--rate', type=float, default=provisioning.CONFIG_RATE,
+                            help="Configurações Wi-Fi enviadas por segundo")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Usuário {options['user']} não encontrado")
+        if options['rate'] <= 0:
+            raise CommandError("--rate deve ser maior que zero")
+
+        try:
+            with open(options['path'], encoding='utf-8-sig') as file:
+                rows = provisioning.read_rows(file.read(), provisioning.file_format(options['path']))
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        start = time.monotonic()
+        results, created = provisioning.provision(user, rows, per_second=options['rate'])
+        elapsed = time.monotonic() - start
+
+        for result in results:
+            if result['status'] == 'created':
+                config = "sem Wi-Fi"
+                if result['config_at']:
+                    config = f"Wi-Fi às {timezone.localtime(datetime.fromisoformat(result['config_at'])):%H:%M:%S}"
+                self.stdout.write(f"  ✅ linha {result['row']:>4}  {result['device_id']:<24} id={result['id']}  {config}")
+            else:
+                errors = "; ".join(f"{field}: {' '.join(map(str, messages))}" for field, messages in result['errors'].items())
+                self.stdout.write(f"  ❌ linha {result['row']:>4}  {str(result['device_id'] or '-'):<24} {errors}")
+
+        style = self.style.SUCCESS if created == len(results) else self.style.WARNING
+        self.stdout.write(style(
+            f"\n{created} de {len(results)} aparelhos cadastrados em {elapsed:.2f}s para {user.email}"
+        ))
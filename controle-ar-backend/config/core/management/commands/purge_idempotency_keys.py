@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.idempotency import purge_expired, PURGE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Remove em lotes as chaves de idempotência expiradas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        removed = purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"🧹 {removed} chaves de idempotência expiradas removidas"))
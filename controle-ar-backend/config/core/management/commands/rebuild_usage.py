@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core import usage
+
+
+class Command(BaseCommand):
+    help = "Recalcula os agregados diários de uso a partir do histórico de estados."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="Primeiro dia (YYYY-MM-DD) a recalcular")
+        parser.add_argument('--end', help="Último dia (YYYY-MM-DD) a recalcular")
+        parser.add_argument('--device', action='append', type=int, dest='devices',
+                            help="Recalcula apenas este dispositivo (pk); pode repetir")
+        parser.add_argument('--seed', action='store_true',
+                            help="Cria o evento inicial para dispositivos sem histórico")
+
+    def handle(self, *args, **options):
+        start = self._parse(options['start'], '--start')
+        end = self._parse(options['end'], '--end')
+        if start and end and start > end:
+            raise CommandError("--start deve ser anterior a --end")
+
+        if options['seed']:
+            seeded = usage.seed_missing_events()
+            self.stdout.write(f"🌱 {seeded} dispositivos receberam evento inicial")
+
+        rows = usage.rebuild(start=start, end=end, device_ids=options['devices'])
+        self.stdout.write(self.style.SUCCESS(f"✅ {rows} linhas de agregados recalculadas"))
+
+    def _parse(self, value, flag):
+        if not value:
+            return None
+        parsed = parse_date(value)
+        if not parsed:
+            raise CommandError(f"{flag} inválido: use o formato YYYY-MM-DD")
+        return parsed
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.scheduler import Scheduler, SYNC_INTERVAL
+
+# Espera máxima (s) entre tentativas quando o ciclo falha seguidamente
+ERROR_BACKOFF_MAX = 60
+
+
+class Command(BaseCommand):
+    help = "Roda o agendador de comandos (processo contínuo, como o mqtt_listener)."
+
+    def handle(self, *args, **options):
+        scheduler = Scheduler()
+        started = False
+        failures = 0
+        last_sync = time.monotonic()
+        try:
+            while True:
+                try:
+                    close_old_connections()
+                    if failures or not started:
+                        # Depois de um erro o heap pode ter perdido disparos já retirados: relê do banco
+                        loaded = scheduler.load()
+                        self.stdout.write(
+                            f"⏰ Agendador {'recarregado' if started else 'iniciado'} com {loaded} agendamentos ativos"
+                        )
+                        started = True
+                        last_sync = time.monotonic()
+                    scheduler.run_due()
+
+                    if time.monotonic() - last_sync >= SYNC_INTERVAL:
+                        scheduler.sync()
+                        last_sync = time.monotonic()
+                except Exception as e:
+                    # Banco fora, deadlock etc.: o agendador não pode morrer; tenta de novo com backoff
+                    failures += 1
+                    backoff = min(2 ** failures, ERROR_BACKOFF_MAX)
+                    self.stderr.write(f"❌ Erro no agendador ({failures}ª falha seguida): {e} — nova tentativa em {backoff}s")
+                    time.sleep(backoff)
+                    continue
+                failures = 0
+
+                wait = scheduler.seconds_until_next()
+                time.sleep(max(min(wait if wait is not None else SYNC_INTERVAL, SYNC_INTERVAL), 0.05))
+        except KeyboardInterrupt:
+            self.stdout.write("\nDesligando o agendador...")
@@ -0,0 +1,146 @@
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import time
+import uuid
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+from accounts.models import User
+from core.models import Device
+from core.leader import FileLock
+from core import db_health, listener
+
+
+def rss_mb():
+    """RSS atual (Linux); fora do Linux, o pico informado pelo getrusage."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def failed_messages():
+    return sum(value for _name, value in listener.failed_total.samples())
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de resistência do ouvinte MQTT: tráfego simulado de estado por "
+        "--duration segundos, com quedas periódicas da conexão com o banco. "
+        "Mostra a RSS ao longo do tempo e confere no fim se toda escrita chegou ao banco."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=int, default=3600, help="Duração em segundos")
+        parser.add_argument('--devices', type=int, default=200)
+        parser.add_argument('--rate', type=int, default=20, help="Mensagens por segundo")
+        parser.add_argument('--drop-every', type=int, default=120,
+                            help="Derruba a conexão com o banco a cada N segundos (0 desliga)")
+        parser.add_argument('--report-every', type=int, default=60)
+        parser.add_argument('--no-hygiene', action='store_true',
+                            help="Roda sem o core.db_health, para comparar")
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(
+            email=f"soak-{tag}@bench.local", full_name="Soak", password=uuid.uuid4().hex
+        )
+        device_ids = [f"soak-{tag}-{i:05d}" for i in range(options['devices'])]
+        Device.objects.bulk_create([
+            Device(device_id=device_id, name=device_id, room="Soak", user=user, is_registered=True)
+            for device_id in device_ids
+        ])
+
+        patches = contextlib.ExitStack()
+        if options['no_hygiene']:
+            patches.enter_context(mock.patch.object(db_health, 'run', side_effect=lambda func, *a, **k: func(*a, **k)))
+
+        worker = listener.Listener(lock=FileLock(os.devnull))
+        expected = {}
+        sent = drops = 0
+        failed_before = failed_messages()
+        start = last_report = last_drop = time.monotonic()
+        self.stdout.write(f"{'tempo':>7} {'mensagens':>10} {'falhas':>7} {'quedas':>7} {'RSS (MB)':>9}")
+        self._report(0, sent, 0, drops)
+
+        try:
+            with patches:
+                while time.monotonic() - start < options['duration']:
+                    second = time.monotonic()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        for _ in range(options['rate']):
+                            device_id = random.choice(device_ids)
+                            state = {
+                                "device_id": device_id, "power": random.random() < 0.5,
+                                "temp": random.randint(16, 30), "mode": "cool",
+                                "timestamp": int(time.time()),
+                            }
+                            expected[device_id] = state
+                            listener.on_message(None, None, SimpleNamespace(payload=json.dumps(state).encode()))
+                            sent += 1
+                        worker.tick()
+
+                    now = time.monotonic()
+                    if options['drop_every'] and now - last_drop >= options['drop_every']:
+                        last_drop = now
+                        drops += self._drop_connection()
+                    if now - last_report >= options['report_every']:
+                        last_report = now
+                        self._report(now - start, sent, failed_messages() - failed_before, drops)
+                    time.sleep(max(0, 1 - (time.monotonic() - second)))
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    worker._flush_ingest()
+                self._report(time.monotonic() - start, sent, failed_messages() - failed_before, drops)
+        finally:
+            # Sem o db_health a conexão pode ter ficado quebrada: confere numa nova
+            connection.close()
+            lost = self._lost_writes(expected)
+            Device.objects.filter(device_id__startswith=f"soak-{tag}").delete()
+            user.delete()
+
+        style = self.style.SUCCESS if not lost else self.style.ERROR
+        self.stdout.write(style(
+            f"\n{sent} mensagens, {drops} quedas de conexão, "
+            f"{lost} de {len(expected)} placas com o último estado fora do banco"
+        ))
+
+    def _report(self, elapsed, sent, failed, drops):
+        self.stdout.write(f"{elapsed:6.0f}s {sent:>10} {failed:>7} {drops:>7} {rss_mb():>9.1f}")
+
+    def _drop_connection(self):
+        if connection.connection is None:
+            return 0
+        if connection.vendor == 'postgresql':
+            # Como um reinício/failover do servidor: outra sessão encerra a do ouvinte
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                pid = cursor.fetchone()[0]
+            other = connections.create_connection(DEFAULT_DB_ALIAS)
+            try:
+                with other.cursor() as cursor:
+                    cursor.execute("SELECT pg_terminate_backend(%s)", [pid])
+            finally:
+                other.close()
+        else:
+            # SQLite não cai sozinho: fecha a conexão por baixo do Django, como um socket derrubado
+            connection.connection.close()
+        return 1
+
+    def _lost_writes(self, expected):
+        stored = {
+            device.device_id: device
+            for device in Device.objects.filter(device_id__in=list(expected))
+        }
+        return sum(
+            1 for device_id, state in expected.items()
+            if (stored[device_id].power, stored[device_id].temperature) != (state["power"], state["temp"])
+        )
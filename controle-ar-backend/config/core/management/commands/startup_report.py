@@ -0,0 +1,109 @@
+import os
+import re
+import subprocess
+import sys
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# O que cada processo carrega até poder atender: o web também resolve as URLs
+# (todas as views), como acontece na primeira requisição
+TARGETS = {
+    'wsgi': "from config.wsgi import application\nfrom django.urls import get_resolver\nget_resolver().url_patterns",
+    'asgi': "from config.asgi import application\nfrom django.urls import get_resolver\nget_resolver().url_patterns",
+    'listener': "import django\ndjango.setup()\nimport core.listener",
+}
+
+# Pontos de entrada: o que roda neles (django.setup) não é custo do app config
+ENTRY_POINTS = {'config.wsgi', 'config.asgi'}
+
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def project_apps():
+    """Pacotes de primeiro nível dos apps do projeto (os que ficam em BASE_DIR) + o pacote config."""
+    base = str(settings.BASE_DIR)
+    names = {config.name.split('.')[0] for config in apps.get_app_configs() if config.path.startswith(base)}
+    return names | {'config'}
+
+
+def run_importtime(target):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings', 'PYTHONDONTWRITEBYTECODE': '1'}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', TARGETS[target]],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise CommandError(f"Falha ao importar '{target}':\n{result.stderr[-2000:]}")
+    return result.stderr
+
+
+def parse(stderr, local):
+    """
+    [(módulo, self_us, cumulativo_us, app)] a partir da saída do -X importtime;
+    `app` é o app do projeto mais próximo na cadeia de imports (None: Django/bootstrap).
+    """
+    lines = [(int(m[1]), int(m[2]), len(m[3]), m[4]) for m in map(IMPORT_LINE.match, stderr.splitlines()) if m]
+    # O importtime imprime os filhos antes do pai: de trás para frente, o pai vem primeiro
+    modules, stack = [], []
+    for self_us, cumulative_us, indent, name in reversed(lines):
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        top = name.split('.')[0]
+        parent_app = stack[-1][1] if stack else None
+        app = top if top in local and name not in ENTRY_POINTS else parent_app
+        modules.append((name, self_us, cumulative_us, app))
+        stack.append((indent, app))
+    return modules
+
+
+class Command(BaseCommand):
+    help = (
+        "Relatório de tempo de import (python -X importtime) do processo web "
+        "(wsgi/asgi) ou do ouvinte MQTT, separado por app do projeto. O custo de "
+        "cada pacote de terceiros vai para o app que o importou primeiro."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=sorted(TARGETS), default='wsgi')
+        parser.add_argument('--top', type=int, default=12, help="Quantas linhas nas listas de módulos/pacotes")
+
+    def handle(self, *args, **options):
+        local = project_apps()
+        modules = parse(run_importtime(options['target']), local)
+
+        own, pulled = Counter(), Counter()
+        packages, importer = Counter(), {}
+        for name, self_us, _cumulative, app in modules:
+            top = name.split('.')[0]
+            if top in local and name not in ENTRY_POINTS:
+                own[top] += self_us
+            else:
+                pulled[app] += self_us
+                packages[top] += self_us
+                # A lista está de trás para frente: a última atribuição é o primeiro import
+                importer[top] = app
+
+        total = sum(own.values()) + sum(pulled.values())
+        self.stdout.write(f"\n⏱️ Imports de '{options['target']}': {total / 1000:.1f} ms em {len(modules)} módulos\n")
+
+        self.stdout.write(f"{'App':<22} {'próprio':>10} {'dependências':>13} {'total':>10}")
+        rows = [(app, own[app], pulled[app]) for app in sorted(local)] + [("(Django/bootstrap)", 0, pulled[None])]
+        for app, own_us, pulled_us in sorted(rows, key=lambda row: -(row[1] + row[2])):
+            self.stdout.write(f"{app:<22} {own_us / 1000:>8.1f}ms {pulled_us / 1000:>11.1f}ms {(own_us + pulled_us) / 1000:>8.1f}ms")
+
+        stdlib = set(sys.stdlib_module_names)
+        self.stdout.write(f"\nPacotes de terceiros mais caros (e quem importou primeiro):")
+        third_party = [(top, us) for top, us in packages.most_common() if top not in stdlib and top not in local]
+        for top, us in third_party[:options['top']]:
+            self.stdout.write(f"  {top:<28} {us / 1000:>8.1f}ms  ← {importer[top] or 'Django/bootstrap'}")
+
+        self.stdout.write(f"\nMódulos do projeto por tempo acumulado (inclui o que eles importam):")
+        project = sorted(
+            ((cumulative, name) for name, _s, cumulative, _p in modules if name.split('.')[0] in local), reverse=True
+        )
+        for cumulative, name in project[:options['top']]:
+            self.stdout.write(f"  {name:<40} {cumulative / 1000:>8.1f}ms")
+        self.stdout.write("\nImports tardios (dentro da função) tiram o pacote desta conta até o primeiro uso.")
@@ -0,0 +1,42 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db_router import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = (
+        "Copia o banco primário para a réplica quando os dois são SQLite (teste local "
+        "do roteamento de leituras). Com --interval repete a cópia, simulando o atraso "
+        "de replicação. Em Postgres use a replicação nativa (streaming)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help="Segundos entre cópias (0 = copia uma vez)")
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError("DATABASE_REPLICA_URL não configurada")
+        primary = settings.DATABASES['default']
+        replica = settings.DATABASES[REPLICA_ALIAS]
+        if not (primary['ENGINE'].endswith('sqlite3') and replica['ENGINE'].endswith('sqlite3')):
+            raise CommandError("Só para SQLite: em Postgres configure a réplica com streaming replication")
+        if primary['NAME'] == replica['NAME']:
+            raise CommandError("Primário e réplica apontam para o mesmo arquivo")
+
+        while True:
+            start = time.monotonic()
+            source = sqlite3.connect(primary['NAME'])
+            target = sqlite3.connect(replica['NAME'])
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            self.stdout.write(f"🔁 Réplica atualizada em {(time.monotonic() - start) * 1000:.0f} ms")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
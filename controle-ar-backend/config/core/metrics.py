@@ -0,0 +1,138 @@
+"""
+Métricas em memória no formato texto do Prometheus (exposto em /api/metrics/).
+
+Os valores são por processo: com vários workers cada um expõe os seus.
+Coletores registrados com `collector()` rodam no momento da leitura, para
+métricas caras (tamanho de tabelas, profundidade de filas).
+"""
+import threading
+
+_lock = threading.Lock()
+_registry = {}
+_collectors = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name + _format_labels(self.labelnames, key), value)
+                    for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name} {value}" for name, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observations = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value, observations + 1)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, observations) in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labelnames + ("le",), key + (bound,))
+                    samples.append((f"{self.name}_bucket{labels}", count))
+                labels = _format_labels(self.labelnames + ("le",), key + ("+Inf",))
+                samples.append((f"{self.name}_bucket{labels}", observations))
+                plain = _format_labels(self.labelnames, key)
+                samples.append((f"{self.name}_sum{plain}", round(total, 6)))
+                samples.append((f"{self.name}_count{plain}", observations))
+        return samples
+
+
+def _register(cls, name, documentation, labelnames=(), **kwargs):
+    with _lock:
+        if name not in _registry:
+            _registry[name] = cls(name, documentation, labelnames, **kwargs)
+        return _registry[name]
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter, name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    return _register(Gauge, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def collector(func):
+    """Registra uma função chamada antes de cada leitura das métricas."""
+    if func not in _collectors:
+        _collectors.append(func)
+    return func
+
+
+def render():
+    for func in list(_collectors):
+        try:
+            func()
+        except Exception as e:
+            print(f"❌ Erro no coletor de métricas {func.__name__}: {e}")
+    with _lock:
+        metrics = list(_registry.values())
+    return "\n".join(metric.render() for metric in metrics) + "\n"
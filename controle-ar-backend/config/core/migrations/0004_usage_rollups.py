@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_alter_device_is_registered'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceDailyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('on_seconds', models.PositiveIntegerField(default=0)),
+                ('cool_seconds', models.PositiveIntegerField(default=0)),
+                ('heat_seconds', models.PositiveIntegerField(default=0)),
+                ('fan_seconds', models.PositiveIntegerField(default=0)),
+                ('dry_seconds', models.PositiveIntegerField(default=0)),
+                ('auto_seconds', models.PositiveIntegerField(default=0)),
+                ('setpoint_seconds', models.BigIntegerField(default=0)),
+                ('command_count', models.PositiveIntegerField(default=0)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_usage', to='core.device')),
+            ],
+            options={
+                'verbose_name': 'Uso diário do dispositivo',
+                'verbose_name_plural': 'Uso diário dos dispositivos',
+                'ordering': ['day'],
+                'constraints': [models.UniqueConstraint(fields=('device', 'day'), name='core_device_daily_usage_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeviceStateEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('source', models.CharField(choices=[('report', 'Placa'), ('command', 'Comando'), ('watchdog', 'Watchdog')], default='report', max_length=10)),
+                ('room', models.CharField(blank=True, default='', max_length=50)),
+                ('is_online', models.BooleanField(default=False)),
+                ('power', models.BooleanField(default=False)),
+                ('temperature', models.IntegerField(default=24)),
+                ('mode', models.CharField(choices=[('cool', 'Resfriar'), ('heat', 'Aquecer'), ('fan', 'Ventilar'), ('dry', 'Desumidificar'), ('auto', 'Automático')], default='cool', max_length=10)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='state_events', to='core.device')),
+            ],
+            options={
+                'verbose_name': 'Evento de estado',
+                'verbose_name_plural': 'Eventos de estado',
+                'ordering': ['recorded_at'],
+                'indexes': [models.Index(fields=['device', 'recorded_at'], name='core_event_device_time_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RoomDailyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('on_seconds', models.PositiveIntegerField(default=0)),
+                ('cool_seconds', models.PositiveIntegerField(default=0)),
+                ('heat_seconds', models.PositiveIntegerField(default=0)),
+                ('fan_seconds', models.PositiveIntegerField(default=0)),
+                ('dry_seconds', models.PositiveIntegerField(default=0)),
+                ('auto_seconds', models.PositiveIntegerField(default=0)),
+                ('setpoint_seconds', models.BigIntegerField(default=0)),
+                ('command_count', models.PositiveIntegerField(default=0)),
+                ('room', models.CharField(max_length=50)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='room_usage', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Uso diário do cômodo',
+                'verbose_name_plural': 'Uso diário dos cômodos',
+                'ordering': ['day', 'room'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'room', 'day'), name='core_room_daily_usage_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_usage_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Schedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('room', models.CharField(blank=True, default='', max_length=50)),
+                ('kind', models.CharField(choices=[('once', 'Única vez'), ('recurring', 'Recorrente')], default='once', max_length=10)),
+                ('run_at', models.DateTimeField(blank=True, null=True)),
+                ('cron', models.CharField(blank=True, default='', max_length=100)),
+                ('power', models.BooleanField(default=False)),
+                ('temperature', models.IntegerField(default=24)),
+                ('mode', models.CharField(choices=[('cool', 'Resfriar'), ('heat', 'Aquecer'), ('fan', 'Ventilar'), ('dry', 'Desumidificar'), ('auto', 'Automático')], default='cool', max_length=10)),
+                ('is_active', models.BooleanField(default=True)),
+                ('next_run_at', models.DateTimeField(blank=True, null=True)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('device', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to='core.device')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Agendamento',
+                'verbose_name_plural': 'Agendamentos',
+                'ordering': ['next_run_at'],
+                'indexes': [models.Index(fields=['is_active', 'next_run_at'], name='core_schedule_due_idx'), models.Index(fields=['updated_at'], name='core_schedule_updated_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_mqtt_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='desired',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='desired_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='desired_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='reported',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='reported_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='reported_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
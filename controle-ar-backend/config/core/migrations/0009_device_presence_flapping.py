@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_device_shadow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='is_unstable',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='last_unstable_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='unstable_episodes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='unstable_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_device_presence_flapping'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['-updated_at', '-id'], name='core_device_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['room'], name='core_device_room_idx'),
+        ),
+    ]
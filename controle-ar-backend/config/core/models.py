@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils import timezone
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 
 class Device(models.Model):
     BRAND_CHOICES = [
@@ -50,6 +51,25 @@ class Device(models.Model):
     temperature = models.IntegerField(default=24)
     mode = models.CharField(max_length=10, choices=MODE_CHOICES, default='cool')
 
+    # --- Presença instável (core/presence.py) ---
+    # Enquanto a placa oscila entre online/offline fica "instável" (online para
+    # o resto do sistema) e as transições não são gravadas uma a uma.
+    is_unstable = models.BooleanField(default=False)
+    unstable_since = models.DateTimeField(null=True, blank=True)
+    last_unstable_at = models.DateTimeField(null=True, blank=True)
+    unstable_episodes = models.PositiveIntegerField(default=0)
+
+    # --- Shadow (core/shadow.py) ---
+    # desired: último comando do usuário; reported: último estado confirmado pela placa.
+    # Versões só crescem; reported_at é o timestamp (NTP) da placa, usado para
+    # descartar mensagens retidas/atrasadas mais antigas que o estado gravado.
+    desired = models.JSONField(default=dict, blank=True)
+    desired_version = models.PositiveIntegerField(default=0)
+    desired_at = models.DateTimeField(null=True, blank=True)
+    reported = models.JSONField(default=dict, blank=True)
+    reported_version = models.PositiveIntegerField(default=0)
+    reported_at = models.DateTimeField(null=True, blank=True)
+
     # --- Timestamps ---
     last_seen = models.DateTimeField(null=True, blank=True)
     last_command = models.DateTimeField(null=True, blank=True)
@@ -59,7 +79,230 @@ class Device(models.Model):
     def __str__(self):
         return f"{self.name} ({self.device_id})"
 
+    @property
+    def in_sync(self):
+        """True quando a placa já confirmou tudo o que foi pedido (ou nada foi pedido)."""
+        return all(self.reported.get(field) == value for field, value in self.desired.items())
+
     class Meta:
         ordering = ['-is_online', 'name']
         verbose_name = "Dispositivo"
         verbose_name_plural = "Dispositivos"
+        indexes = [
+            # Ordenação padrão do admin (core/admin.py)
+            models.Index(fields=['-updated_at', '-id'], name='core_device_updated_idx'),
+            # Filtro de cômodo do admin: o DISTINCT lê o índice, não a tabela
+            models.Index(fields=['room'], name='core_device_room_idx'),
+        ]
+
+
+class DeviceStateEvent(models.Model):
+    """Histórico de transições de estado de um dispositivo."""
+    SOURCE_CHOICES = [
+        ('report', 'Placa'),
+        ('command', 'Comando'),
+        ('watchdog', 'Watchdog'),
+    ]
+
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='state_events')
+    recorded_at = models.DateTimeField(default=timezone.now)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='report')
+
+    # --- Estado no momento da transição ---
+    room = models.CharField(max_length=50, blank=True, default='')
+    is_online = models.BooleanField(default=False)
+    power = models.BooleanField(default=False)
+    temperature = models.IntegerField(default=24)
+    mode = models.CharField(max_length=10, choices=Device.MODE_CHOICES, default='cool')
+
+    def __str__(self):
+        return f"{self.device_id} @ {self.recorded_at:%Y-%m-%d %H:%M:%S} ({self.source})"
+
+    class Meta:
+        ordering = ['recorded_at']
+        indexes = [
+            models.Index(fields=['device', 'recorded_at'], name='core_event_device_time_idx'),
+        ]
+        verbose_name = "Evento de estado"
+        verbose_name_plural = "Eventos de estado"
+
+
+class UsageCounters(models.Model):
+    """Contadores diários compartilhados pelos agregados de uso."""
+    day = models.DateField()
+    on_seconds = models.PositiveIntegerField(default=0)
+    cool_seconds = models.PositiveIntegerField(default=0)
+    heat_seconds = models.PositiveIntegerField(default=0)
+    fan_seconds = models.PositiveIntegerField(default=0)
+    dry_seconds = models.PositiveIntegerField(default=0)
+    auto_seconds = models.PositiveIntegerField(default=0)
+    # Soma de (temperatura x segundos ligado), usada para a média ponderada do setpoint
+    setpoint_seconds = models.BigIntegerField(default=0)
+    command_count = models.PositiveIntegerField(default=0)
+
+    @property
+    def average_setpoint(self):
+        if not self.on_seconds:
+            return None
+        return round(self.setpoint_seconds / self.on_seconds, 1)
+
+    @property
+    def mode_breakdown(self):
+        return {mode: getattr(self, f"{mode}_seconds") for mode, _ in Device.MODE_CHOICES}
+
+    class Meta:
+        abstract = True
+
+
+class DeviceDailyUsage(UsageCounters):
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='daily_usage')
+
+    def __str__(self):
+        return f"{self.device_id} {self.day}"
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'day'], name='core_device_daily_usage_unique'),
+        ]
+        verbose_name = "Uso diário do dispositivo"
+        verbose_name_plural = "Uso diário dos dispositivos"
+
+
+class RoomDailyUsage(UsageCounters):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='room_usage'
+    )
+    room = models.CharField(max_length=50)
+
+    def __str__(self):
+        return f"{self.room} {self.day}"
+
+    class Meta:
+        ordering = ['day', 'room']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'room', 'day'], name='core_room_daily_usage_unique'),
+        ]
+        verbose_name = "Uso diário do cômodo"
+        verbose_name_plural = "Uso diário dos cômodos"
+
+
+class Schedule(models.Model):
+    """Comando agendado (único ou recorrente) para um aparelho ou um cômodo."""
+    KIND_CHOICES = [
+        ('once', 'Única vez'),
+        ('recurring', 'Recorrente'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='schedules')
+    name = models.CharField(max_length=100)
+
+    # --- Alvo: um aparelho OU todos os aparelhos do usuário em um cômodo ---
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='schedules', null=True, blank=True)
+    room = models.CharField(max_length=50, blank=True, default='')
+
+    # --- Quando ---
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='once')
+    run_at = models.DateTimeField(null=True, blank=True)
+    cron = models.CharField(max_length=100, blank=True, default='')
+
+    # --- Comando ---
+    power = models.BooleanField(default=False)
+    temperature = models.IntegerField(default=24)
+    mode = models.CharField(max_length=10, choices=Device.MODE_CHOICES, default='cool')
+
+    # --- Controle do agendador ---
+    is_active = models.BooleanField(default=True)
+    next_run_at = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.get_kind_display()})"
+
+    def compute_next_run(self, after=None):
+        """Próximo disparo depois de `after` (padrão: agora)."""
+        from .cron import CronExpression
+
+        after = after or timezone.now()
+        if self.kind == 'once':
+            return self.run_at if self.run_at and self.run_at > after else None
+        return CronExpression(self.cron).next_after(after)
+
+    def command_payload(self):
+        return {"power": self.power, "temp": self.temperature, "mode": self.mode}
+
+    class Meta:
+        ordering = ['next_run_at']
+        indexes = [
+            models.Index(fields=['is_active', 'next_run_at'], name='core_schedule_due_idx'),
+            models.Index(fields=['updated_at'], name='core_schedule_updated_idx'),
+        ]
+        verbose_name = "Agendamento"
+        verbose_name_plural = "Agendamentos"
+
+
+class IdempotencyKey(models.Model):
+    """Resposta guardada de uma requisição feita com o cabeçalho Idempotency-Key."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    # SHA-256 da chave enviada pelo cliente: tamanho fixo independentemente da chave
+    key_hash = models.CharField(max_length=64)
+    # SHA-256 de método + caminho + corpo, para detectar reuso da chave com outro conteúdo
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # None = em andamento
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key_hash[:12]}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key_hash'], name='core_idempotency_key_unique'),
+        ]
+        verbose_name = "Chave de idempotência"
+        verbose_name_plural = "Chaves de idempotência"
+
+
+class OutboundMessage(models.Model):
+    """Mensagem MQTT na fila de saída, entregue depois pelo listener."""
+    KIND_CHOICES = [
+        ('command', 'Comando'),
+        ('wifi_config', 'Configuração Wi-Fi'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pendente'),
+        ('sent', 'Enviada'),
+        ('failed', 'Falhou'),
+        ('expired', 'Expirada'),
+    ]
+
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='outbound_messages', null=True, blank=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='command')
+    topic = models.CharField(max_length=200)
+    payload = models.TextField()
+    qos = models.PositiveSmallIntegerField(default=1)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Comandos de IR perdem o sentido depois de um tempo; None = não expira
+    expires_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.topic} ({self.status})"
+
+    class Meta:
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='core_outbox_due_idx'),
+        ]
+        verbose_name = "Mensagem na fila"
+        verbose_name_plural = "Mensagens na fila"
@@ -0,0 +1,167 @@
+"""
+Publicação MQTT não bloqueante para as views assíncronas (ASGI).
+
+Em vez de abrir uma conexão por comando (publish.single), cada processo
+mantém um cliente paho persistente com a thread de rede própria. O
+`publish` devolve um awaitable que só conclui quando o broker confirma a
+entrega (on_publish), então o event loop fica livre enquanto isso.
+"""
+import asyncio
+import threading
+import time
+
+from .circuit_breaker import CircuitOpenError
+from .mqtt_helper import (
+    MQTT_BROKER, MQTT_PORT, broker_breaker, build_command_message,
+    build_wifi_config_message, publish_total, publish_seconds
+)
+
+CONNECT_TIMEOUT = 5
+PUBLISH_TIMEOUT = 5
+WIFI_RESEND_DELAY = 1.5
+
+
+def _paho_client():
+    """paho.mqtt.client só é carregado quando o primeiro comando é publicado."""
+    import paho.mqtt.client as mqtt
+    return mqtt
+
+
+class AsyncPublisher:
+    def __init__(self, hostname=MQTT_BROKER, port=MQTT_PORT):
+        self.hostname = hostname
+        self.port = port
+        self._client = None
+        self._connected = threading.Event()
+        self._lock = threading.Lock()
+        self._pending = {}      # mid -> (loop, future)
+        self._early = set()     # mids confirmados antes de serem registrados
+
+    # ============================================================
+    #  CONEXÃO (thread de rede do paho)
+    # ============================================================
+    def _on_connect(self, client, userdata, flags, rc, *args):
+        if rc == 0:
+            self._connected.set()
+
+    def _on_disconnect(self, client, userdata, rc, *args):
+        self._connected.clear()
+
+    def _on_publish(self, client, userdata, mid, *args):
+        with self._lock:
+            waiter = self._pending.pop(mid, None)
+            if waiter is None:
+                self._early.add(mid)
+                return
+        loop, future = waiter
+        loop.call_soon_threadsafe(_resolve, future)
+
+    def _ensure_client(self):
+        with self._lock:
+            if self._client is None:
+                client = _paho_client().Client()
+                client.on_connect = self._on_connect
+                client.on_disconnect = self._on_disconnect
+                client.on_publish = self._on_publish
+                client.connect_async(self.hostname, self.port, 60)
+                client.loop_start()
+                self._client = client
+            return self._client
+
+    async def _wait_connected(self):
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while not self._connected.is_set():
+            if time.monotonic() >= deadline:
+                raise ConnectionError("Timeout ao conectar no broker MQTT")
+            await asyncio.sleep(0.05)
+
+    # ============================================================
+    #  PUBLICAÇÃO
+    # ============================================================
+    async def publish(self, topic, payload, qos=1):
+        if not broker_breaker.allow_request():
+            publish_total.inc(result='rejected')
+            raise CircuitOpenError("Circuito 'mqtt_broker' aberto")
+
+        start = time.monotonic()
+        try:
+            client = self._ensure_client()
+            await self._wait_connected()
+
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            with self._lock:
+                info = client.publish(topic, payload=payload, qos=qos)
+                mqtt = _paho_client()
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    raise ConnectionError(mqtt.error_string(info.rc))
+                if info.mid in self._early:
+                    self._early.discard(info.mid)
+                    future.set_result(True)
+                else:
+                    self._pending[info.mid] = (loop, future)
+            try:
+                await asyncio.wait_for(future, PUBLISH_TIMEOUT)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self._pending.pop(info.mid, None)
+                raise
+        except Exception as e:
+            elapsed = time.monotonic() - start
+            broker_breaker.record_failure(e, elapsed)
+            publish_total.inc(result='error')
+            publish_seconds.observe(elapsed)
+            raise
+
+        elapsed = time.monotonic() - start
+        broker_breaker.record_success(elapsed)
+        publish_total.inc(result='ok')
+        publish_seconds.observe(elapsed)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+publisher = AsyncPublisher()
+
+
+async def send_command_to_esp32(device_id, payload):
+    """Versão assíncrona de mqtt_helper.send_command_to_esp32."""
+    if not device_id:
+        print("❌ device_id inválido ao enviar comando.")
+        return False
+
+    topic, message = build_command_message(device_id, payload)
+    try:
+        print(f"📡 Enviando comando para {topic}: {message}")
+        await publisher.publish(topic, message, qos=1)
+        return True
+    except Exception as e:
+        print(f"❌ Erro ao publicar comando no MQTT: {e}")
+        return False
+
+
+async def send_wifi_config(device_id, config_payload):
+    """Versão assíncrona de mqtt_helper.send_wifi_config (o reenvio não bloqueia o worker)."""
+    if not device_id:
+        print("❌ device_id inválido ao enviar configuração Wi-Fi.")
+        return False
+
+    built = build_wifi_config_message(device_id, config_payload)
+    if not built:
+        print("❌ SSID ausente no payload de configuração Wi-Fi.")
+        return False
+    topic, message = built
+
+    try:
+        print(f"📡 Enviando configuração para {topic}")
+        await publisher.publish(topic, message, qos=2)
+        # Reenvio para robustez, como na versão síncrona
+        await asyncio.sleep(WIFI_RESEND_DELAY)
+        await publisher.publish(topic, message, qos=2)
+        return True
+    except Exception as e:
+        print(f"❌ Erro ao enviar configuração via MQTT: {e}")
+        return False
@@ -1,21 +1,75 @@
-import paho.mqtt.publish as publish
 import json
 import time
+from django.conf import settings
+
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, STATE_VALUES
+from . import metrics
 
 # Configurações do Broker
 MQTT_BROKER = "broker.hivemq.com"
 MQTT_PORT = 1883
 
-def send_command_to_esp32(device_id, payload):
+# Circuit breaker: após várias falhas (ou publicações lentas) seguidas, as
+# chamadas falham na hora durante o cooldown em vez de travar o worker
+# esperando o timeout de conexão.
+broker_breaker = CircuitBreaker(
+    'mqtt_broker',
+    failure_threshold=getattr(settings, 'MQTT_BREAKER_FAILURE_THRESHOLD', 3),
+    window=getattr(settings, 'MQTT_BREAKER_WINDOW', 60),
+    cooldown=getattr(settings, 'MQTT_BREAKER_COOLDOWN', 30),
+    slow_call_seconds=getattr(settings, 'MQTT_BREAKER_SLOW_CALL', 3.0),
+)
+
+
+
+def _paho_publish():
     """
-    Envia um comando para a ESP32 via MQTT.
-    Tópico: smart_ac/{device_id}/command
+    paho.mqtt.publish só é importado na primeira publicação: os workers web
+    publicam pela fila (outbox) no agendador e a maioria nunca precisa dele.
     """
+    import paho.mqtt.publish as publish
+    return publish
 
-    if not device_id:
-        print("❌ device_id inválido ao enviar comando.")
-        return False
 
+publish_total = metrics.counter('mqtt_publish_total', 'Publicações MQTT por resultado', ['result'])
+publish_seconds = metrics.histogram('mqtt_publish_seconds', 'Duração das publicações MQTT')
+breaker_state = metrics.gauge('mqtt_breaker_state', 'Estado do circuit breaker do broker (0=fechado, 1=meio-aberto, 2=aberto)')
+
+
+@metrics.collector
+def _collect_breaker_state():
+    breaker_state.set(STATE_VALUES[broker_breaker.state])
+
+
+def broker_available():
+    """
+    False se o circuito recusaria a publicação agora: aberto, ou meio-aberto
+    com a chamada de teste já em andamento (falhar rápido sem tentar conectar).
+    """
+    return broker_breaker.would_allow()
+
+
+def _publish(func, *args, **kwargs):
+    """Executa uma publicação do paho passando pelo circuit breaker."""
+    start = time.monotonic()
+    try:
+        broker_breaker.call(func, *args, **kwargs)
+    except CircuitOpenError:
+        publish_total.inc(result='rejected')
+        raise
+    except Exception:
+        publish_total.inc(result='error')
+        publish_seconds.observe(time.monotonic() - start)
+        raise
+    publish_total.inc(result='ok')
+    publish_seconds.observe(time.monotonic() - start)
+
+
+def build_command_message(device_id, payload):
+    """
+    Monta (tópico, mensagem JSON) de um comando para a ESP32.
+    Tópico: smart_ac/{device_id}/command
+    """
     topic = f"smart_ac/{device_id}/command"
 
     # Garante chaves obrigatórias
@@ -32,11 +86,25 @@ def send_command_to_esp32(device_id, payload):
     # Remove campos que não devem ser enviados para o microcontrolador
     payload.pop("wifi_password", None)
 
-    message = json.dumps(payload)
+    return topic, json.dumps(payload)
+
+
+def send_command_to_esp32(device_id, payload):
+    """
+    Envia um comando para a ESP32 via MQTT.
+    Tópico: smart_ac/{device_id}/command
+    """
+
+    if not device_id:
+        print("❌ device_id inválido ao enviar comando.")
+        return False
+
+    topic, message = build_command_message(device_id, payload)
 
     try:
         print(f"📡 Enviando comando para {topic}: {message}")
-        publish.single(
+        _publish(
+            _paho_publish().single,
             topic,
             payload=message,
             hostname=MQTT_BROKER,
@@ -49,23 +117,50 @@ def send_command_to_esp32(device_id, payload):
         return False
 
 
-def send_wifi_config(device_id, config_payload):
+def send_commands_batch(commands):
     """
-    Envia configuração Wi-Fi para a ESP32 via MQTT.
-    Tópico: smart_ac/{device_id}/config
-
-    O payload deve conter:
-    {
-        "ssid": "...",
-        "password": "...",
-        "type": "wifi_config"
-    }
+    Envia vários comandos usando uma única conexão com o broker.
+    `commands` é uma lista de (device_id, payload).
     """
+    messages = [
+        {"topic": topic, "payload": message, "qos": 1}
+        for topic, message in (
+            build_command_message(device_id, payload)
+            for device_id, payload in commands if device_id
+        )
+    ]
+    if not messages:
+        return True
 
-    if not device_id:
-        print("❌ device_id inválido ao enviar configuração Wi-Fi.")
+    try:
+        print(f"📡 Enviando {len(messages)} comandos em lote")
+        _publish(_paho_publish().multiple, messages, hostname=MQTT_BROKER, port=MQTT_PORT)
+        return True
+    except Exception as e:
+        print(f"❌ Erro ao publicar lote de comandos no MQTT: {e}")
         return False
 
+
+def publish_messages(messages):
+    """
+    Publica mensagens já montadas ({"topic", "payload", "qos"}) em uma única
+    conexão. Usado para esvaziar a fila de saída (outbox).
+    """
+    if not messages:
+        return True
+    try:
+        _publish(_paho_publish().multiple, messages, hostname=MQTT_BROKER, port=MQTT_PORT)
+        return True
+    except Exception as e:
+        print(f"❌ Erro ao publicar mensagens da fila no MQTT: {e}")
+        return False
+
+
+def build_wifi_config_message(device_id, config_payload):
+    """
+    Monta (tópico, mensagem JSON) da configuração Wi-Fi, ou None se faltar o SSID.
+    Tópico: smart_ac/{device_id}/config
+    """
     topic = f"smart_ac/{device_id}/config"
 
     config_payload = config_payload.copy()  # evitar mutar o dict original
@@ -81,17 +176,41 @@ def send_wifi_config(device_id, config_payload):
 
     # Garantir que ssid e senha existam
     if not config_payload.get("ssid"):
-        print("❌ SSID ausente no payload de configuração Wi-Fi.")
+        return None
+
+    return topic, json.dumps(config_payload)
+
+
+def send_wifi_config(device_id, config_payload):
+    """
+    Envia configuração Wi-Fi para a ESP32 via MQTT.
+    Tópico: smart_ac/{device_id}/config
+
+    O payload deve conter:
+    {
+        "ssid": "...",
+        "password": "...",
+        "type": "wifi_config"
+    }
+    """
+
+    if not device_id:
+        print("❌ device_id inválido ao enviar configuração Wi-Fi.")
         return False
 
-    message = json.dumps(config_payload)
+    built = build_wifi_config_message(device_id, config_payload)
+    if not built:
+        print("❌ SSID ausente no payload de configuração Wi-Fi.")
+        return False
+    topic, message = built
 
     try:
         print(f"📡 Enviando configuração para {topic}")
         print(f"📦 Payload: {message}")
 
         # QoS 2 (entrega garantida)
-        publish.single(
+        _publish(
+            _paho_publish().single,
             topic,
             payload=message,
             hostname=MQTT_BROKER,
@@ -102,7 +221,8 @@ def send_wifi_config(device_id, config_payload):
 
         # Reenvio opcional para robustez
         time.sleep(1.5)
-        publish.single(
+        _publish(
+            _paho_publish().single,
             topic,
             payload=message,
             hostname=MQTT_BROKER,
@@ -0,0 +1,150 @@
+"""
+Fila de saída (outbox) de mensagens MQTT.
+
+Usada quando o broker está indisponível (circuito aberto) e para entregas
+que não precisam sair na hora. O listener esvazia a fila periodicamente,
+publicando cada lote em uma única conexão, com backoff exponencial.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Device, OutboundMessage
+from .mqtt_helper import build_command_message, build_wifi_config_message, publish_messages
+from . import metrics
+
+COMMAND_TTL = getattr(settings, 'MQTT_OUTBOX_COMMAND_TTL', 10 * 60)
+MAX_ATTEMPTS = getattr(settings, 'MQTT_OUTBOX_MAX_ATTEMPTS', 8)
+FLUSH_BATCH_SIZE = 100
+WIFI_RESEND_DELAY = timedelta(seconds=1.5)
+
+outbox_depth = metrics.gauge('mqtt_outbox_pending', 'Mensagens MQTT pendentes na fila de saída')
+
+
+@metrics.collector
+def _collect_depth():
+    outbox_depth.set(pending_count())
+
+
+def pending_count():
+    return OutboundMessage.objects.filter(status='pending').count()
+
+
+def _backoff(attempts):
+    return timedelta(seconds=min(5 * 2 ** (attempts - 1), 600))
+
+
+def queue_command(device, payload):
+    topic, message = build_command_message(device.device_id, payload)
+    return OutboundMessage.objects.create(
+        device=device,
+        kind='command',
+        topic=topic,
+        payload=message,
+        qos=1,
+        expires_at=timezone.now() + timedelta(seconds=COMMAND_TTL)
+    )
+
+
+def queue_commands(commands):
+    """Versão em lote de queue_command: `commands` é uma lista de (device, payload); um único INSERT."""
+    expires_at = timezone.now() + timedelta(seconds=COMMAND_TTL)
+    messages = []
+    for device, payload in commands:
+        topic, message = build_command_message(device.device_id, payload)
+        messages.append(OutboundMessage(device=device, kind='command', topic=topic, payload=message,
+                                        qos=1, expires_at=expires_at))
+    return OutboundMessage.objects.bulk_create(messages, batch_size=FLUSH_BATCH_SIZE * 10)
+
+
+def _wifi_config_messages(device, config_payload, not_before):
+    built = build_wifi_config_message(device.device_id, config_payload)
+    if not built:
+        return []
+    topic, message = built
+    return [
+        OutboundMessage(device=device, kind='wifi_config', topic=topic, payload=message,
+                        qos=2, next_attempt_at=not_before),
+        OutboundMessage(device=device, kind='wifi_config', topic=topic, payload=message,
+                        qos=2, next_attempt_at=not_before + WIFI_RESEND_DELAY),
+    ]
+
+
+def queue_wifi_config(device, config_payload, not_before=None):
+    """Enfileira a configuração Wi-Fi (envio + reenvio, como send_wifi_config)."""
+    return OutboundMessage.objects.bulk_create(
+        _wifi_config_messages(device, config_payload, not_before or timezone.now())
+    )
+
+
+def queue_wifi_configs(configs, per_second, start=None):
+    """
+    Versão em lote de queue_wifi_config para `configs` = [(device, payload)]:
+    um único INSERT, com os envios espaçados em 1/per_second segundos para não
+    despejar centenas de configurações no broker de uma vez. Retorna
+    {device.pk: horário previsto do envio} dos que foram enfileirados.
+    """
+    start = start or timezone.now()
+    messages, scheduled = [], {}
+    for device, config_payload in configs:
+        not_before = start + timedelta(seconds=len(scheduled) / per_second)
+        built = _wifi_config_messages(device, config_payload, not_before)
+        if built:
+            messages.extend(built)
+            scheduled[device.pk] = not_before
+    OutboundMessage.objects.bulk_create(messages, batch_size=FLUSH_BATCH_SIZE * 10)
+    return scheduled
+
+
+def flush(publisher=publish_messages, limit=FLUSH_BATCH_SIZE, kinds=None):
+    """Publica as mensagens vencidas da fila. Retorna quantas foram enviadas."""
+    now = timezone.now()
+    OutboundMessage.objects.filter(status='pending', expires_at__lte=now).update(status='expired')
+
+    due = OutboundMessage.objects.filter(status='pending', next_attempt_at__lte=now)
+    if kinds:
+        due = due.filter(kind__in=kinds)
+    batch = list(due.order_by('next_attempt_at')[:limit])
+    if not batch:
+        return 0
+
+    messages = [{"topic": m.topic, "payload": m.payload, "qos": m.qos} for m in batch]
+    if publisher(messages):
+        for message in batch:
+            message.status = 'sent'
+            message.sent_at = now
+            message.attempts += 1
+        OutboundMessage.objects.bulk_update(batch, ['status', 'sent_at', 'attempts'])
+        # Como no envio direto (send_wifi_config), configuração publicada = configurado
+        configured = {m.device_id for m in batch if m.kind == 'wifi_config' and m.device_id}
+        if configured:
+            Device.objects.filter(pk__in=configured, is_configured=False).update(is_configured=True)
+        print(f"📤 {len(batch)} mensagens da fila enviadas")
+        return len(batch)
+
+    for message in batch:
+        message.attempts += 1
+        message.next_attempt_at = now + _backoff(message.attempts)
+        message.last_error = "Falha ao publicar no broker"
+        if message.attempts >= MAX_ATTEMPTS:
+            message.status = 'failed'
+    OutboundMessage.objects.bulk_update(batch, ['attempts', 'next_attempt_at', 'last_error', 'status'])
+    return 0
+
+
+def spread_pending(jitter_seconds, now=None):
+    """
+    Espalha as mensagens pendentes ao longo de `jitter_seconds` (ao sair de
+    uma tempestade de reconexão), para não soltar tudo de uma vez. Mensagens
+    do mesmo aparelho recebem o mesmo atraso e mantêm a ordem entre si.
+    """
+    now = now or timezone.now()
+    pending = list(OutboundMessage.objects.filter(status='pending').only('pk', 'device_id', 'next_attempt_at'))
+    offsets = {}
+    for message in pending:
+        offset = offsets.setdefault(message.device_id, timedelta(seconds=random.uniform(0, jitter_seconds)))
+        message.next_attempt_at = max(message.next_attempt_at, now) + offset
+    OutboundMessage.objects.bulk_update(pending, ['next_attempt_at'], batch_size=1000)
+    return len(pending)
@@ -0,0 +1,156 @@
+"""
+Amortecimento de oscilação (flapping) de presença online/offline.
+
+Placas com Wi-Fi fraco caem e voltam o tempo todo; cada transição seria um
+save() (watchdog ou handle_status_update), um updated_at novo e os caches
+dos clientes invalidados. O FlapDetector guarda, por placa, os horários das
+últimas transições num anel de tamanho fixo e aplica histerese:
+
+- entra em oscilação com DEVICE_FLAP_ENTER transições em DEVICE_FLAP_WINDOW
+  segundos: a placa é marcada is_unstable (uma única escrita) e continua
+  online para o resto do sistema;
+- enquanto instável, o watchdog não a derruba e as mensagens dela caem no
+  caminho sem escrita do shadow (só renovam o last_seen);
+- settle(), chamado a cada ciclo do watchdog, segue observando a presença
+  pelo last_seen e encerra o episódio quando a janela tiver no máximo
+  DEVICE_FLAP_EXIT transições, gravando o estado final uma vez.
+
+O detector fica na memória do ouvinte (líder). Se ele reiniciar, os
+episódios em aberto são encerrados no primeiro settle() e recomeçam se a
+placa continuar oscilando. O relatório (/api/devices/flapping/ e
+`manage.py flapping_report`) lê os campos gravados no Device.
+"""
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Device
+from . import metrics, usage
+
+FLAP_WINDOW = getattr(settings, 'DEVICE_FLAP_WINDOW', 600)
+FLAP_ENTER = getattr(settings, 'DEVICE_FLAP_ENTER', 6)
+FLAP_EXIT = getattr(settings, 'DEVICE_FLAP_EXIT', 2)
+MAX_TRACKED_DEVICES = 50000
+OFFLINE_AFTER = timedelta(seconds=60)
+# Relatório: placas instáveis agora ou que oscilaram nos últimos dias
+REPORT_DAYS = 7
+
+UNSTABLE_FIELDS = ['is_unstable', 'unstable_since', 'last_unstable_at', 'unstable_episodes']
+
+episodes_total = metrics.counter('device_flap_episodes_total', "Placas que entraram em oscilação")
+transitions_total = metrics.counter(
+    'device_presence_transitions_total', "Transições de presença observadas", ('direction',)
+)
+
+
+class FlapDetector:
+    """
+    Por placa: último estado observado e um anel com os horários (epoch) das
+    últimas `enter` transições. Guarda no máximo `max_devices` placas (LRU).
+    """
+
+    def __init__(self, window=FLAP_WINDOW, enter=FLAP_ENTER, exit=FLAP_EXIT, max_devices=MAX_TRACKED_DEVICES):
+        self.window = window
+        self.enter = enter
+        self.exit = exit
+        self.max_devices = max_devices
+        self._devices = OrderedDict()  # device_id -> [online, próxima posição, array('d')]
+        self._lock = threading.Lock()
+
+    def observe(self, device_id, online, now, initial=None):
+        """Registra o estado visto; retorna True se for uma transição."""
+        with self._lock:
+            entry = self._devices.pop(device_id, None)
+            if entry is None:
+                entry = [online if initial is None else initial, 0, array('d', [0.0] * self.enter)]
+            self._devices[device_id] = entry
+            while len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+
+            if entry[0] == online:
+                return False
+            entry[0] = online
+            ring = entry[2]
+            ring[entry[1]] = now
+            entry[1] = (entry[1] + 1) % len(ring)
+        transitions_total.inc(direction='online' if online else 'offline')
+        return True
+
+    def transitions(self, device_id, now):
+        with self._lock:
+            entry = self._devices.get(device_id)
+            if entry is None:
+                return 0
+            return sum(1 for at in entry[2] if at and now - at < self.window)
+
+    def is_flapping(self, device_id, now, unstable):
+        count = self.transitions(device_id, now)
+        return count > self.exit if unstable else count >= self.enter
+
+    def clear(self):
+        with self._lock:
+            self._devices.clear()
+
+
+detector = FlapDetector()
+
+
+def record(device, online, now=None):
+    """
+    Registra a presença vista (mensagem = online, watchdog = offline), sem
+    salvar. Se for uma transição e a placa passar a oscilar, marca is_unstable, mantém is_online=True e retorna True: o
+    chamador grava só UNSTABLE_FIELDS (e o que mais já fosse gravar).
+    """
+    now = now or timezone.now()
+    transitioned = detector.observe(device.device_id, online, now.timestamp(), initial=device.is_online)
+    if not transitioned or device.is_unstable:
+        # Instável: só alimenta o detector (o settle decide quando acaba)
+        return False
+    if not detector.is_flapping(device.device_id, now.timestamp(), unstable=False):
+        return False
+
+    device.is_unstable = True
+    device.is_online = True
+    device.unstable_since = now
+    device.last_unstable_at = now
+    device.unstable_episodes += 1
+    episodes_total.inc()
+    print(f"🌀 Placa {device.name} ({device.device_id}) oscilando: transições suspensas")
+    return True
+
+
+def settle(now=None):
+    """Encerra os episódios das placas que pararam de oscilar (ciclo do watchdog)."""
+    now = now or timezone.now()
+    settled = 0
+    for device in Device.objects.filter(is_unstable=True):
+        online = bool(device.last_seen and device.last_seen >= now - OFFLINE_AFTER)
+        detector.observe(device.device_id, online, now.timestamp())
+        if detector.is_flapping(device.device_id, now.timestamp(), unstable=True):
+            continue
+
+        previous_state = usage.snapshot(device)
+        device.is_unstable = False
+        device.unstable_since = None
+        device.last_unstable_at = now
+        device.is_online = online
+        device.save(update_fields=['is_online', 'is_unstable', 'unstable_since', 'last_unstable_at', 'updated_at'])
+        usage.record_transition(device, previous_state, source='watchdog')
+        settled += 1
+        print(f"✅ Placa {device.name} ({device.device_id}) estável de novo: {'ONLINE' if online else 'OFFLINE'}")
+    return settled
+
+
+def flapping_devices(queryset=None, days=REPORT_DAYS, now=None):
+    """Placas instáveis agora ou com episódio nos últimos `days` dias, piores primeiro."""
+    now = now or timezone.now()
+    queryset = Device.objects.all() if queryset is None else queryset
+    return (
+        queryset.filter(Q(is_unstable=True) | Q(last_unstable_at__gte=now - timedelta(days=days)))
+        .order_by('-is_unstable', '-unstable_episodes', '-last_unstable_at')
+    )
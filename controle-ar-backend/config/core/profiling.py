@@ -0,0 +1,165 @@
+"""
+Perfil por requisição: quantidade de consultas SQL, tempo total no banco,
+consultas mais lentas e latência da requisição.
+
+- Amostrado (PROFILING_SAMPLE_RATE); desligado, o middleware se remove da
+  cadeia na inicialização (MiddlewareNotUsed) e não custa nada.
+- Em DEBUG, os números vão em cabeçalhos (X-DB-Queries, X-DB-Time-ms,
+  Server-Timing). Consultas acima de PROFILING_SLOW_QUERY_MS são impressas
+  no console.
+- Em produção, vão para /api/metrics/ por rota (view_name do DRF).
+- PROFILING_QUERY_BUDGETS = {"device-control": 8, ...} avisa quando uma
+  rota passa do orçamento de consultas (core/testing.py faz o mesmo nos testes).
+
+Respostas em streaming (exportações) só contam as consultas feitas antes
+do primeiro byte.
+"""
+import contextvars
+import heapq
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+SLOW_QUERIES_KEPT = 3
+
+request_seconds = metrics.histogram('http_request_seconds', "Latência das requisições amostradas", ('view',))
+request_db_seconds = metrics.histogram('http_request_db_seconds', "Tempo no banco por requisição amostrada", ('view',))
+request_queries = metrics.histogram(
+    'http_request_db_queries', "Consultas SQL por requisição amostrada", ('view',),
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+budget_exceeded_total = metrics.counter(
+    'http_query_budget_exceeded_total', "Requisições acima do orçamento de consultas", ('view',)
+)
+
+# Profiler da requisição atual. Fica no contexto (e não na conexão) porque as
+# views assíncronas usam o ORM em outras threads via sync_to_async, cada uma
+# com sua conexão; o contexto é copiado para essas threads.
+_active_profiler = contextvars.ContextVar('active_query_profiler', default=None)
+
+
+class QueryProfiler:
+    """execute_wrapper que conta as consultas e guarda as mais lentas."""
+
+    def __init__(self, keep=SLOW_QUERIES_KEPT):
+        self.keep = keep
+        self.count = 0
+        self.total = 0.0
+        self._slowest = []  # heap mínimo de (duração, seq, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.total += elapsed
+            item = (elapsed, self.count, sql)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, item)
+            elif elapsed > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, item)
+
+    @property
+    def slowest(self):
+        return [(elapsed, sql) for elapsed, _seq, sql in sorted(self._slowest, reverse=True)]
+
+
+def _profiled_execute(execute, sql, params, many, context):
+    profiler = _active_profiler.get()
+    if profiler is None:
+        return execute(sql, params, many, context)
+    return profiler(execute, sql, params, many, context)
+
+
+def _install_wrapper(connection):
+    if _profiled_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_profiled_execute)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    _install_wrapper(connection)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or getattr(match.func, 'view_class', match.func).__qualname__
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+        self.budgets = getattr(settings, 'PROFILING_QUERY_BUDGETS', {})
+        self.slow_query_seconds = getattr(settings, 'PROFILING_SLOW_QUERY_MS', 100) / 1000
+        self.debug = settings.DEBUG
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+        connection_created.connect(_on_connection_created, dispatch_uid='core.profiling')
+        for connection in connections.all(initialized_only=True):
+            _install_wrapper(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        profiler = QueryProfiler()
+        token = _active_profiler.set(profiler)
+        try:
+            response = self.get_response(request)
+        finally:
+            _active_profiler.reset(token)
+        self._report(request, response, profiler, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+
+        start = time.perf_counter()
+        profiler = QueryProfiler()
+        token = _active_profiler.set(profiler)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _active_profiler.reset(token)
+        self._report(request, response, profiler, time.perf_counter() - start)
+        return response
+
+    def _report(self, request, response, profiler, elapsed):
+        view = _view_name(request)
+        request_seconds.observe(elapsed, view=view)
+        request_db_seconds.observe(profiler.total, view=view)
+        request_queries.observe(profiler.count, view=view)
+
+        budget = self.budgets.get(view)
+        if budget is not None and profiler.count > budget:
+            budget_exceeded_total.inc(view=view)
+            print(f"⚠️ {view}: {profiler.count} consultas (orçamento {budget})")
+
+        if self.debug:
+            response['X-DB-Queries'] = str(profiler.count)
+            response['X-DB-Time-ms'] = f"{profiler.total * 1000:.1f}"
+            response['Server-Timing'] = f"db;dur={profiler.total * 1000:.1f}, total;dur={elapsed * 1000:.1f}"
+        for duration, sql in profiler.slowest:
+            if duration >= self.slow_query_seconds:
+                print(f"🐢 {duration * 1000:.1f} ms {request.method} {request.path}: {sql[:300]}")
@@ -0,0 +1,143 @@
+"""
+Cadastro em lote de aparelhos (instalação de um prédio inteiro).
+
+Em vez de um POST /devices/ por aparelho (um exists() por device_id, um
+INSERT e o envio bloqueante da configuração Wi-Fi com 1,5 s de espera):
+- valida todas as linhas e confere os device_id numa única consulta;
+- grava com bulk_create;
+- enfileira as configurações Wi-Fi na fila de saída, espaçadas em
+  DEVICE_PROVISION_CONFIG_RATE por segundo; o flush da fila publica e marca
+  is_configured.
+
+Usado pelo POST /devices/provision/ e pelo comando provision_devices.
+"""
+import csv
+import io
+import json
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import Device
+from .outbox import queue_wifi_configs
+from .serializers import DeviceCreateSerializer
+from . import summary
+
+MAX_ROWS = getattr(settings, 'DEVICE_PROVISION_MAX_ROWS', 1000)
+CONFIG_RATE = getattr(settings, 'DEVICE_PROVISION_CONFIG_RATE', 5)
+BATCH_SIZE = 500
+
+DUPLICATE_ID = "Já existe um dispositivo com este ID"
+
+
+class ProvisionRowSerializer(DeviceCreateSerializer):
+    """Mesmos campos do cadastro; a unicidade do device_id é conferida em lote."""
+
+    class Meta(DeviceCreateSerializer.Meta):
+        fields = ['device_id', 'name', 'room', 'brand', 'wifi_ssid', 'wifi_password']
+        extra_kwargs = {
+            **DeviceCreateSerializer.Meta.extra_kwargs,
+            # Sem o UniqueValidator automático (uma consulta por linha)
+            'device_id': {'required': True, 'validators': []},
+        }
+
+    def validate_device_id(self, value):
+        return value
+
+
+def wifi_setup_payload(device):
+    """Configuração Wi-Fi enviada à placa após o cadastro (a mesma do _send_wifi_setup das views)."""
+    return {
+        "type": "config",
+        "wifi_ssid": device.wifi_ssid,
+        "wifi_password": device.wifi_password,
+        "device_name": device.name,
+        "brand": device.brand,
+        "timestamp": int(time.time())
+    }
+
+
+def load_rows(data):
+    """Aceita uma lista de aparelhos ou {"devices": [...]}."""
+    if isinstance(data, dict):
+        data = data.get('devices')
+    if not isinstance(data, list):
+        raise ValueError('Envie uma lista de aparelhos (ou {"devices": [...]}).')
+    return data
+
+
+def read_rows(text, data_format):
+    """Linhas de um arquivo CSV (com cabeçalho) ou JSON."""
+    if data_format == 'json':
+        try:
+            return load_rows(json.loads(text))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON inválido: {e}")
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or 'device_id' not in [name.strip() for name in reader.fieldnames]:
+        raise ValueError("O CSV precisa de cabeçalho com a coluna device_id.")
+    return [
+        {key.strip(): (value or '').strip() for key, value in row.items() if key}
+        for row in reader
+    ]
+
+
+def file_format(filename):
+    return 'json' if filename.lower().endswith('.json') else 'csv'
+
+
+def provision(user, rows, per_second=CONFIG_RATE):
+    """
+    Cadastra `rows` para `user`. Retorna (resultados, criados): um resultado
+    por linha, na ordem recebida, com status "created" (id e horário previsto
+    da configuração Wi-Fi) ou "error" (erros no formato do DRF).
+    """
+    results, pending = [], []
+    for number, row in enumerate(rows, start=1):
+        result = {"row": number, "device_id": row.get('device_id') if isinstance(row, dict) else None}
+        results.append(result)
+        if not isinstance(row, dict):
+            result.update(status="error", errors={"non_field_errors": ["Linha inválida."]})
+            continue
+        serializer = ProvisionRowSerializer(data=row)
+        if not serializer.is_valid():
+            result.update(status="error", errors=serializer.errors)
+            continue
+        pending.append((result, serializer.validated_data))
+
+    # Uma consulta para todos os ids; repetidos no próprio arquivo valem só na primeira linha
+    taken = set(
+        Device.objects.filter(device_id__in=[data['device_id'] for _, data in pending])
+        .values_list('device_id', flat=True)
+    )
+    accepted = []
+    for result, data in pending:
+        if data['device_id'] in taken:
+            result.update(status="error", errors={"device_id": [DUPLICATE_ID]})
+            continue
+        taken.add(data['device_id'])
+        accepted.append((result, Device(user=user, is_registered=True, **data)))
+
+    devices = [device for _, device in accepted]
+    try:
+        with transaction.atomic():
+            Device.objects.bulk_create(devices, batch_size=BATCH_SIZE)
+    except IntegrityError:
+        # Outro cadastro gravou um dos ids entre a conferência e o INSERT: nada foi gravado
+        for result, _ in accepted:
+            result.update(status="error", errors={"device_id": [f"{DUPLICATE_ID} (cadastro simultâneo); tente de novo."]})
+        return results, 0
+
+    # bulk_create não dispara o post_save que invalida o resumo
+    summary.invalidate(user.pk)
+
+    scheduled = queue_wifi_configs(
+        [(device, wifi_setup_payload(device)) for device in devices if device.wifi_ssid and device.wifi_password],
+        per_second,
+    )
+    for result, device in accepted:
+        config_at = scheduled.get(device.pk)
+        result.update(status="created", id=device.pk, config_at=config_at.isoformat() if config_at else None)
+    return results, len(accepted)
+
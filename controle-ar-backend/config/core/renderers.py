@@ -0,0 +1,43 @@
+"""
+Renderer JSON do DRF com orjson (bem mais rápido que o json da stdlib na
+lista de dispositivos, que usa fields='__all__').
+
+Segue o JSONRenderer do DRF onde importa para os clientes: datas/horas,
+Decimal, UUID, textos traduzíveis (lazy) etc. passam pelo
+encoders.JSONEncoder do DRF (ex. datetime UTC termina em "Z"), saída
+compacta em UTF-8 e \\u2028/\\u2029 escapados. Não é idêntico byte a byte:
+- floats podem sair em outra grafia (1e16 em vez de 1e+16), mesmo valor;
+- NaN/Infinity viram null, em vez do erro "Out of range float values" do DRF.
+O que o orjson recusa (ex. inteiros acima de 64 bits) volta para o renderer
+original, assim como a saída indentada (navegador da API) ou a falta do
+orjson instalado.
+"""
+from rest_framework.utils import encoders
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # dependência opcional
+    orjson = None
+
+_drf_default = encoders.JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+    options = 0 if orjson is None else orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_drf_default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
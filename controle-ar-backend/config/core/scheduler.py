@@ -0,0 +1,199 @@
+"""
+Motor de agendamentos (comandos únicos e recorrentes).
+
+Os próximos disparos ficam em um min-heap em memória, então cada ciclo só
+olha o topo em vez de varrer todos os agendamentos. Disparos que vencem no
+mesmo instante são agrupados em uma única publicação MQTT.
+
+Cada disparo é "reivindicado" com um UPDATE condicional sobre next_run_at:
+só quem consegue avançar o campo envia o comando. Isso evita disparo duplo
+após um restart ou com mais de um agendador rodando.
+"""
+import heapq
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Device, Schedule
+from .mqtt_helper import send_commands_batch
+from .outbox import queue_commands
+from . import shadow, summary, usage
+
+# Atrasos maiores que isso (ex.: agendador parado por horas) não disparam, só reagendam
+MISFIRE_GRACE = timedelta(seconds=getattr(settings, 'SCHEDULER_MISFIRE_GRACE', 3600))
+# Intervalo (s) para buscar agendamentos criados/alterados pela API
+SYNC_INTERVAL = getattr(settings, 'SCHEDULER_SYNC_INTERVAL', 10)
+PUBLISH_BATCH_SIZE = 500
+
+
+class Scheduler:
+    def __init__(self, publisher=send_commands_batch):
+        self.publisher = publisher
+        self.heap = []
+        self.known = {}  # pk -> next_run_at esperado (entradas diferentes no heap são obsoletas)
+        self.synced_at = None
+
+    # ============================================================
+    #  HEAP
+    # ============================================================
+    def _push(self, pk, next_run):
+        self.known[pk] = next_run
+        heapq.heappush(self.heap, (next_run, pk))
+
+    def load(self):
+        """Carrega todos os agendamentos ativos (usado na partida)."""
+        self.synced_at = timezone.now()
+        self.known = dict(
+            Schedule.objects
+            .filter(is_active=True, next_run_at__isnull=False)
+            .values_list('pk', 'next_run_at')
+        )
+        self.heap = [(next_run, pk) for pk, next_run in self.known.items()]
+        heapq.heapify(self.heap)
+        return len(self.heap)
+
+    def sync(self):
+        """Aplica criações e edições feitas pela API desde a última leitura."""
+        # Pequena sobreposição cobre diferenças de relógio entre processos
+        since = self.synced_at - timedelta(seconds=5)
+        self.synced_at = timezone.now()
+        changed = Schedule.objects.filter(updated_at__gte=since).values_list('pk', 'is_active', 'next_run_at')
+        for pk, is_active, next_run in changed:
+            if is_active and next_run:
+                if self.known.get(pk) != next_run:
+                    self._push(pk, next_run)
+            else:
+                self.known.pop(pk, None)
+
+        # Compacta o heap quando as entradas obsoletas dominam
+        if len(self.heap) > 2 * len(self.known) + 100:
+            self.heap = [(next_run, pk) for pk, next_run in self.known.items()]
+            heapq.heapify(self.heap)
+
+    def seconds_until_next(self, now=None):
+        now = now or timezone.now()
+        while self.heap and self.known.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None
+        return max((self.heap[0][0] - now).total_seconds(), 0)
+
+    # ============================================================
+    #  DISPAROS
+    # ============================================================
+    def run_due(self, now=None):
+        """Dispara tudo que venceu até `now`. Retorna quantos agendamentos rodaram."""
+        now = now or timezone.now()
+        due = {}
+        while self.heap and self.heap[0][0] <= now:
+            run_at, pk = heapq.heappop(self.heap)
+            if self.known.get(pk) == run_at:
+                due[pk] = run_at
+        if not due:
+            return 0
+
+        fired = []
+        schedules = Schedule.objects.filter(pk__in=due.keys(), is_active=True).select_related('device')
+        for schedule in schedules:
+            expected = due.pop(schedule.pk)
+            if schedule.next_run_at != expected:
+                # Editado desde a última sincronização: reagenda com o valor atual
+                if schedule.next_run_at:
+                    self._push(schedule.pk, schedule.next_run_at)
+                continue
+
+            next_run = schedule.compute_next_run(after=now)
+            missed = now - expected > MISFIRE_GRACE
+            claimed = Schedule.objects.filter(
+                pk=schedule.pk, is_active=True, next_run_at=expected
+            ).update(
+                next_run_at=next_run,
+                is_active=next_run is not None,
+                last_run_at=F('last_run_at') if missed else now
+            )
+            self.known.pop(schedule.pk, None)
+            if next_run:
+                self._push(schedule.pk, next_run)
+            if not claimed:
+                continue
+            if missed:
+                print(f"⏭️ Agendamento '{schedule.name}' perdido em {expected:%d/%m %H:%M} (fora da tolerância) — reagendado")
+                continue
+            fired.append(schedule)
+
+        # Removidos ou desativados entre a sincronização e o disparo
+        for pk in due:
+            self.known.pop(pk, None)
+
+        if fired:
+            self.fire(fired, now)
+        return len(fired)
+
+    def _resolve_targets(self, schedules):
+        """Mapeia cada aparelho alvo para o agendamento que o comanda (uma consulta)."""
+        query = Q(pk__in=[s.device_id for s in schedules if s.device_id])
+        for schedule in schedules:
+            if not schedule.device_id and schedule.room:
+                query |= Q(user_id=schedule.user_id, room=schedule.room)
+        devices = list(Device.objects.filter(query))
+        by_pk = {device.pk: device for device in devices}
+        by_room = {}
+        for device in devices:
+            by_room.setdefault((device.user_id, device.room), []).append(device)
+
+        targets = {}
+        for schedule in schedules:
+            if not schedule.device_id:
+                for device in by_room.get((schedule.user_id, schedule.room), []):
+                    targets[device.pk] = (device, schedule)
+        # Agendamento de um aparelho específico tem prioridade sobre o do cômodo
+        for schedule in schedules:
+            device = by_pk.get(schedule.device_id)
+            if device and device.user_id == schedule.user_id:
+                targets[device.pk] = (device, schedule)
+        return list(targets.values())
+
+    def fire(self, schedules, now):
+        targets = self._resolve_targets(schedules)
+        if not targets:
+            return
+
+        changes = []
+        for device, schedule in targets:
+            changes.append((device, usage.snapshot(device)))
+            device.power = schedule.power
+            device.temperature = schedule.temperature
+            device.mode = schedule.mode
+            device.last_command = now
+            device.updated_at = now
+            # Como o control: o shadow passa a esperar este estado (ver core/shadow.py)
+            shadow.set_desired(device, now)
+
+        devices = [device for device, _ in targets]
+        Device.objects.bulk_update(
+            devices, ['power', 'temperature', 'mode', 'last_command', 'updated_at', *shadow.DESIRED_UPDATE_FIELDS]
+        )
+        for user_id in {device.user_id for device in devices}:
+            summary.invalidate(user_id)
+        usage.record_transitions(changes, source='command', at=now)
+
+        commands = [
+            (device, {**schedule.command_payload(), "brand": device.brand})
+            for device, schedule in targets
+        ]
+        # O estado já foi gravado e o disparo reivindicado: lote que o broker
+        # recusar vai para a fila de saída em vez de se perder
+        queued = []
+        for start in range(0, len(commands), PUBLISH_BATCH_SIZE):
+            batch = commands[start:start + PUBLISH_BATCH_SIZE]
+            if not self.publisher([(device.device_id, payload) for device, payload in batch]):
+                queued.extend(batch)
+        if queued:
+            queue_commands(queued)
+
+        names = ", ".join(sorted({schedule.name for _, schedule in targets}))
+        print(f"⏰ {len(commands) - len(queued)} comandos agendados enviados ({names})")
+        if queued:
+            print(f"📥 {len(queued)} comandos agendados na fila de saída (broker indisponível)")
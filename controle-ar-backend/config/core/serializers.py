@@ -1,7 +1,12 @@
 from rest_framework import serializers
-from .models import Device
+from django.utils import timezone
+from .models import Device, DeviceDailyUsage, RoomDailyUsage, Schedule
+from .cron import CronExpression, CronError
 
 class DeviceSerializer(serializers.ModelSerializer):
+    # Shadow: True quando o último comando já foi confirmado pela placa
+    in_sync = serializers.BooleanField(read_only=True)
+
     class Meta:
         model = Device
         fields = '__all__'
@@ -12,7 +17,17 @@ class DeviceSerializer(serializers.ModelSerializer):
             'mode',
             'is_configured',
             'last_sent',
-            'last_command'
+            'last_command',
+            'desired',
+            'desired_version',
+            'desired_at',
+            'reported',
+            'reported_version',
+            'reported_at',
+            'is_unstable',
+            'unstable_since',
+            'last_unstable_at',
+            'unstable_episodes'
         ]
         def validate_brand(self, value):
             if not value:
@@ -56,4 +71,67 @@ class CommandSerializer(serializers.Serializer):
         # Lógica para garantir que temos uma temperatura, independente do nome da chave
         if 'temp' not in data and 'temperature' not in data:
             raise serializers.ValidationError("É necessário informar a temperatura (temp ou temperature).")
-        return data
\ No newline at end of file
+        return data
+
+
+class DeviceDailyUsageSerializer(serializers.ModelSerializer):
+    average_setpoint = serializers.FloatField(read_only=True)
+    mode_breakdown = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = DeviceDailyUsage
+        fields = ['day', 'on_seconds', 'mode_breakdown', 'average_setpoint', 'command_count']
+
+
+class RoomDailyUsageSerializer(serializers.ModelSerializer):
+    average_setpoint = serializers.FloatField(read_only=True)
+    mode_breakdown = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = RoomDailyUsage
+        fields = ['room', 'day', 'on_seconds', 'mode_breakdown', 'average_setpoint', 'command_count']
+
+
+class ScheduleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Schedule
+        fields = [
+            'id', 'name', 'device', 'room', 'kind', 'run_at', 'cron',
+            'power', 'temperature', 'mode', 'is_active',
+            'next_run_at', 'last_run_at', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['next_run_at', 'last_run_at', 'created_at', 'updated_at']
+        extra_kwargs = {
+            'temperature': {'min_value': 16, 'max_value': 30},
+        }
+
+    def validate_device(self, value):
+        request = self.context.get('request')
+        if value and request and value.user_id != request.user.id:
+            raise serializers.ValidationError("Dispositivo não pertence ao usuário.")
+        return value
+
+    def validate(self, attrs):
+        # Em PATCH, completa com os valores atuais para validar o conjunto
+        merged = {
+            field: attrs.get(field, getattr(self.instance, field, None))
+            for field in ('device', 'room', 'kind', 'run_at', 'cron', 'is_active')
+        }
+
+        if bool(merged['device']) == bool(merged['room']):
+            raise serializers.ValidationError("Informe um dispositivo OU um cômodo.")
+
+        schedule = Schedule(**{k: v for k, v in merged.items() if v is not None})
+        if merged['kind'] == 'recurring':
+            try:
+                CronExpression(merged['cron'] or '')
+            except CronError as e:
+                raise serializers.ValidationError({'cron': str(e)})
+        else:
+            if not merged['run_at']:
+                raise serializers.ValidationError({'run_at': "Obrigatório para agendamentos únicos."})
+            if merged['run_at'] <= timezone.now() and 'run_at' in attrs:
+                raise serializers.ValidationError({'run_at': "A data deve estar no futuro."})
+
+        attrs['next_run_at'] = schedule.compute_next_run() if merged['is_active'] is not False else None
+        return attrs
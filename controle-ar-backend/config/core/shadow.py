@@ -0,0 +1,110 @@
+"""
+Shadow do dispositivo: estado desejado (comandos) x estado reportado (placa).
+
+- desired / desired_version / desired_at: gravados pelo `control`.
+- reported / reported_version / reported_at: gravados pelo ouvinte MQTT.
+  As versões só crescem e mudam apenas quando o conteúdo muda.
+- Toda mensagem de estado da placa traz `timestamp` (epoch via NTP). Se for
+  mais antigo que o reported_at gravado (estado retido reentregue, mensagem
+  atrasada), a mensagem é descartada antes de qualquer escrita. Sem NTP a
+  placa manda segundos desde o boot; esses não servem para ordenar e a
+  mensagem é aceita pela ordem de chegada.
+- Heartbeat idêntico ao estado gravado não faz save(): só renova o
+  last_seen, e no máximo a cada LAST_SEEN_RESOLUTION segundos.
+
+Os campos power/temperature/mode continuam sendo o estado exibido: o
+`control` os atualiza na hora e o próximo relato da placa prevalece.
+in_sync diz se o último pedido (desired) já foi confirmado (reported).
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Device
+from . import metrics
+
+# Chaves da mensagem da placa -> campos do Device
+REPORTED_KEYS = {"power": "power", "temp": "temperature", "mode": "mode"}
+# Abaixo disso o firmware está sem NTP e manda segundos desde o boot (2017-07-14)
+MIN_EPOCH = 1_500_000_000
+LAST_SEEN_RESOLUTION = timedelta(seconds=getattr(settings, 'SHADOW_LAST_SEEN_RESOLUTION', 30))
+
+REPORT_UPDATE_FIELDS = [
+    'is_online', 'last_seen', 'power', 'temperature', 'mode',
+    'reported', 'reported_version', 'reported_at', 'updated_at',
+]
+DESIRED_UPDATE_FIELDS = ['desired', 'desired_version', 'desired_at']
+
+reports_total = metrics.counter(
+    'device_shadow_reports_total', "Mensagens de estado por resultado", ('result',)
+)
+
+
+def report_time(data, now=None):
+    """Timestamp da placa como datetime, ou None se não for epoch confiável."""
+    try:
+        value = int(data.get("timestamp") or 0)
+    except (TypeError, ValueError):
+        return None
+    if value < MIN_EPOCH:
+        return None
+    now = now or timezone.now()
+    # Relógio adiantado não pode travar as próximas mensagens: limita a agora
+    return min(datetime.fromtimestamp(value, tz=dt_timezone.utc), now)
+
+
+def reported_state(data):
+    return {field: data[key] for key, field in REPORTED_KEYS.items() if key in data}
+
+
+def is_stale(device, reported_at):
+    return reported_at is not None and device.reported_at is not None and reported_at < device.reported_at
+
+
+def apply_report(device, data, now=None):
+    """
+    Aplica uma mensagem de estado ao device (sem salvar).
+    Retorna 'stale', 'unchanged' ou 'changed'.
+    """
+    reported_at = report_time(data, now)
+    if is_stale(device, reported_at):
+        reports_total.inc(result='stale')
+        return 'stale'
+
+    if reported_at is not None:
+        device.reported_at = reported_at
+    state = {**device.reported, **reported_state(data)}
+    shown = {field: getattr(device, field) for field in state}
+    if state == device.reported and shown == state and device.is_online:
+        reports_total.inc(result='unchanged')
+        return 'unchanged'
+
+    for field, value in state.items():
+        setattr(device, field, value)
+    if state != device.reported:
+        device.reported = state
+        device.reported_version += 1
+    reports_total.inc(result='changed')
+    return 'changed'
+
+
+def touch(device, now=None):
+    """Renova o last_seen sem save(); pula se a última renovação for recente."""
+    now = now or timezone.now()
+    if device.last_seen and now - device.last_seen < LAST_SEEN_RESOLUTION:
+        return False
+    fields = {'last_seen': now}
+    if device.reported_at is not None:
+        fields['reported_at'] = device.reported_at
+    Device.objects.filter(pk=device.pk).update(**fields)
+    device.last_seen = now
+    return True
+
+
+def set_desired(device, now=None):
+    """Registra o estado atual do device (após um comando) como desejado."""
+    device.desired = {"power": device.power, "temperature": device.temperature, "mode": device.mode}
+    device.desired_version += 1
+    device.desired_at = now or timezone.now()
+
@@ -0,0 +1,22 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Device
+from . import summary
+
+
+@receiver(post_init, sender=Device)
+def remember_owner(sender, instance, **kwargs):
+    """Guarda o dono carregado do banco (sem consulta extra se o campo foi adiado)."""
+    instance._loaded_user_id = instance.__dict__.get('user_id')
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def invalidate_fleet_summary(sender, instance, **kwargs):
+    """Qualquer mudança no aparelho derruba o resumo em cache do dono (e do dono anterior, se mudou)."""
+    summary.invalidate(instance.user_id)
+    previous = getattr(instance, '_loaded_user_id', None)
+    if previous != instance.user_id:
+        summary.invalidate(previous)
+    instance._loaded_user_id = instance.user_id
@@ -0,0 +1,81 @@
+"""
+Resumo da frota do usuário (contagens por status, modo, marca e cômodo).
+
+Calculado com uma única agregação values().annotate() e guardado no cache
+por alguns segundos; qualquer alteração de Device invalida a entrada do dono.
+O cache só é usado quando é compartilhado (FLEET_SUMMARY_CACHED, ligado junto
+com REDIS_URL): as invalidações vêm também do listener, que é outro processo.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Device
+
+SUMMARY_TTL = getattr(settings, 'FLEET_SUMMARY_TTL', 15)
+CACHED = getattr(settings, 'FLEET_SUMMARY_CACHED', False)
+
+
+def cache_key(user_id):
+    return f"fleet_summary:{user_id}"
+
+
+def build_summary(user_id):
+    groups = (
+        Device.objects
+        .filter(user_id=user_id)
+        .order_by()  # remove o ordering padrão do Meta do GROUP BY
+        .values('is_online', 'power', 'mode', 'brand', 'room')
+        .annotate(total=Count('id'))
+    )
+
+    total = 0
+    online = {'online': 0, 'offline': 0}
+    power = {'on': 0, 'off': 0}
+    modes = defaultdict(int)
+    brands = defaultdict(int)
+    rooms = defaultdict(lambda: {'total': 0, 'online': 0, 'on': 0})
+
+    for group in groups:
+        count = group['total']
+        total += count
+        online['online' if group['is_online'] else 'offline'] += count
+        power['on' if group['power'] else 'off'] += count
+        modes[group['mode']] += count
+        brands[group['brand']] += count
+
+        room = rooms[group['room']]
+        room['total'] += count
+        if group['is_online']:
+            room['online'] += count
+        if group['power']:
+            room['on'] += count
+
+    return {
+        'total': total,
+        'is_online': online,
+        'power': power,
+        'mode': dict(modes),
+        'brand': dict(brands),
+        'rooms': [{'room': name, **counts} for name, counts in sorted(rooms.items())],
+        'generated_at': timezone.now(),
+    }
+
+
+def get_summary(user_id):
+    if not CACHED:
+        return build_summary(user_id)
+    key = cache_key(user_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_summary(user_id)
+        cache.set(key, summary, SUMMARY_TTL)
+    return summary
+
+
+def invalidate(user_id):
+    if user_id:
+        cache.delete(cache_key(user_id))
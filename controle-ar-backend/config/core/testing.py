@@ -0,0 +1,41 @@
+"""
+Ajudantes para testes: orçamento de consultas SQL por endpoint.
+
+    class DeviceApiTests(QueryBudgetMixin, APITestCase):
+        def test_list(self):
+            with self.assertQueryBudget(4):
+                self.client.get('/api/devices/')
+
+Se a chamada fizer mais consultas que o orçamento, o teste falha listando
+todas elas; assim um N+1 novo quebra o CI em vez de passar despercebido.
+"""
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def assert_query_budget(budget, using=DEFAULT_DB_ALIAS, label=None):
+    """Falha se o bloco fizer mais de `budget` consultas em `using`."""
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    executed = len(context.captured_queries)
+    if executed > budget:
+        queries = "\n".join(
+            f"{index}. {query['sql']}" for index, query in enumerate(context.captured_queries, start=1)
+        )
+        raise QueryBudgetExceeded(
+            f"{label or 'Bloco'}: {executed} consultas, orçamento {budget}\n{queries}"
+        )
+
+
+class QueryBudgetMixin:
+    """Mixin para TestCase com assertQueryBudget (mesma regra de assert_query_budget)."""
+
+    def assertQueryBudget(self, budget, using=DEFAULT_DB_ALIAS, label=None):
+        return assert_query_budget(budget, using=using, label=label or self.id())
@@ -1,3 +1,1196 @@
-from django.test import TestCase
+import contextlib
+import csv
+import datetime
+import decimal
+import importlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models.query import QuerySet
+from django.test import Client, SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from . import (
+    analytics, db_health, db_router, exports, listener, mqtt_async, presence, provisioning, summary, usage
+)
+from .admin import ROOM_FILTER_CACHE_KEY, EstimatedCountPaginator, RoomListFilter
+from .circuit_breaker import CircuitBreaker
+from .mqtt_helper import broker_breaker
+from .cron import CronError, CronExpression
+from .ingest import Reconciler
+from .models import (
+    Device, DeviceDailyUsage, DeviceStateEvent, IdempotencyKey, OutboundMessage, RoomDailyUsage, Schedule,
+)
+from .renderers import ORJSONRenderer, orjson
+from .scheduler import MISFIRE_GRACE, Scheduler
+from .testing import QueryBudgetMixin, assert_query_budget
+
+
+class DeviceAPITestCase(APITestCase):
+    """Usuário autenticado com um aparelho; o envio ao broker é simulado."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='dono@example.com', full_name='Dono', password='senha-123')
+        self.device = Device.objects.create(
+            user=self.user, device_id='esp-teste', name='Sala', room='Sala', is_registered=True
+        )
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch('core.views.send_command_to_esp32', return_value=True)
+        self.publish = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def control(self, body, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(f'/api/devices/{self.device.pk}/control/', body, format='json', **headers)
+
+
+class IdempotencyTests(DeviceAPITestCase):
+    COMMAND = {"power": True, "temperature": 22, "mode": "cool"}
+
+    def test_same_key_and_body_replays_stored_response(self):
+        first = self.control(self.COMMAND, key='chave-1')
+        second = self.control(self.COMMAND, key='chave-1')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        # A repetição não publica nem grava de novo
+        self.assertEqual(self.publish.call_count, 1)
+        self.assertEqual(DeviceStateEvent.objects.filter(device=self.device, source='command').count(), 1)
+
+    def test_same_key_with_other_body_conflicts(self):
+        self.control(self.COMMAND, key='chave-2')
+        response = self.control({**self.COMMAND, "temperature": 18}, key='chave-2')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.publish.call_count, 1)
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.temperature, 22)
+
+    def test_client_error_releases_key(self):
+        invalid = self.control({**self.COMMAND, "mode": "turbo"}, key='chave-3')
+        self.assertEqual(invalid.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        response = self.control(self.COMMAND, key='chave-3')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(self.publish.call_count, 1)
+
+    def test_same_file_name_with_other_content_conflicts(self):
+        def upload(content):
+            return self.client.post(
+                '/api/devices/provision/', {'file': SimpleUploadedFile('aparelhos.csv', content)},
+                format='multipart', HTTP_IDEMPOTENCY_KEY='chave-arquivo',
+            )
+
+        first = upload(b"device_id,name,room,brand\nesp-lote-1,Sala 1,Sala,LG\n")
+        replay = upload(b"device_id,name,room,brand\nesp-lote-1,Sala 1,Sala,LG\n")
+        other = upload(b"device_id,name,room,brand\nesp-lote-2,Sala 2,Sala,LG\n")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(other.status_code, 422)
+        self.assertFalse(Device.objects.filter(device_id='esp-lote-2').exists())
+
+    def test_request_without_key_is_not_stored(self):
+        self.control(self.COMMAND)
+        self.control(self.COMMAND)
+
+        self.assertEqual(self.publish.call_count, 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class BrokerFailureTests(DeviceAPITestCase):
+    COMMAND = {"power": True, "temperature": 18, "mode": "cool"}
+
+    def test_rejected_publish_does_not_save_device(self):
+        self.publish.return_value = False
+        response = self.control(self.COMMAND)
+
+        self.assertEqual(response.status_code, 503)
+        self.device.refresh_from_db()
+        self.assertFalse(self.device.power)
+        self.assertFalse(DeviceStateEvent.objects.filter(device=self.device, source='command').exists())
+
+    def test_half_open_admits_only_the_probe(self):
+        breaker = CircuitBreaker('teste', failure_threshold=1, cooldown=0)
+        breaker.record_failure("fora do ar")
+
+        self.assertTrue(breaker.would_allow())
+        self.assertTrue(breaker.allow_request())
+        # Com a chamada de teste em andamento, as demais falham na hora
+        self.assertFalse(breaker.would_allow())
+        self.assertFalse(breaker.allow_request())
+
+
+class HealthTests(APITestCase):
+    def test_failures_do_not_leak_details(self):
+        def refuse(execute, sql, params, many, context):
+            raise OperationalError('could not connect to server: host "db.interno" port 5432')
+
+        broker_breaker.record_failure("[Errno 111] broker.interno:1883 recusou a conexão")
+        self.addCleanup(broker_breaker.record_success, 0)
+        with connection.execute_wrapper(refuse), contextlib.redirect_stdout(io.StringIO()) as log:
+            response = self.client.get('/api/health/')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['database'], 'erro')
+        self.assertNotIn('interno', response.content.decode())
+        # O detalhe continua disponível no log do servidor
+        self.assertIn('db.interno', log.getvalue())
+
+
+class DeviceQueryBudgetTests(QueryBudgetMixin, DeviceAPITestCase):
+    """Mesmos orçamentos que o ProfilingMiddleware vigia em produção (PROFILING_QUERY_BUDGETS)."""
+    BUDGETS = settings.PROFILING_QUERY_BUDGETS
+
+    def setUp(self):
+        super().setUp()
+        # Mais aparelhos na lista: um N+1 aparece como consultas a mais por linha
+        for i in range(5):
+            Device.objects.create(user=self.user, device_id=f'esp-extra-{i}', name='Quarto', room='Quarto')
+        patcher = mock.patch('core.views.send_wifi_config', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_list(self):
+        with self.assertQueryBudget(self.BUDGETS['device-list']):
+            response = self.client.get('/api/devices/')
+        self.assertEqual(len(response.json()), 6)
+
+    def test_retrieve(self):
+        with self.assertQueryBudget(self.BUDGETS['device-detail']):
+            response = self.client.get(f'/api/devices/{self.device.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_control(self):
+        # Primeiro comando do dia cria as linhas de uso; o orçamento vale para os seguintes
+        self.control({"power": True, "temperature": 22, "mode": "cool"})
+        with self.assertQueryBudget(self.BUDGETS['device-control']):
+            response = self.control({"power": True, "temperature": 20, "mode": "cool"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_update(self):
+        with assert_query_budget(self.BUDGETS['device-detail'], label='PATCH /api/devices/{id}/'):
+            response = self.client.patch(
+                f'/api/devices/{self.device.pk}/',
+                {"name": "Sala nova", "wifi_ssid": "casa", "wifi_password": "segredo"}, format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.device.refresh_from_db()
+        self.assertTrue(self.device.is_configured)
+
+
+class StormFlushTests(SimpleTestCase):
+    def setUp(self):
+        listener.ingest_buffer.drain()
+        self.addCleanup(listener.ingest_buffer.drain)
+        self.listener = listener.Listener(lock=mock.Mock())
+
+    def test_failed_batch_returns_to_buffer(self):
+        listener.ingest_buffer.add({"device_id": "esp-1", "power": True})
+        listener.ingest_buffer.add({"device_id": "esp-2", "power": False})
+
+        with mock.patch('core.listener.apply_batch', side_effect=RuntimeError("banco fora")):
+            self.listener._flush_ingest()
+        self.assertEqual(len(listener.ingest_buffer), 2)
+
+        with mock.patch('core.listener.apply_batch', return_value=(2, 0, 0)) as apply_batch:
+            self.listener._flush_ingest()
+        self.assertEqual(set(apply_batch.call_args.args[0]), {"esp-1", "esp-2"})
+        self.assertEqual(len(listener.ingest_buffer), 0)
+
+    def test_newer_message_wins_over_restored_batch(self):
+        listener.ingest_buffer.add({"device_id": "esp-1", "power": True})
+        messages = listener.ingest_buffer.drain()
+        listener.ingest_buffer.add({"device_id": "esp-1", "power": False})
+
+        listener.ingest_buffer.restore(messages)
+        self.assertFalse(listener.ingest_buffer.drain()["esp-1"]["power"])
+
+
+class ListenerSoakTests(TransactionTestCase):
+    """Versão curta do manage.py soak_listener: tráfego simulado com quedas da conexão."""
+
+    def counter_total(self, counter):
+        return sum(value for _name, value in counter.samples())
+
+    def test_no_failed_writes_after_connection_drops(self):
+        user = User.objects.create_user(email='soak@example.com', full_name='Soak', password='senha-123')
+        device_ids = [f'soak-{i}' for i in range(10)]
+        Device.objects.bulk_create([
+            Device(user=user, device_id=device_id, name=device_id, room='Soak', is_registered=True)
+            for device_id in device_ids
+        ])
+        failed_before = self.counter_total(listener.failed_total)
+        reconnects_before = self.counter_total(db_health.reconnects_total)
+
+        # Queda como a de um reinício do servidor: toda consulta falha até a conexão ser refeita
+        dropped = {'active': False}
+        real_close = connection.close
+
+        def dropped_connection(execute, sql, params, many, context):
+            if dropped['active']:
+                raise OperationalError("server closed the connection unexpectedly")
+            return execute(sql, params, many, context)
+
+        def reconnect():
+            dropped['active'] = False
+            real_close()
+
+        expected = {}
+        rng = random.Random(7)
+        with connection.execute_wrapper(dropped_connection), \
+                mock.patch.object(connection, 'close', side_effect=reconnect), \
+                contextlib.redirect_stdout(io.StringIO()):
+            for _drop in range(3):
+                for _ in range(40):
+                    state = {
+                        "device_id": rng.choice(device_ids), "power": rng.random() < 0.5,
+                        "temp": rng.randint(16, 30), "mode": "cool",
+                    }
+                    expected[state["device_id"]] = state
+                    listener.on_message(None, None, SimpleNamespace(payload=json.dumps(state).encode()))
+                dropped['active'] = True
+
+        self.assertEqual(self.counter_total(listener.failed_total) - failed_before, 0)
+        self.assertEqual(self.counter_total(db_health.reconnects_total) - reconnects_before, 2)
+        stored = {device.device_id: device for device in Device.objects.filter(device_id__in=device_ids)}
+        for device_id, state in expected.items():
+            self.assertEqual((stored[device_id].power, stored[device_id].temperature), (state["power"], state["temp"]))
+
+
+class EmbeddedListenerTests(SimpleTestCase):
+    """O ouvinte embutido só sobe pelos pontos de entrada do servidor, nunca pelo ready()."""
+
+    def setUp(self):
+        self.enterContext(mock.patch.object(listener, '_embedded', None))
+        self.Listener = self.enterContext(mock.patch.object(listener, 'Listener'))
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(listener.start_embedded())
+        self.Listener.assert_not_called()
+
+    @override_settings(MQTT_LISTENER_EMBEDDED=True)
+    def test_starts_once_when_enabled(self):
+        started = listener.start_embedded()
+        self.assertIs(listener.start_embedded(), started)
+        self.Listener.return_value.start_in_background.assert_called_once_with()
+
+    @override_settings(MQTT_LISTENER_EMBEDDED=True)
+    def test_app_ready_does_not_start_it(self):
+        # O ready() roda em migrate/shell/test: não pode consumir MQTT
+        apps.get_app_config('core').ready()
+        self.Listener.assert_not_called()
+
+    @override_settings(MQTT_LISTENER_EMBEDDED=True)
+    def test_wsgi_entrypoint_starts_it(self):
+        import config.wsgi
+        importlib.reload(config.wsgi)
+        self.Listener.return_value.start_in_background.assert_called_once_with()
+
+
+class DbHealthTests(TransactionTestCase):
+    @override_settings(DEBUG=True)
+    def test_query_log_is_cleared_after_each_unit(self):
+        def unit():
+            list(Device.objects.all())
+            # Em DEBUG a consulta da unidade ainda é registrada...
+            self.assertEqual(len(connection.queries), 1)
+
+        db_health.run(unit)
+        # ...mas o log não passa para a próxima unidade
+        self.assertEqual(connection.queries, [])
+
+        with self.assertRaises(ValueError):
+            db_health.run(lambda: (unit(), int('x')))
+        self.assertEqual(connection.queries, [])
+
+
+class LazyImportTests(SimpleTestCase):
+    """Num processo novo: paho e os tokens do simplejwt só carregam no primeiro uso."""
+
+    SCRIPT = """
+import json, os, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+import django
+django.setup()
+import accounts.models, core.admin, core.mqtt_async, core.mqtt_helper, core.scheduler, mqtt_listener
+loaded = lambda: sorted(name for name in sys.modules if name.startswith(('paho', 'rest_framework_simplejwt.tokens')))
+startup = loaded()
+# O URLconf importa as views do simplejwt (refresh); o paho continua tardio
+import config.urls
+print(json.dumps({"startup": startup, "urls": loaded()}))
+"""
+
+    def test_startup_does_not_import_paho_or_simplejwt_tokens(self):
+        env = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1', 'MQTT_LISTENER_EMBEDDED': 'False'}
+        result = subprocess.run(
+            [sys.executable, '-c', self.SCRIPT], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        loaded = json.loads(result.stdout.strip().splitlines()[-1])
+        self.assertEqual(loaded['startup'], [])
+        self.assertFalse([name for name in loaded['urls'] if name.startswith('paho')])
+
+
+@unittest.skipUnless(orjson, "orjson não instalado")
+class ORJSONRendererTests(SimpleTestCase):
+    def assertSameAsDRF(self, data):
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_matches_drf_for_api_payloads(self):
+        self.assertSameAsDRF({
+            "device_id": "esp-1", "power": True, "temperature": 22, "wifi_ssid": None,
+            "updated_at": datetime.datetime(2026, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc),
+            "day": datetime.date(2026, 1, 2), "kwh": decimal.Decimal("1.50"),
+            "room": "Sala\u2028de estar", 1: "chave numérica",
+        })
+
+    def test_falls_back_when_orjson_refuses(self):
+        self.assertSameAsDRF({"big": 2 ** 70})
+
+    def test_unserializable_value_still_raises(self):
+        with self.assertRaises(TypeError):
+            ORJSONRenderer().render({"value": object()})
+
+
+class ReconcilerTests(SimpleTestCase):
+    def test_add_after_finish_falls_through(self):
+        reconciler = Reconciler()
+        reconciler.start(now=0)
+        self.assertTrue(reconciler.add({"device_id": "esp-1", "power": True}, retained=True, now=0))
+
+        with mock.patch('core.ingest.apply_batch', return_value=(1, 0, 0)), \
+                contextlib.redirect_stdout(io.StringIO()):
+            reconciler.finish()
+
+        # Mensagem que chega depois do fim não fica presa no buffer da reconciliação
+        self.assertFalse(reconciler.add({"device_id": "esp-2", "power": True}, retained=False))
+        self.assertEqual(len(reconciler.buffer), 0)
+
+    def test_failed_finish_keeps_the_snapshot(self):
+        reconciler = Reconciler()
+        reconciler.start(now=0)
+        reconciler.add({"device_id": "esp-1", "power": True}, retained=True, now=0)
+
+        with mock.patch('core.ingest.apply_batch', side_effect=RuntimeError("banco fora")):
+            with self.assertRaises(RuntimeError):
+                reconciler.finish()
+
+        self.assertTrue(reconciler.active)
+        self.assertEqual(len(reconciler.buffer), 1)
+
+
+@unittest.skipUnless(analytics.available(), "numpy não instalado")
+class FlapDampingTests(DeviceAPITestCase):
+    STATE = {"device_id": "esp-teste", "power": False, "temp": 24, "mode": "cool"}
+
+    def setUp(self):
+        super().setUp()
+        presence.detector.clear()
+        self.addCleanup(presence.detector.clear)
+        self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+        listener.handle_status_update(dict(self.STATE))
+
+    def flap(self):
+        """Uma queda (watchdog) e uma volta (mensagem de estado)."""
+        Device.objects.filter(pk=self.device.pk).update(last_seen=timezone.now() - presence.OFFLINE_AFTER * 2)
+        listener.watchdog()
+        listener.handle_status_update(dict(self.STATE))
+
+    def test_detector_hysteresis(self):
+        detector = presence.FlapDetector(window=600, enter=4, exit=1)
+        for at, online in enumerate([False, True, False], start=1):
+            detector.observe('esp', online, at, initial=True)
+        self.assertFalse(detector.is_flapping('esp', 3, unstable=False))
+        detector.observe('esp', True, 4)
+        self.assertTrue(detector.is_flapping('esp', 4, unstable=False))
+        # Só sai da oscilação quando a janela esvazia até `exit` transições
+        self.assertTrue(detector.is_flapping('esp', 601, unstable=True))
+        self.assertFalse(detector.is_flapping('esp', 603, unstable=True))
+
+    def test_flapping_board_is_damped_and_reported(self):
+        Device.objects.create(user=self.user, device_id='esp-estavel', name='Quarto', room='Quarto', is_registered=True)
+        for _ in range(presence.FLAP_ENTER // 2):
+            self.flap()
+        self.device.refresh_from_db()
+        self.assertTrue(self.device.is_unstable)
+        self.assertTrue(self.device.is_online)
+        self.assertEqual(self.device.unstable_episodes, 1)
+
+        # Instável: as quedas e voltas seguintes não gravam o device nem eventos de uso
+        updated_at = self.device.updated_at
+        events = DeviceStateEvent.objects.filter(device=self.device).count()
+        for _ in range(3):
+            self.flap()
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.updated_at, updated_at)
+        self.assertEqual(DeviceStateEvent.objects.filter(device=self.device).count(), events)
+        self.assertTrue(self.device.is_online)
+
+        response = self.client.get('/api/devices/flapping/')
+        self.assertEqual([device['device_id'] for device in response.data], ['esp-teste'])
+        out = io.StringIO()
+        call_command('flapping_report', stdout=out)
+        self.assertIn('esp-teste', out.getvalue())
+        self.assertNotIn('esp-estavel', out.getvalue())
+
+        # Passada a janela sem sinal, o settle encerra o episódio com o estado final
+        later = timezone.now() + datetime.timedelta(seconds=presence.FLAP_WINDOW + 1)
+        self.assertEqual(presence.settle(later), 1)
+        self.device.refresh_from_db()
+        self.assertEqual((self.device.is_unstable, self.device.is_online), (False, False))
+        # Continua no relatório como oscilação recente
+        response = self.client.get('/api/devices/flapping/')
+        self.assertEqual([device['device_id'] for device in response.data], ['esp-teste'])
+
+
+class ReconcileLiveRaceTests(DeviceAPITestCase):
+    def message(self, retain=False, **state):
+        data = {"device_id": "esp-teste", "mode": "cool", **state}
+        return SimpleNamespace(payload=json.dumps(data).encode(), retain=retain)
+
+    def test_live_message_during_the_batch_is_not_overwritten(self):
+        self.enterContext(mock.patch.object(listener, 'reconciler', Reconciler()))
+        self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+        now = int(timezone.now().timestamp())
+        listener.reconciler.start(now=0)
+        listener.on_message(None, None, self.message(retain=True, power=False, temp=20, timestamp=now - 60))
+
+        real_bulk_update = Device.objects.bulk_update
+        live = [self.message(power=True, temp=18, timestamp=now)]
+
+        def bulk_update(devices, fields, **kwargs):
+            # Mensagem ao vivo (mais nova) chegando enquanto o retrato grava
+            if live:
+                listener.on_message(None, None, live.pop())
+            return real_bulk_update(devices, fields, **kwargs)
+
+        with mock.patch.object(Device.objects, 'bulk_update', side_effect=bulk_update):
+            listener.reconciler.finish()
+
+        self.assertFalse(listener.reconciler.active)
+        self.device.refresh_from_db()
+        self.assertEqual((self.device.power, self.device.temperature), (True, 18))
+        self.assertEqual(int(self.device.reported_at.timestamp()), now)
+        # Depois da fase, o caminho normal volta a gravar direto
+        listener.on_message(None, None, self.message(power=True, temp=17, timestamp=now + 1))
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.temperature, 17)
+
+
+class AnalyticsTests(DeviceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.end = timezone.now()
+        self.start = self.end - datetime.timedelta(days=3)
+        other = Device.objects.create(user=self.user, device_id='esp-outro', name='Quarto', room='Quarto')
+        rng = random.Random(3)
+        events = []
+        # Um aparelho com histórico longo (mais que vários lotes) e outro curto
+        for device, count in ((self.device, 40), (other, 5)):
+            for i in range(count):
+                events.append(DeviceStateEvent(
+                    device=device, room=device.room, is_online=True, power=rng.random() < 0.8,
+                    temperature=rng.choice([16, 16, 22]), mode='cool',
+                    recorded_at=self.start + datetime.timedelta(hours=72 * (i + rng.random()) / count),
+                ))
+        DeviceStateEvent.objects.bulk_create(events)
+        self.devices = Device.objects.filter(user=self.user)
+
+    def report(self, chunk_rows):
+        return analytics.fleet_report(self.devices, self.start, self.end, low_setpoint=16, low_hours=2,
+                                      chunk_rows=chunk_rows)
+
+    def test_small_chunks_match_whole_history(self):
+        whole = self.report(chunk_rows=1000)
+        self.assertEqual(whole['samples'], 45)
+        self.assertTrue(whole['low_setpoint']['devices'])
+        for chunk_rows in (1, 2, 7):
+            with self.subTest(chunk_rows=chunk_rows):
+                split = self.report(chunk_rows)
+                self.assertEqual(split['samples'], whole['samples'])
+                self.assertEqual(split['devices'], whole['devices'])
+                self.assertEqual(split['rooms'], whole['rooms'])
+
+    def test_long_device_history_is_split(self):
+        index = {device.pk: i for i, device in enumerate(self.devices.order_by('pk'))}
+        chunks = list(analytics.iter_chunks(self.devices.filter(pk=self.device.pk), index, {},
+                                            self.start, self.end, chunk_rows=7))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk['ts']) <= 8 for chunk in chunks))
+        self.assertEqual([chunk['continued'] for chunk in chunks[-2:]], [True, False])
+
+    def test_rejects_parameters_outside_whitelist(self):
+        for query in ('days=12', 'setpoint=12', 'hours=0.1', 'hours=8.1', 'hours=nan'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/devices/analytics/?{query}').status_code, 400)
+
+    def test_equivalent_hours_share_cache_entry(self):
+        with mock.patch('core.analytics.fleet_report', return_value={}) as fleet_report:
+            self.client.get('/api/devices/analytics/?hours=8')
+            self.client.get('/api/devices/analytics/?hours=8.0')
+            self.assertEqual(fleet_report.call_count, 1)
+            self.assertEqual(self.client.get('/api/devices/analytics/?hours=8.5').status_code, 200)
+        self.assertEqual(fleet_report.call_count, 2)
+
+    def test_endpoint_is_throttled(self):
+        with mock.patch('core.analytics.fleet_report', return_value={}):
+            statuses = [self.client.get(f'/api/devices/analytics/?days={days}').status_code
+                        for days in analytics.WINDOW_DAYS * 3]
+        self.assertIn(429, statuses)
+        self.assertNotIn(429, statuses[:len(analytics.WINDOW_DAYS)])
+
+
+class UsageRollupTests(DeviceAPITestCase):
+    """Transições que atravessam a meia-noite: horas ligado, modos e setpoint médio por dia."""
+
+    def setUp(self):
+        super().setUp()
+        self.day1 = timezone.localdate() - datetime.timedelta(days=3)
+        self.day2 = self.day1 + datetime.timedelta(days=1)
+        midnight = timezone.make_aware(datetime.datetime.combine(self.day2, datetime.time.min))
+        # 22h ligado em 20 °C no frio; 1h passa para 24 °C no quente; 3h comando desliga
+        self.transition(midnight - datetime.timedelta(hours=2), is_online=True, power=True, temperature=20, mode='cool')
+        self.transition(midnight + datetime.timedelta(hours=1), temperature=24, mode='heat')
+        self.transition(midnight + datetime.timedelta(hours=3), source='command', power=False)
+
+    def transition(self, at, source='report', **state):
+        previous = usage.snapshot(self.device)
+        for field, value in state.items():
+            setattr(self.device, field, value)
+        return usage.record_transition(self.device, previous, source=source, at=at)
+
+    def assertExpectedDays(self, days):
+        self.assertEqual([row['day'] for row in days], [str(self.day1), str(self.day2)])
+        first, second = days
+        self.assertEqual(first['on_seconds'], 2 * 3600)
+        self.assertEqual(first['mode_breakdown']['cool'], 2 * 3600)
+        self.assertEqual(first['average_setpoint'], 20.0)
+        self.assertEqual(first['command_count'], 0)
+        self.assertEqual(second['on_seconds'], 3 * 3600)
+        self.assertEqual((second['mode_breakdown']['cool'], second['mode_breakdown']['heat']), (3600, 2 * 3600))
+        # (1 h x 20 + 2 h x 24) / 3 h
+        self.assertEqual(second['average_setpoint'], 22.7)
+        self.assertEqual(second['command_count'], 1)
+
+    def test_unchanged_report_is_ignored(self):
+        self.assertIsNone(self.transition(timezone.now()))
+        self.assertEqual(DeviceStateEvent.objects.filter(device=self.device).count(), 3)
+
+    def test_device_usage_endpoint(self):
+        response = self.client.get(
+            f'/api/devices/{self.device.pk}/usage/', {'start': str(self.day1), 'end': str(self.day2)}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertExpectedDays(response.json()['days'])
+
+    def test_rooms_usage_endpoint(self):
+        response = self.client.get('/api/devices/usage/rooms/', {'start': str(self.day1), 'end': str(self.day2)})
+        rooms = response.json()['rooms']
+        self.assertEqual({row['room'] for row in rooms}, {'Sala'})
+        self.assertExpectedDays(rooms)
+
+    def test_rebuild_matches_incremental_rollup(self):
+        fields = ('device_id', 'day', *usage.COUNTER_FIELDS)
+        incremental = list(DeviceDailyUsage.objects.values(*fields))
+        DeviceDailyUsage.objects.all().delete()
+        RoomDailyUsage.objects.all().delete()
+
+        call_command('rebuild_usage', stdout=io.StringIO())
+
+        self.assertEqual(list(DeviceDailyUsage.objects.values(*fields)), incremental)
+        response = self.client.get('/api/devices/usage/rooms/', {'start': str(self.day1), 'end': str(self.day2)})
+        self.assertExpectedDays(response.json()['rooms'])
+
+
+class ExportTests(DeviceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            Device.objects.create(user=self.user, device_id=f'esp-export-{i}', name=f'Quarto {i}', room='Quarto')
+        other = User.objects.create_user(email='outro@example.com', full_name='Outro', password='senha-123')
+        Device.objects.create(user=other, device_id='esp-alheio', name='Alheio')
+        moment = timezone.now() - datetime.timedelta(hours=1)
+        DeviceStateEvent.objects.bulk_create([
+            DeviceStateEvent(device=self.device, recorded_at=moment + datetime.timedelta(minutes=i),
+                             room='Sala', is_online=True, power=i % 2 == 0, temperature=20 + i)
+            for i in range(4)
+        ])
+
+    def export(self, url, **params):
+        # Blocos pequenos: a resposta sai em vários pedaços, como num export grande
+        with mock.patch.object(exports, 'STREAM_CHUNK_BYTES', 64), \
+                mock.patch.object(QuerySet, 'iterator', autospec=True, side_effect=QuerySet.iterator) as iterator:
+            response = self.client.get(url, params)
+            chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(iterator.call_args.kwargs, {'chunk_size': exports.DB_CHUNK_SIZE})
+        return response, chunks
+
+    def test_devices_csv(self):
+        response, chunks = self.export('/api/devices/export/')
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(response['Content-Type'], exports.CONTENT_TYPES['csv'])
+        self.assertIn('filename="devices.csv"', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO("".join(chunks))))
+        self.assertEqual(rows[0], list(exports.DEVICE_EXPORT_FIELDS))
+        self.assertEqual(
+            [row[1] for row in rows[1:]], ['esp-teste'] + [f'esp-export-{i}' for i in range(5)]
+        )
+
+    def test_history_ndjson(self):
+        response, chunks = self.export('/api/devices/history/export/', output='ndjson', device='esp-teste')
+
+        self.assertEqual(response['Content-Type'], exports.CONTENT_TYPES['ndjson'])
+        # Cada pedaço termina numa quebra de linha: nenhum objeto JSON fica partido entre dois
+        self.assertTrue(all(chunk.endswith("\n") for chunk in chunks))
+        lines = [json.loads(line) for line in "".join(chunks).splitlines()]
+        self.assertEqual([line['temperature'] for line in lines], [20, 21, 22, 23])
+        self.assertEqual(set(lines[0]), {exports._header(field) for field in exports.HISTORY_EXPORT_FIELDS})
+        self.assertEqual(lines[0]['device_id'], 'esp-teste')
+
+    def test_invalid_format(self):
+        self.assertEqual(self.client.get('/api/devices/export/', {'output': 'xml'}).status_code, 400)
+
+
+class ReplicaRoutingTests(DeviceAPITestCase):
+    """
+    Os testes não têm uma segunda base: o roteador só registra o alias que
+    escolheria (o de _read_alias) e a consulta segue no primário.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.enterContext(mock.patch.object(db_router, 'replica_configured', return_value=True))
+        self.routed = []
+
+        def db_for_read(router, model, **hints):
+            self.routed.append(db_router._read_alias.get())
+            return None
+
+        self.enterContext(mock.patch.object(
+            db_router.PrimaryReplicaRouter, 'db_for_read', autospec=True, side_effect=db_for_read
+        ))
+
+    def test_read_actions_use_the_replica(self):
+        self.assertEqual(self.client.get('/api/devices/').status_code, 200)
+        self.assertEqual(set(self.routed), {db_router.REPLICA_ALIAS})
+        # O alias não vaza para fora da requisição
+        self.assertIsNone(db_router._read_alias.get())
+
+    def test_writes_stay_on_the_primary(self):
+        self.assertEqual(self.control({"power": True, "temperature": 22, "mode": "cool"}).status_code, 200)
+        self.assertNotIn(db_router.REPLICA_ALIAS, self.routed)
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        self.control({"power": True, "temperature": 22, "mode": "cool"})
+        self.assertTrue(db_router.is_sticky(self.user.pk))
+        self.routed.clear()
+
+        self.client.get('/api/devices/')
+        self.assertTrue(self.routed)
+        self.assertNotIn(db_router.REPLICA_ALIAS, self.routed)
+
+    def test_export_stream_stays_on_the_replica(self):
+        # As linhas são lidas depois do finalize_response, com o alias já desfeito
+        response = self.client.get('/api/devices/export/')
+        b"".join(response.streaming_content)
+        self.assertEqual(set(self.routed), {db_router.REPLICA_ALIAS})
+
+
+class ProvisioningTests(DeviceAPITestCase):
+    URL = '/api/devices/provision/'
+
+    def row(self, device_id, **fields):
+        return {'device_id': device_id, 'name': device_id, 'room': 'Andar 1', 'brand': 'LG', **fields}
+
+    def test_mixed_rows(self):
+        rows = [
+            self.row('esp-p1', wifi_ssid='predio', wifi_password='senha-wifi'),
+            self.row('esp-p2'),
+            {'device_id': 'esp-p3', 'name': 'Sem cômodo', 'brand': 'LG'},
+            self.row('esp-teste'),
+            self.row('esp-p1'),
+            'não é um aparelho',
+        ]
+        response = self.client.post(self.URL, {'devices': rows}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 4))
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['created'] * 2 + ['error'] * 4)
+        self.assertIsNotNone(results[0]['config_at'])
+        self.assertIsNone(results[1]['config_at'])
+        self.assertIn('room', results[2]['errors'])
+        # Já cadastrado no banco e repetido no próprio arquivo: mesma mensagem
+        self.assertEqual(results[3]['errors'], {'device_id': [provisioning.DUPLICATE_ID]})
+        self.assertEqual(results[4]['errors'], {'device_id': [provisioning.DUPLICATE_ID]})
+        self.assertIn('non_field_errors', results[5]['errors'])
+
+        created = Device.objects.filter(device_id__in=['esp-p1', 'esp-p2'])
+        self.assertEqual({device.user_id for device in created}, {self.user.pk})
+        self.assertEqual(created.count(), 2)
+        # Só quem tem Wi-Fi recebe a configuração (envio + reenvio), pela fila
+        wifi = OutboundMessage.objects.filter(kind='wifi_config')
+        self.assertEqual(list(wifi.values_list('device__device_id', flat=True)), ['esp-p1'] * 2)
+        self.publish.assert_not_called()
+
+    def test_only_invalid_rows(self):
+        response = self.client.post(self.URL, [self.row('esp-teste')], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], 0)
+
+    @mock.patch.object(provisioning, 'BATCH_SIZE', 1)
+    def test_concurrent_insert_rolls_back_the_whole_batch(self):
+        real_bulk_create = Device.objects.bulk_create
+
+        def concurrent(devices, **kwargs):
+            # Outro cadastro grava esp-p2 depois da conferência dos ids
+            Device.objects.create(user=self.user, device_id='esp-p2', name='Outro', room='Sala')
+            return real_bulk_create(devices, **kwargs)
+
+        with mock.patch.object(Device.objects, 'bulk_create', side_effect=concurrent):
+            results, created = provisioning.provision(self.user, [self.row('esp-p1'), self.row('esp-p2')])
+
+        self.assertEqual(created, 0)
+        self.assertEqual([result['status'] for result in results], ['error', 'error'])
+        self.assertIn('cadastro simultâneo', results[0]['errors']['device_id'][0])
+        # O primeiro lote (esp-p1) já tinha sido inserido e foi desfeito junto
+        self.assertFalse(Device.objects.filter(device_id='esp-p1').exists())
+        self.assertFalse(OutboundMessage.objects.exists())
+
+    def test_provision_devices_command(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        path = os.path.join(directory, 'predio.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(
+                "device_id,name,room,brand,wifi_ssid,wifi_password\n"
+                "esp-cmd-1,Sala 101,Sala,LG,predio,senha-wifi\n"
+                "esp-teste,Repetido,Sala,LG,,\n"
+            )
+        out = io.StringIO()
+
+        call_command('provision_devices', path, user='dono@example.com', rate=10, stdout=out)
+
+        self.assertEqual(Device.objects.get(device_id='esp-cmd-1').user, self.user)
+        self.assertEqual(OutboundMessage.objects.filter(kind='wifi_config').count(), 2)
+        self.assertIn('1 de 2 aparelhos cadastrados', out.getvalue())
+        self.assertIn(provisioning.DUPLICATE_ID, out.getvalue())
+        with self.assertRaisesMessage(CommandError, 'não encontrado'):
+            call_command('provision_devices', path, user='ninguem@example.com', stdout=out)
+        with self.assertRaises(CommandError):
+            call_command('provision_devices', path, user='dono@example.com', rate=0, stdout=out)
+
+
+class DeviceAdminTests(DeviceAPITestCase):
+    CHANGELIST = '/admin/core/device/'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        staff = User.objects.create_superuser(email='admin@example.com', full_name='Admin', password='senha-123')
+        self.admin_client = Client()
+        self.admin_client.force_login(staff)
+        self.output = self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+        Device.objects.filter(pk=self.device.pk).update(power=True, temperature=21, is_online=True)
+        self.others = [
+            Device.objects.create(user=self.user, device_id=f'esp-admin-{i}', name=f'Quarto {i}', room='Quarto',
+                                  power=True, is_online=True, wifi_ssid='casa' if i else None)
+            for i in range(2)
+        ]
+
+    def action(self, name, devices):
+        return self.admin_client.post(self.CHANGELIST, {
+            'action': name, '_selected_action': [device.pk for device in devices],
+        })
+
+    @mock.patch('core.admin.ACTION_BATCH_SIZE', 2)
+    def test_power_off_updates_state_desired_usage_and_outbox(self):
+        devices = [self.device, *self.others]
+        versions = {device.pk: Device.objects.get(pk=device.pk).desired_version for device in devices}
+
+        self.assertEqual(self.action('power_off', devices).status_code, 302)
+
+        for device in Device.objects.filter(pk__in=versions):
+            self.assertFalse(device.power)
+            self.assertEqual(device.desired["power"], False)
+            self.assertEqual(device.desired_version, versions[device.pk] + 1)
+            self.assertTrue(DeviceStateEvent.objects.filter(device=device, source='command', power=False).exists())
+        commands = OutboundMessage.objects.filter(kind='command', status='pending')
+        self.assertEqual(sorted(commands.values_list('device_id', flat=True)), sorted(versions))
+        self.assertEqual(json.loads(commands.get(device=self.device).payload)["temp"], 21)
+        self.publish.assert_not_called()
+
+    def test_resend_wifi_config_skips_devices_without_ssid(self):
+        self.action('resend_wifi_config', self.others)
+
+        queued = OutboundMessage.objects.filter(kind='wifi_config')
+        # Envio + reenvio, só para a placa com SSID
+        self.assertEqual(list(queued.values_list('device_id', flat=True)), [self.others[1].pk] * 2)
+
+    def test_room_filter_is_cached(self):
+        self.assertEqual(self.admin_client.get(self.CHANGELIST).status_code, 200)
+        self.assertEqual(cache.get(ROOM_FILTER_CACHE_KEY), ['Quarto', 'Sala'])
+        Device.objects.create(user=self.user, device_id='esp-cozinha', name='Cozinha', room='Cozinha')
+
+        filter_ = RoomListFilter(None, {}, Device, None)
+        with self.assertNumQueries(0):
+            self.assertEqual(filter_.lookups(None, None), [('Quarto', 'Quarto'), ('Sala', 'Sala')])
+        response = self.admin_client.get(self.CHANGELIST, {'room': 'Quarto'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_estimated_count_only_without_filters(self):
+        paginator = EstimatedCountPaginator(Device.objects.all(), 100)
+        # SQLite não tem estimativa: conta de verdade
+        self.assertEqual(paginator.count, 3)
+
+        with mock.patch.object(EstimatedCountPaginator, '_estimate', return_value=50000):
+            self.assertEqual(EstimatedCountPaginator(Device.objects.all(), 100).count, 50000)
+            self.assertEqual(EstimatedCountPaginator(Device.objects.filter(room='Quarto'), 100).count, 2)
+        with mock.patch.object(EstimatedCountPaginator, '_estimate', return_value=10):
+            # Tabela pequena: o COUNT(*) é barato e exato
+            self.assertEqual(EstimatedCountPaginator(Device.objects.all(), 100).count, 3)
+
+
+class FleetSummaryTests(DeviceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        Device.objects.create(user=self.user, device_id='esp-2', name='Quarto', room='Quarto',
+                              is_online=True, power=True, mode='heat', brand='LG')
+        Device.objects.create(user=self.user, device_id='esp-3', name='Quarto 2', room='Quarto', is_online=True)
+        self.other = User.objects.create_user(email='outro@example.com', full_name='Outro', password='senha-123')
+
+    def fetch(self):
+        return self.client.get('/api/devices/summary/').json()
+
+    def test_counts(self):
+        data = self.fetch()
+
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['is_online'], {'online': 2, 'offline': 1})
+        self.assertEqual(data['power'], {'on': 1, 'off': 2})
+        self.assertEqual(data['mode'], {'cool': 2, 'heat': 1})
+        self.assertEqual(data['brand'], {'Carrier': 2, 'LG': 1})
+        self.assertEqual(data['rooms'], [
+            {'room': 'Quarto', 'total': 2, 'online': 2, 'on': 1},
+            {'room': 'Sala', 'total': 1, 'online': 0, 'on': 0},
+        ])
+
+    def test_local_cache_is_not_used(self):
+        # Sem cache compartilhado, uma mudança feita por outro processo aparece na hora
+        self.fetch()
+        Device.objects.filter(pk=self.device.pk).update(power=True)
+        self.assertEqual(self.fetch()['power'], {'on': 2, 'off': 1})
+
+    @mock.patch.object(summary, 'CACHED', True)
+    def test_save_invalidates_cached_summary(self):
+        self.fetch()
+        Device.objects.filter(pk=self.device.pk).update(power=True)
+        self.assertEqual(self.fetch()['power'], {'on': 1, 'off': 2})
+
+        self.device.power = True
+        self.device.save()
+        self.assertEqual(self.fetch()['power'], {'on': 2, 'off': 1})
+
+    @mock.patch.object(summary, 'CACHED', True)
+    def test_ownership_change_invalidates_both_owners(self):
+        self.assertEqual(summary.get_summary(self.user.pk)['total'], 3)
+        self.assertEqual(summary.get_summary(self.other.pk)['total'], 0)
+
+        device = Device.objects.get(pk=self.device.pk)
+        device.user = self.other
+        device.save()
+
+        self.assertEqual(summary.get_summary(self.user.pk)['total'], 2)
+        self.assertEqual(summary.get_summary(self.other.pk)['total'], 1)
+
+
+class CronTests(SimpleTestCase):
+    def at(self, *args):
+        return timezone.make_aware(datetime.datetime(*args))
+
+    def test_invalid_expressions(self):
+        for expression in ('* * * *', '60 * * * *', '*/0 * * * *', '5-1 * * * *', 'a * * * *'):
+            with self.subTest(expression=expression), self.assertRaises(CronError):
+                CronExpression(expression)
+
+    def test_next_run_is_strictly_after(self):
+        cron = CronExpression('*/15 8-18 * * *')
+        self.assertEqual(cron.next_after(self.at(2026, 3, 10, 8, 15)), self.at(2026, 3, 10, 8, 30))
+        self.assertEqual(cron.next_after(self.at(2026, 3, 10, 8, 14, 59)), self.at(2026, 3, 10, 8, 15))
+        self.assertEqual(cron.next_after(self.at(2026, 3, 10, 18, 45)), self.at(2026, 3, 11, 8, 0))
+
+    def test_weekdays_and_month_rollover(self):
+        # Dias úteis às 8h30: sexta depois do horário vai para segunda
+        self.assertEqual(
+            CronExpression('30 8 * * 1-5').next_after(self.at(2026, 1, 30, 9, 0)), self.at(2026, 2, 2, 8, 30)
+        )
+        self.assertEqual(CronExpression('0 0 29 2 *').next_after(self.at(2026, 3, 1)), self.at(2028, 2, 29))
+
+    def test_day_of_month_or_weekday(self):
+        # Dia 13 OU sexta-feira, como no cron
+        cron = CronExpression('0 12 13 * 5')
+        self.assertEqual(cron.next_after(self.at(2026, 2, 10)), self.at(2026, 2, 13, 12))
+        self.assertEqual(cron.next_after(self.at(2026, 2, 13, 13)), self.at(2026, 2, 20, 12))
+
+    @override_settings(TIME_ZONE='America/Sao_Paulo')
+    def test_local_time_without_dst(self):
+        # Sem horário de verão desde 2019: 8h locais são sempre 11h UTC
+        cron = CronExpression('0 8 * * *')
+        moment = datetime.datetime(2026, 1, 15, 12, 0, tzinfo=datetime.timezone.utc)
+        self.assertEqual(cron.next_after(moment), datetime.datetime(2026, 1, 16, 11, 0, tzinfo=datetime.timezone.utc))
+
+
+class SchedulerTests(DeviceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now().replace(microsecond=0)
+        self.publisher = mock.Mock(return_value=True)
+        self.output = self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+
+    def schedule(self, **fields):
+        fields = {'user': self.user, 'device': self.device, 'name': 'Ligar', 'power': True,
+                  'temperature': 21, 'mode': 'cool', 'next_run_at': self.now - datetime.timedelta(minutes=1),
+                  **fields}
+        return Schedule.objects.create(**fields)
+
+    def scheduler(self):
+        scheduler = Scheduler(publisher=self.publisher)
+        scheduler.load()
+        return scheduler
+
+    def test_once_fires_and_deactivates(self):
+        schedule = self.schedule(run_at=self.now - datetime.timedelta(minutes=1))
+
+        self.assertEqual(self.scheduler().run_due(self.now), 1)
+
+        self.publisher.assert_called_once_with([
+            ('esp-teste', {"power": True, "temp": 21, "mode": "cool", "brand": self.device.brand})
+        ])
+        schedule.refresh_from_db()
+        self.assertFalse(schedule.is_active)
+        self.assertEqual((schedule.next_run_at, schedule.last_run_at), (None, self.now))
+        self.device.refresh_from_db()
+        self.assertEqual((self.device.power, self.device.temperature), (True, 21))
+        self.assertTrue(DeviceStateEvent.objects.filter(device=self.device, source='command').exists())
+
+    def test_fire_records_desired_state(self):
+        version = self.device.desired_version
+        self.schedule(run_at=self.now - datetime.timedelta(minutes=1), temperature=19, mode='heat')
+
+        self.scheduler().run_due(self.now)
+
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.desired, {"power": True, "temperature": 19, "mode": "heat"})
+        self.assertEqual(self.device.desired_version, version + 1)
+        self.assertEqual(self.device.desired_at, self.now)
+
+    def test_recurring_is_rescheduled(self):
+        schedule = self.schedule(kind='recurring', cron='*/5 * * * *')
+
+        scheduler = self.scheduler()
+        scheduler.run_due(self.now)
+
+        schedule.refresh_from_db()
+        self.assertTrue(schedule.is_active)
+        self.assertEqual(schedule.next_run_at, CronExpression('*/5 * * * *').next_after(self.now))
+        self.assertEqual(scheduler.seconds_until_next(self.now), (schedule.next_run_at - self.now).total_seconds())
+
+    def test_two_schedulers_claim_once(self):
+        self.schedule(kind='recurring', cron='0 * * * *')
+        first, second = self.scheduler(), self.scheduler()
+
+        self.assertEqual(first.run_due(self.now), 1)
+        # O segundo leu o mesmo next_run_at, mas o UPDATE condicional já não casa
+        self.assertEqual(second.run_due(self.now), 0)
+        self.assertEqual(self.publisher.call_count, 1)
+
+    def test_missed_run_is_only_rescheduled(self):
+        schedule = self.schedule(
+            kind='recurring', cron='0 * * * *', next_run_at=self.now - MISFIRE_GRACE - datetime.timedelta(minutes=1)
+        )
+
+        self.assertEqual(self.scheduler().run_due(self.now), 0)
+        self.publisher.assert_not_called()
+        schedule.refresh_from_db()
+        self.assertGreater(schedule.next_run_at, self.now)
+        self.assertIsNone(schedule.last_run_at)
+
+    def test_rejected_publish_goes_to_outbox(self):
+        self.publisher.return_value = False
+        self.schedule(run_at=self.now - datetime.timedelta(minutes=1))
+
+        self.scheduler().run_due(self.now)
+
+        queued = OutboundMessage.objects.get(device=self.device)
+        self.assertEqual((queued.kind, queued.status), ('command', 'pending'))
+        self.assertEqual(json.loads(queued.payload)['temp'], 21)
+
+    def test_command_survives_loop_errors(self):
+        self.schedule(run_at=self.now - datetime.timedelta(minutes=1))
+        errors = io.StringIO()
+        failing = [OperationalError("server closed the connection unexpectedly")]
+
+        def run_due(scheduler, now=None):
+            if failing:
+                raise failing.pop()
+            raise KeyboardInterrupt
+
+        with mock.patch.object(Scheduler, 'run_due', autospec=True, side_effect=run_due), \
+                mock.patch.object(Scheduler, 'load', autospec=True, return_value=1) as load, \
+                mock.patch('core.management.commands.run_scheduler.time.sleep') as sleep:
+            call_command('run_scheduler', stdout=io.StringIO(), stderr=errors)
+
+        self.assertIn("server closed the connection", errors.getvalue())
+        sleep.assert_called_once_with(2)
+        # Depois do erro o heap é relido do banco
+        self.assertEqual(load.call_count, 2)
+
+
+class AsyncViewParityTests(DeviceAPITestCase):
+    """As rotas /api/async/ devem responder e gravar exatamente como as síncronas."""
+    COMMAND = {"power": True, "temperature": 19, "mode": "cool"}
+
+    def setUp(self):
+        super().setUp()
+        self.async_device = Device.objects.create(
+            user=self.user, device_id='esp-async', name='Sala', room='Sala', is_registered=True
+        )
+        self.token = str(AccessToken.for_user(self.user))
+        for target, new_callable in (
+            ('core.mqtt_async.send_command_to_esp32', mock.AsyncMock),
+            ('core.mqtt_async.send_wifi_config', mock.AsyncMock),
+            ('core.views.send_wifi_config', mock.Mock),
+        ):
+            patcher = mock.patch(target, new_callable=new_callable, return_value=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.async_publish = mqtt_async.send_command_to_esp32
+
+    def async_call(self, method, path, body, key=None, authenticated=True):
+        headers = {'Authorization': f'Bearer {self.token}'} if authenticated else {}
+        if key:
+            headers['Idempotency-Key'] = key
+        request = getattr(self.async_client, method)
+        return async_to_sync(request)(path, json.dumps(body), content_type='application/json', headers=headers)
+
+    def async_control(self, body, key=None):
+        return self.async_call('post', f'/api/async/devices/{self.async_device.pk}/control/', body, key)
+
+    def stored(self, device):
+        device.refresh_from_db()
+        return {
+            'state': (device.power, device.temperature, device.mode, device.desired, device.desired_version),
+            'commands': DeviceStateEvent.objects.filter(device=device, source='command').count(),
+            'queued': OutboundMessage.objects.filter(device=device).count(),
+        }
+
+    def assertSameOutcome(self, sync_response, async_response):
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.json(), sync_response.json())
+        self.assertEqual(self.stored(self.async_device), self.stored(self.device))
+
+    def test_control(self):
+        self.assertSameOutcome(self.control(self.COMMAND), self.async_control(self.COMMAND))
+        self.assertEqual(self.stored(self.device)['commands'], 1)
+        self.async_publish.assert_awaited_once_with('esp-async', self.publish.call_args.args[1])
+
+    def test_invalid_command(self):
+        body = {**self.COMMAND, "temperature": 40}
+        self.assertSameOutcome(self.control(body), self.async_control(body))
+
+    def test_broker_rejects(self):
+        self.publish.return_value = self.async_publish.return_value = False
+        self.assertSameOutcome(self.control(self.COMMAND), self.async_control(self.COMMAND))
+        self.assertFalse(self.device.power)
+
+        with self.settings(MQTT_QUEUE_WHEN_UNAVAILABLE=True):
+            self.assertSameOutcome(self.control(self.COMMAND), self.async_control(self.COMMAND))
+        self.assertEqual(self.stored(self.device)['queued'], 1)
+
+    def test_idempotency(self):
+        first = self.async_control(self.COMMAND, key='chave-async')
+        replay = self.async_control(self.COMMAND, key='chave-async')
+        conflict = self.async_control({**self.COMMAND, "temperature": 25}, key='chave-async')
+
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(conflict.status_code, 422)
+        self.assertEqual(self.async_publish.await_count, 1)
+
+    def test_create(self):
+        def body(device_id):
+            return {"device_id": device_id, "name": "Quarto", "room": "Quarto", "brand": "LG",
+                    "wifi_ssid": "casa", "wifi_password": "segredo"}
+
+        sync_response = self.client.post('/api/devices/', body('esp-novo-1'), format='json')
+        async_response = self.async_call('post', '/api/async/devices/', body('esp-novo-2'))
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        ignored = ('id', 'device_id')
+        self.assertEqual(
+            {k: v for k, v in async_response.json().items() if k not in ignored},
+            {k: v for k, v in sync_response.json().items() if k not in ignored},
+        )
+        self.assertTrue(Device.objects.get(device_id='esp-novo-2').is_configured)
+
+        duplicate_sync = self.client.post('/api/devices/', body('esp-novo-1'), format='json')
+        duplicate_async = self.async_call('post', '/api/async/devices/', body('esp-novo-1'))
+        self.assertEqual(duplicate_async.status_code, 400)
+        self.assertEqual(duplicate_async.json(), duplicate_sync.json())
+
+    def test_update_registers_orphan(self):
+        orphans = [Device.objects.create(device_id=f'esp-orfa-{i}', name='Placa', room='Sala') for i in range(2)]
+
+        sync_response = self.client.patch(f'/api/devices/{orphans[0].pk}/', {"name": "Escritório"}, format='json')
+        async_response = self.async_call('patch', f'/api/async/devices/{orphans[1].pk}/', {"name": "Escritório"})
+
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        ignored = ('id', 'device_id', 'created_at', 'updated_at')
+        self.assertEqual(
+            {k: v for k, v in async_response.json().items() if k not in ignored},
+            {k: v for k, v in sync_response.json().items() if k not in ignored},
+        )
+        for orphan in orphans:
+            orphan.refresh_from_db()
+            self.assertEqual((orphan.user_id, orphan.is_registered), (self.user.pk, True))
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        sync_response = self.control(self.COMMAND)
+        async_response = self.async_call(
+            'post', f'/api/async/devices/{self.async_device.pk}/control/', self.COMMAND, authenticated=False
+        )
+        self.assertEqual((sync_response.status_code, async_response.status_code), (401, 401))
+        self.async_publish.assert_not_awaited()
@@ -1,12 +1,21 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DeviceViewSet
+from .views import DeviceViewSet, ScheduleViewSet, HealthView, metrics_view
+from . import async_views
 
 router = DefaultRouter()
 
 # 👇 A CORREÇÃO É AQUI: Adicione o basename='device'
 router.register(r'devices', DeviceViewSet, basename='device')
+router.register(r'schedules', ScheduleViewSet, basename='schedule')
 
 urlpatterns = [
+    path('health/', HealthView.as_view(), name='health'),
+    path('metrics/', metrics_view, name='metrics'),
+
+    # Versões assíncronas das ações de escrita (servir via config/asgi.py)
+    path('async/devices/', async_views.device_create, name='async-device-create'),
+    path('async/devices/<int:pk>/', async_views.device_update, name='async-device-update'),
+    path('async/devices/<int:pk>/control/', async_views.device_control, name='async-device-control'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -0,0 +1,320 @@
+"""
+Agregados de uso (tempo ligado, modos e setpoint) por dispositivo, cômodo e dia.
+
+Cada transição de estado vira um DeviceStateEvent. Ao registrar um evento,
+o intervalo desde o evento anterior é somado aos agregados diários, de modo
+que a leitura custa O(dias) em vez de O(amostras).
+"""
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Device, DeviceStateEvent, DeviceDailyUsage, RoomDailyUsage
+
+TRACKED_FIELDS = ('is_online', 'power', 'temperature', 'mode')
+COUNTER_FIELDS = (
+    'on_seconds', 'cool_seconds', 'heat_seconds', 'fan_seconds',
+    'dry_seconds', 'auto_seconds', 'setpoint_seconds', 'command_count'
+)
+
+
+def snapshot(device):
+    """Retorna os campos de estado relevantes para os agregados."""
+    return {field: getattr(device, field) for field in TRACKED_FIELDS}
+
+
+# ============================================================
+#  CÁLCULO DOS INTERVALOS
+# ============================================================
+def split_by_day(start, end):
+    """Divide o intervalo [start, end) em fatias (dia, segundos) no fuso local."""
+    start = timezone.localtime(start)
+    end = timezone.localtime(end)
+    while start < end:
+        next_day = timezone.make_aware(
+            datetime.combine(start.date() + timedelta(days=1), dt_time.min),
+            start.tzinfo
+        )
+        slice_end = min(end, next_day)
+        seconds = int((slice_end - start).total_seconds())
+        if seconds > 0:
+            yield start.date(), seconds
+        start = slice_end
+
+
+def interval_deltas(state, start, end):
+    """Contadores por dia gerados por um estado mantido entre start e end."""
+    if not (state['is_online'] and state['power']) or end <= start:
+        return {}
+
+    mode_field = f"{state['mode']}_seconds"
+    deltas = {}
+    for day, seconds in split_by_day(start, end):
+        day_deltas = {
+            'on_seconds': seconds,
+            'setpoint_seconds': seconds * state['temperature'],
+        }
+        if mode_field in COUNTER_FIELDS:
+            day_deltas[mode_field] = seconds
+        deltas[day] = day_deltas
+    return deltas
+
+
+def _increment(model, lookup, deltas):
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    increments = {field: F(field) + value for field, value in deltas.items()}
+    # Caso comum (linha do dia já existe): um único UPDATE
+    if model.objects.filter(**lookup).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Outra transação criou a linha do dia entre o UPDATE e o INSERT
+        model.objects.filter(**lookup).update(**increments)
+
+
+def _apply(device, room, day, deltas):
+    _increment(DeviceDailyUsage, {'device_id': device.pk, 'day': day}, deltas)
+    if device.user_id:
+        _increment(RoomDailyUsage, {'user_id': device.user_id, 'room': room, 'day': day}, deltas)
+
+
+# ============================================================
+#  ATUALIZAÇÃO INCREMENTAL
+# ============================================================
+def lock_devices(pks):
+    """SELECT ... FOR UPDATE nas linhas dos aparelhos (em ordem de pk, sem deadlock entre lotes)."""
+    list(Device.objects.select_for_update().filter(pk__in=pks).order_by('pk').values_list('pk', flat=True))
+
+
+def record_transition(device, previous=None, source='report', at=None):
+    """
+    Registra uma transição de estado e atualiza os agregados.
+
+    `previous` é o snapshot() do dispositivo antes da alteração. Relatos
+    sem mudança de estado são ignorados; comandos sempre geram evento para
+    que a contagem de comandos possa ser reconstruída a partir do histórico.
+    """
+    is_command = source == 'command'
+    current = snapshot(device)
+    if previous == current and not is_command:
+        return None
+
+    with transaction.atomic():
+        # Trava a linha do aparelho: ouvinte e comando simultâneos não leem o
+        # mesmo último evento (o intervalo seria somado duas vezes)
+        lock_devices([device.pk])
+        at = at or timezone.now()
+        last_event = (
+            DeviceStateEvent.objects
+            .filter(device=device, recorded_at__lte=at)
+            .order_by('-recorded_at')
+            .first()
+        )
+        # Junta intervalo e contagem de comandos do mesmo (cômodo, dia) numa só atualização
+        pending = defaultdict(dict)
+        if last_event:
+            last_state = snapshot(last_event)
+            for day, deltas in interval_deltas(last_state, last_event.recorded_at, at).items():
+                pending[(last_event.room, day)].update(deltas)
+
+        if is_command:
+            pending[(device.room, timezone.localdate(at))]['command_count'] = 1
+
+        for (room, day), deltas in pending.items():
+            _apply(device, room, day, deltas)
+
+        event = DeviceStateEvent.objects.create(
+            device=device,
+            recorded_at=at,
+            source=source,
+            room=device.room,
+            **current
+        )
+    return event
+
+
+def record_transitions(changes, source='report', at=None):
+    """
+    Versão em lote de record_transition, para rajadas de mensagens.
+
+    `changes` é uma lista de (device, previous); previous=None indica
+    dispositivo novo. Usa uma consulta para os últimos eventos, um UPDATE
+    por linha diária afetada e um bulk_create dos eventos.
+    """
+    at = at or timezone.now()
+    changed = []
+    for device, previous in changes:
+        current = snapshot(device)
+        if previous != current or source == 'command':
+            changed.append((device, current))
+    if not changed:
+        return []
+
+    device_totals = defaultdict(lambda: defaultdict(int))
+    room_totals = defaultdict(lambda: defaultdict(int))
+
+    with transaction.atomic():
+        lock_devices([device.pk for device, _ in changed])
+        latest = DeviceStateEvent.objects.filter(
+            device=OuterRef('pk'), recorded_at__lte=at
+        ).order_by('-recorded_at').values('pk')[:1]
+        last_ids = (
+            Device.objects.filter(pk__in=[device.pk for device, _ in changed])
+            .annotate(last_event=Subquery(latest))
+            .exclude(last_event__isnull=True)
+            .values_list('last_event', flat=True)
+        )
+        last_events = {
+            event.device_id: event
+            for event in DeviceStateEvent.objects.filter(pk__in=list(last_ids))
+        }
+
+        for device, _ in changed:
+            last_event = last_events.get(device.pk)
+            if not last_event:
+                continue
+            for day, deltas in interval_deltas(snapshot(last_event), last_event.recorded_at, at).items():
+                for field, value in deltas.items():
+                    device_totals[(device.pk, day)][field] += value
+                    if device.user_id:
+                        room_totals[(device.user_id, last_event.room, day)][field] += value
+
+        for (device_id, day), deltas in device_totals.items():
+            _increment(DeviceDailyUsage, {'device_id': device_id, 'day': day}, deltas)
+        for (user_id, room, day), deltas in room_totals.items():
+            _increment(RoomDailyUsage, {'user_id': user_id, 'room': room, 'day': day}, deltas)
+
+        return DeviceStateEvent.objects.bulk_create(
+            [DeviceStateEvent(device=device, recorded_at=at, source=source, room=device.room, **current)
+             for device, current in changed],
+            batch_size=2000
+        )
+
+
+# ============================================================
+#  RECONSTRUÇÃO (BACKFILL)
+# ============================================================
+def seed_missing_events():
+    """Cria um evento inicial para dispositivos que ainda não têm histórico."""
+    now = timezone.now()
+    devices = Device.objects.filter(state_events__isnull=True).only('id', 'room', *TRACKED_FIELDS)
+    events = [
+        DeviceStateEvent(device=device, recorded_at=now, source='report', room=device.room, **snapshot(device))
+        for device in devices.iterator(chunk_size=2000)
+    ]
+    DeviceStateEvent.objects.bulk_create(events, batch_size=2000)
+    return len(events)
+
+
+def rebuild(start=None, end=None, device_ids=None):
+    """
+    Recalcula os agregados a partir do histórico de eventos.
+
+    `start` e `end` são datas (inclusivas); sem elas todo o histórico é
+    reprocessado. Com `device_ids` apenas os agregados por dispositivo são
+    refeitos, já que os de cômodo somam vários aparelhos. Retorna o número
+    de linhas diárias gravadas.
+    """
+    now = timezone.now()
+    start_dt = timezone.make_aware(datetime.combine(start, dt_time.min)) if start else None
+    end_dt = timezone.make_aware(datetime.combine(end + timedelta(days=1), dt_time.min)) if end else now
+    end_dt = min(end_dt, now)
+
+    devices = Device.objects.all()
+    if device_ids:
+        devices = devices.filter(pk__in=device_ids)
+    owners = dict(devices.values_list('pk', 'user_id'))
+
+    events = DeviceStateEvent.objects.filter(device_id__in=owners.keys(), recorded_at__lt=end_dt)
+    if start_dt:
+        events = events.filter(recorded_at__gte=start_dt)
+    events = events.order_by('device_id', 'recorded_at').values(
+        'device_id', 'recorded_at', 'source', 'room', *TRACKED_FIELDS
+    )
+
+    # Estado vigente no início da janela (último evento antes de start)
+    carried = {}
+    if start_dt:
+        previous = DeviceStateEvent.objects.filter(
+            device=OuterRef('pk'), recorded_at__lt=start_dt
+        ).order_by('-recorded_at').values('pk')[:1]
+        prior_ids = (
+            devices.annotate(prior_event=Subquery(previous))
+            .exclude(prior_event__isnull=True)
+            .values_list('prior_event', flat=True)
+        )
+        for event in DeviceStateEvent.objects.filter(pk__in=list(prior_ids)).values(
+            'device_id', 'room', *TRACKED_FIELDS
+        ):
+            event['recorded_at'] = start_dt
+            carried[event['device_id']] = event
+
+    device_totals = defaultdict(lambda: defaultdict(int))
+    room_totals = defaultdict(lambda: defaultdict(int))
+
+    def accumulate(event, until):
+        user_id = owners.get(event['device_id'])
+        for day, deltas in interval_deltas(event, event['recorded_at'], until).items():
+            for field, value in deltas.items():
+                device_totals[(event['device_id'], day)][field] += value
+                if user_id:
+                    room_totals[(user_id, event['room'], day)][field] += value
+
+    last = {}
+    for event in events.iterator(chunk_size=5000):
+        device_id = event['device_id']
+        previous_event = last.get(device_id) or carried.pop(device_id, None)
+        if previous_event:
+            accumulate(previous_event, event['recorded_at'])
+        if event['source'] == 'command':
+            day = timezone.localdate(event['recorded_at'])
+            device_totals[(device_id, day)]['command_count'] += 1
+            if owners.get(device_id):
+                room_totals[(owners[device_id], event['room'], day)]['command_count'] += 1
+        last[device_id] = event
+
+    # O intervalo aberto (sem evento posterior) só é somado pela próxima
+    # transição incremental; aqui fechamos apenas os que já terminaram.
+    closed = set(
+        DeviceStateEvent.objects
+        .filter(device_id__in=owners.keys(), recorded_at__gte=end_dt)
+        .values_list('device_id', flat=True)
+        .distinct()
+    )
+    for event in list(last.values()) + list(carried.values()):
+        if event['device_id'] in closed:
+            accumulate(event, end_dt)
+
+    with transaction.atomic():
+        device_rows = DeviceDailyUsage.objects.filter(device_id__in=owners.keys())
+        room_rows = RoomDailyUsage.objects.all()
+        if start:
+            device_rows = device_rows.filter(day__gte=start)
+            room_rows = room_rows.filter(day__gte=start)
+        if end:
+            device_rows = device_rows.filter(day__lte=end)
+            room_rows = room_rows.filter(day__lte=end)
+        device_rows.delete()
+        if not device_ids:
+            room_rows.delete()
+
+        DeviceDailyUsage.objects.bulk_create(
+            [DeviceDailyUsage(device_id=device_id, day=day, **totals)
+             for (device_id, day), totals in device_totals.items()],
+            batch_size=2000
+        )
+        if not device_ids:
+            RoomDailyUsage.objects.bulk_create(
+                [RoomDailyUsage(user_id=user_id, room=room, day=day, **totals)
+                 for (user_id, room, day), totals in room_totals.items()],
+                batch_size=2000
+            )
+
+    return len(device_totals) + (0 if device_ids else len(room_totals))
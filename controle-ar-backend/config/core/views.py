@@ -1,16 +1,51 @@
-from rest_framework import viewsets, status
+from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.views import APIView
+from rest_framework.throttling import UserRateThrottle
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 from django.utils import timezone
+from django.db import IntegrityError, transaction, connection, connections
 from django.db.models import Q  # Importante para a lógica de filtro
-from .models import Device
-from .serializers import DeviceSerializer, CommandSerializer, DeviceCreateSerializer
-from .mqtt_helper import send_command_to_esp32, send_wifi_config
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, timedelta
+from .models import Device, DeviceDailyUsage, RoomDailyUsage, DeviceStateEvent, Schedule
+from .serializers import (
+    DeviceSerializer, CommandSerializer, DeviceCreateSerializer,
+    DeviceDailyUsageSerializer, RoomDailyUsageSerializer, ScheduleSerializer
+)
+from .mqtt_helper import send_command_to_esp32, send_wifi_config, broker_available, broker_breaker
+from .outbox import queue_command, pending_count
+from . import metrics
+from . import usage
+from . import shadow
+from . import presence
+from . import provisioning
+from . import analytics
+from .summary import get_summary
+from .idempotency import idempotent
+from .db_router import ReplicaReadMixin, REPLICA_ALIAS, replica_configured
+from .exports import stream_queryset, DEVICE_EXPORT_FIELDS, HISTORY_EXPORT_FIELDS, CONTENT_TYPES
 import time
 
-class DeviceViewSet(viewsets.ModelViewSet):
+# Janela máxima aceita pelos endpoints de agregados de uso
+MAX_USAGE_DAYS = 366
+
+
+class AnalyticsThrottle(UserRateThrottle):
+    """Limite por usuário do /devices/analytics/ (DEFAULT_THROTTLE_RATES['analytics'])."""
+    scope = 'analytics'
+
+
+class DeviceViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    # Leituras que podem vir da réplica (core/db_router.py)
+    replica_actions = (
+        'list', 'retrieve', 'unregistered', 'offline', 'flapping', 'usage', 'rooms_usage',
+        'export', 'history_export', 'summary', 'analytics',
+    )
 
     def get_queryset(self):
         """
@@ -25,9 +60,18 @@ class DeviceViewSet(viewsets.ModelViewSet):
             return DeviceCreateSerializer
         return DeviceSerializer
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         # Ao criar manualmente, já vincula ao usuário logado
-        device = serializer.save(user=self.request.user, is_registered=True)
+        try:
+            with transaction.atomic():
+                device = serializer.save(user=self.request.user, is_registered=True)
+        except IntegrityError:
+            # Duas requisições simultâneas com o mesmo device_id passaram pela validação
+            raise serializers.ValidationError({"device_id": ["Já existe um dispositivo com este ID"]})
         self._send_wifi_setup(device)
 
     def perform_update(self, serializer):
@@ -52,13 +96,43 @@ class DeviceViewSet(viewsets.ModelViewSet):
             }
             success = send_wifi_config(device.device_id, config_payload)
             device.is_configured = success
-            device.save()
+            device.save(update_fields=['is_configured', 'updated_at'])
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def provision(self, request):
+        """
+        Cadastro em lote: JSON ([...] ou {"devices": [...]}) ou arquivo CSV/JSON
+        no campo "file". Responde um resultado por linha (core/provisioning.py).
+        """
+        upload = request.FILES.get('file')
+        try:
+            if upload:
+                rows = provisioning.read_rows(upload.read().decode('utf-8-sig'), provisioning.file_format(upload.name))
+            else:
+                rows = provisioning.load_rows(request.data)
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not rows:
+            return Response({"error": "Nenhum aparelho enviado."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > provisioning.MAX_ROWS:
+            return Response(
+                {"error": f"Máximo de {provisioning.MAX_ROWS} aparelhos por envio."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results, created = provisioning.provision(request.user, rows)
+        return Response(
+            {"created": created, "failed": len(results) - created, "results": results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+        )
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def control(self, request, pk=None):
         # Apenas dispositivos do próprio usuário podem ser controlados
         device = self.get_object()
-        if device.user != request.user:
+        # Compara os ids: device.user buscaria o usuário no banco de novo
+        if device.user_id != request.user.id:
             return Response({"error": "Não autorizado"}, status=status.HTTP_403_FORBIDDEN)
 
         data = request.data.copy()
@@ -67,27 +141,47 @@ class DeviceViewSet(viewsets.ModelViewSet):
         
         serializer = CommandSerializer(data=data)
         if serializer.is_valid():
-            data = serializer.validated_data
-            device.power = data.get('power', device.power)
-            device.temperature = data.get('temperature', device.temperature)
-            device.mode = data.get('mode', device.mode)
-            device.last_command = timezone.now()
-            device.save()
+            queue_when_unavailable = getattr(settings, 'MQTT_QUEUE_WHEN_UNAVAILABLE', False)
+            if not broker_available() and not queue_when_unavailable:
+                # Circuito aberto: falha na hora, sem gravar nem esperar o broker
+                return self._broker_unavailable()
 
+            data = serializer.validated_data
             payload = {
-                "power": device.power,
-                "temp": device.temperature,
-                "mode": device.mode,
+                "power": data.get('power', device.power),
+                "temp": data.get('temperature', device.temperature),
+                "mode": data.get('mode', device.mode),
                 "brand": device.brand
             }
 
+            # Publica antes de gravar: comando recusado pelo broker não altera o aparelho
             success = send_command_to_esp32(device.device_id, payload)
+            if not success and not queue_when_unavailable:
+                return self._broker_unavailable()
+
+            previous_state = usage.snapshot(device)
+            device.power, device.temperature, device.mode = payload['power'], payload['temp'], payload['mode']
+            device.last_command = timezone.now()
+            shadow.set_desired(device, device.last_command)
+            device.save(update_fields=[
+                'power', 'temperature', 'mode', 'last_command', 'updated_at', *shadow.DESIRED_UPDATE_FIELDS
+            ])
+            usage.record_transition(device, previous_state, source='command')
+
             if success:
                 return Response({"status": "Comando enviado", "current_state": payload}, status=status.HTTP_200_OK)
-            return Response({"error": "Erro no Broker MQTT"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            queue_command(device, payload)
+            return Response({"status": "Comando enfileirado", "current_state": payload}, status=status.HTTP_202_ACCEPTED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def _broker_unavailable(self):
+        response = Response({"error": "Erro no Broker MQTT"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        retry_after = broker_breaker.retry_after()
+        if retry_after:
+            response['Retry-After'] = str(retry_after)
+        return response
+
     @action(detail=False, methods=['get'])
     def unregistered(self, request):
         """Lista dispositivos na rede que ninguém 'reivindicou' ainda"""
@@ -102,4 +196,195 @@ class DeviceViewSet(viewsets.ModelViewSet):
     def offline(self, request):
         offline_devices = Device.objects.filter(user=request.user, is_online=False)
         serializer = self.get_serializer(offline_devices, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def flapping(self, request):
+        """Aparelhos instáveis agora ou que oscilaram nos últimos dias (Wi-Fi fraco)."""
+        devices = presence.flapping_devices(Device.objects.filter(user=request.user))
+        serializer = self.get_serializer(devices, many=True)
+        return Response(serializer.data)
+
+    def _usage_range(self, request):
+        """Lê ?start=&end= (YYYY-MM-DD); padrão: últimos 7 dias."""
+        params = request.query_params
+        try:
+            end = parse_date(params['end']) if params.get('end') else timezone.localdate()
+            start = parse_date(params['start']) if params.get('start') else end and end - timedelta(days=6)
+        except ValueError:
+            start = end = None
+        if not start or not end or start > end:
+            return None, None, Response({"error": "Intervalo de datas inválido (use YYYY-MM-DD)"}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start).days >= MAX_USAGE_DAYS:
+            return None, None, Response({"error": f"Intervalo máximo de {MAX_USAGE_DAYS} dias"}, status=status.HTTP_400_BAD_REQUEST)
+        return start, end, None
+
+    @action(detail=True, methods=['get'])
+    def usage(self, request, pk=None):
+        """Agregados diários de uso do dispositivo (tempo ligado, modos, setpoint)."""
+        device = self.get_object()
+        start, end, error = self._usage_range(request)
+        if error:
+            return error
+        rows = DeviceDailyUsage.objects.filter(device=device, day__range=(start, end))
+        return Response({
+            "device": device.id,
+            "start": start,
+            "end": end,
+            "days": DeviceDailyUsageSerializer(rows, many=True).data
+        })
+
+    @action(detail=False, methods=['get'], url_path='usage/rooms')
+    def rooms_usage(self, request):
+        """Agregados diários de uso por cômodo do usuário logado."""
+        start, end, error = self._usage_range(request)
+        if error:
+            return error
+        rows = RoomDailyUsage.objects.filter(user=request.user, day__range=(start, end))
+        if request.query_params.get('room'):
+            rows = rows.filter(room=request.query_params['room'])
+        return Response({
+            "start": start,
+            "end": end,
+            "rooms": RoomDailyUsageSerializer(rows, many=True).data
+        })
+
+
+    def _export_params(self, request):
+        """Lê ?output=csv|ndjson&start=&end= (data ou data/hora ISO)."""
+        output = request.query_params.get('output', 'csv')
+        if output not in CONTENT_TYPES:
+            return None, None, None, Response({"error": "Formato inválido (use csv ou ndjson)"}, status=status.HTTP_400_BAD_REQUEST)
+
+        bounds = []
+        for name, day_offset in (('start', 0), ('end', 1)):
+            raw = request.query_params.get(name)
+            value = None
+            if raw:
+                try:
+                    value = parse_datetime(raw)
+                    if value is None and parse_date(raw):
+                        # Datas puras: o fim é inclusivo (até a meia-noite seguinte)
+                        value = datetime.combine(parse_date(raw) + timedelta(days=day_offset), datetime.min.time())
+                except ValueError:
+                    value = None
+                if value is None:
+                    return None, None, None, Response({"error": f"Parâmetro '{name}' inválido"}, status=status.HTTP_400_BAD_REQUEST)
+                if timezone.is_naive(value):
+                    value = timezone.make_aware(value)
+            bounds.append(value)
+        return output, bounds[0], bounds[1], None
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Exporta os aparelhos do usuário em streaming (filtro por updated_at)."""
+        output, start, end, error = self._export_params(request)
+        if error:
+            return error
+        devices = Device.objects.filter(user=request.user).order_by('pk')
+        if start:
+            devices = devices.filter(updated_at__gte=start)
+        if end:
+            devices = devices.filter(updated_at__lt=end)
+        return stream_queryset(devices, DEVICE_EXPORT_FIELDS, output, 'devices')
+
+    @action(detail=False, methods=['get'], url_path='history/export')
+    def history_export(self, request):
+        """Exporta o histórico de estados dos aparelhos do usuário em streaming."""
+        output, start, end, error = self._export_params(request)
+        if error:
+            return error
+        events = DeviceStateEvent.objects.filter(device__user=request.user).order_by('recorded_at', 'pk')
+        if start:
+            events = events.filter(recorded_at__gte=start)
+        if end:
+            events = events.filter(recorded_at__lt=end)
+        if request.query_params.get('device'):
+            events = events.filter(device__device_id=request.query_params['device'])
+        return stream_queryset(events, HISTORY_EXPORT_FIELDS, output, 'history')
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Contagens da frota do usuário (status, modo, marca e cômodo)."""
+        return Response(get_summary(request.user.id))
+
+    @action(detail=False, methods=['get'], throttle_classes=[AnalyticsThrottle])
+    def analytics(self, request):
+        """
+        Estimativas sobre o histórico de estados: horas ligado e kWh por
+        aparelho e cômodo, aparelhos com ?hours= h/dia em setpoint <= ?setpoint=
+        e outliers de consumo, nos últimos ?days= dias (em cache). Cada
+        relatório novo varre o histórico, então o endpoint tem limite por usuário.
+        """
+        if not analytics.available():
+            return Response({"error": "Análises indisponíveis (instale o numpy)"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        try:
+            days = int(request.query_params.get('days', 30))
+            setpoint = int(request.query_params.get('setpoint', 16))
+            hours = float(request.query_params.get('hours', 8))
+        except ValueError:
+            return Response({"error": "days, setpoint e hours devem ser números"}, status=status.HTTP_400_BAD_REQUEST)
+        # Valores fechados: parâmetros arbitrários criariam chaves de cache novas a cada chamada
+        if days not in analytics.WINDOW_DAYS or not 16 <= setpoint <= 30 or not 0.5 <= hours <= 24 \
+                or hours * 2 != int(hours * 2):
+            windows = ", ".join(str(window) for window in analytics.WINDOW_DAYS)
+            return Response(
+                {"error": f"Use days em {windows}, setpoint entre 16 e 30 e hours entre 0.5 e 24, em meias horas"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(analytics.user_report(request.user.id, days, setpoint, hours))
+
+
+class ScheduleViewSet(viewsets.ModelViewSet):
+    """Agendamentos de comandos do usuário (executados pelo run_scheduler)."""
+    permission_classes = [IsAuthenticated]
+    serializer_class = ScheduleSerializer
+
+    def get_queryset(self):
+        return Schedule.objects.filter(user=self.request.user).select_related('device')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class HealthView(APIView):
+    """
+    Saúde da API: banco de dados, circuito do broker e fila de saída.
+    Rota pública: os detalhes das falhas (hosts, mensagens do driver) vão só para o log.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def _check_database(self, alias):
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return "ok"
+        except Exception as e:
+            print(f"❌ Health check: banco '{alias}' indisponível: {e}")
+            return "erro"
+
+    def get(self, request):
+        database = self._check_database(connection.alias)
+        replica = self._check_database(REPLICA_ALIAS) if replica_configured() else None
+
+        breaker = broker_breaker.snapshot()
+        # A mensagem do último erro do broker pode trazer host e porta
+        breaker.pop("last_error")
+        healthy = database == "ok"
+        data = {
+            "status": ("ok" if breaker["state"] == "closed" else "degraded") if healthy else "error",
+            "database": database,
+            "database_replica": replica,
+            "mqtt_breaker": breaker,
+            "outbox_pending": pending_count() if healthy else None,
+        }
+        return Response(data, status=status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+def metrics_view(request):
+    """Métricas no formato texto do Prometheus (protegidas por METRICS_TOKEN, se definido)."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and request.headers.get('X-Metrics-Token') != token:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -63,7 +63,7 @@ const SignUpForm = ({ buttonClasses, buttonForGFT }) => {
     setLoading(true);
 
     try {
-      await authService.verifyEmail(otp);
+      await authService.verifyEmail(email, otp);
       
       // Se a verificação der certo:
       setSucesso("E-mail verificado com sucesso! Redirecionando para o login...");
@@ -54,9 +54,9 @@ export const authService = {
   },
 
   // 👇 NOVA FUNÇÃO PARA VERIFICAR O CÓDIGO (OTP) 👇
-  verifyEmail: async (otp) => {
-    // Envia o código para o backend
-    const res = await api.post("auth/verify-email/", { otp });
+  verifyEmail: async (email, otp) => {
+    // Envia o código para o backend (o código vale só para este e-mail)
+    const res = await api.post("auth/verify-email/", { email, otp });
     return res.data;
   },
 